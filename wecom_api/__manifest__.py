@@ -22,6 +22,7 @@ WeCom Service-side API and Client-side API
         "data/ir_config_parameter.xml",
         "data/wecom_server_api_error_data.xml",
         "data/service_api_list_data.xml",
+        "data/ir_cron_data.xml",
         "views/assets_templates.xml",
     ],
     "assets": {
@@ -1,17 +1,65 @@
 # -*- coding: utf-8 -*-
 
 import json
+import time
 import requests
-from odoo import api, fields, models, _, SUPERUSER_ID
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from odoo import api, fields, models, tools, _, SUPERUSER_ID
 from odoo.exceptions import UserError
 import warnings
-
-
-class ApiException(Exception):
-    def __init__(self, errCode, errMsg):
-        super().__init__(errCode, errMsg)
-        self.errCode = errCode
-        self.errMsg = errMsg
+from .wecom_transport import (
+    WecomHttpTransport,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+)
+from .wecom_rate_limiter import (
+    WecomRateLimiter,
+    WecomThrottledError,
+    RATE_LIMITED_CODES,
+    THROTTLED_CODE,
+    DEFAULT_CORP_RATE,
+    DEFAULT_API_RATE,
+    DEFAULT_MAX_WAIT,
+)
+from .wecom_retry import (
+    WecomRetryPolicy,
+    WecomTransientError,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_BASE_DELAY,
+    DEFAULT_MAX_DELAY,
+    DEFAULT_DEADLINE,
+)
+from .wecom_trace import WecomTracer, DEFAULT_SAMPLE_RATE, DEFAULT_BUFFER_SIZE
+from .wecom_metrics import WecomMetrics, DEFAULT_FLUSH_INTERVAL
+from .wecom_response_cache import (
+    WecomResponseCache,
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_GENERATION_TTL,
+)
+from .wecom_cassette import WecomCassetteRecorder
+from .wecom_upload import WecomUploadError
+from . import wecom_json
+from .wecom_common import WECOM_API_BASE_URL, make_url, ApiException
+from .wecom_circuit_breaker import (
+    WecomCircuitBreaker,
+    CIRCUIT_OPEN_CODE,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_COOLDOWN,
+    DEFAULT_HALF_OPEN_PROBES,
+)
+
+@lru_cache(maxsize=8)
+def _parse_json_param(value):
+    """
+    解析 JSON 格式的参数，例如 "wecom.rate_limit_overrides"、"wecom.retry_overrides"
+    """
+    try:
+        return json.loads(value or "{}")
+    except ValueError:
+        return {}
 
 
 class WecomAbstractApi(models.AbstractModel):
@@ -21,12 +69,173 @@ class WecomAbstractApi(models.AbstractModel):
     code = fields.Integer("API error code", copy=False)
     message = fields.Char("API error message", copy=False)
 
+    @tools.ormcache()
+    def _get_trace_settings(self):
+        """
+        调试跟踪参数，缓存在进程内存中
+        ir.config_parameter 变更时会清空注册表缓存，其他工作进程通过注册表信号同步失效
+        :returns (是否启用, 采样比例, 缓冲区大小)
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        return (
+            ir_config.get_param("wecom.debug_enabled") == "True",
+            float(ir_config.get_param("wecom.trace_sample_rate", DEFAULT_SAMPLE_RATE)),
+            int(ir_config.get_param("wecom.trace_buffer_size", DEFAULT_BUFFER_SIZE)),
+        )
+
     def get_api_debug(self):
         """
         获取 API 调试模式
         """
+        return self._get_trace_settings()[0]
+
+    def get_trace_records(self):
+        """
+        获取当前工作进程的跟踪记录，令牌和密钥已隐藏
+        """
+        return WecomTracer.dump()
+
+    def get_http_options(self):
+        """
+        获取 HTTP 连接池参数
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        return {
+            "pool_connections": int(
+                ir_config.get_param("wecom.http_pool_connections", DEFAULT_POOL_CONNECTIONS)
+            ),
+            "pool_maxsize": int(
+                ir_config.get_param("wecom.http_pool_maxsize", DEFAULT_POOL_MAXSIZE)
+            ),
+            "connect_timeout": float(
+                ir_config.get_param("wecom.http_connect_timeout", DEFAULT_CONNECT_TIMEOUT)
+            ),
+            "read_timeout": float(
+                ir_config.get_param("wecom.http_read_timeout", DEFAULT_READ_TIMEOUT)
+            ),
+            "keep_alive": ir_config.get_param("wecom.http_keep_alive", "True") == "True",
+        }
+
+    def get_request_options(self, urlType):
+        """
+        获取请求参数：HTTP 连接池参数和限流参数
+        :param urlType : get_server_api_call 返回的API类型，第四项为函数名称
+        """
+        options = self.get_http_options()
         ir_config = self.env["ir.config_parameter"].sudo()
-        return True if ir_config.get_param("wecom.debug_enabled") == "True" else False
+        corpid = self.get_corpid() or ""
+        function_name = urlType[3] if len(urlType) > 3 else urlType[0]
+        overrides = _parse_json_param(
+            ir_config.get_param("wecom.rate_limit_overrides", "{}")
+        )
+        corp_rate = overrides.get(
+            corpid, ir_config.get_param("wecom.rate_limit_corp_rps", DEFAULT_CORP_RATE)
+        )
+        api_rate = overrides.get(
+            "%s:%s" % (corpid, function_name),
+            overrides.get(
+                function_name,
+                ir_config.get_param("wecom.rate_limit_api_rps", DEFAULT_API_RATE),
+            ),
+        )
+        options.update(
+            {
+                "corpid": corpid,
+                "function_name": function_name,
+                "rate_limit": (
+                    float(corp_rate),
+                    float(api_rate),
+                    float(ir_config.get_param("wecom.rate_limit_max_wait", DEFAULT_MAX_WAIT)),
+                ),
+                "retry": self.get_retry_policy(function_name),
+                "trace": self._get_trace_settings(),
+                "circuit": (
+                    int(
+                        ir_config.get_param(
+                            "wecom.circuit_failure_threshold", DEFAULT_FAILURE_THRESHOLD
+                        )
+                    ),
+                    float(ir_config.get_param("wecom.circuit_cooldown", DEFAULT_COOLDOWN)),
+                    int(
+                        ir_config.get_param(
+                            "wecom.circuit_half_open_probes", DEFAULT_HALF_OPEN_PROBES
+                        )
+                    ),
+                ),
+            }
+        )
+        return options
+
+    def get_retry_policy(self, function_name):
+        """
+        获取接口的重试策略
+        参数 "wecom.retry_overrides" 为 JSON，键为函数名称，值为
+        {"max_retries": 3, "base_delay": 0.5, "max_delay": 8, "deadline": 30}，缺省项使用全局参数
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        override = _parse_json_param(
+            ir_config.get_param("wecom.retry_overrides", "{}")
+        ).get(function_name, {})
+        return WecomRetryPolicy(
+            max_retries=override.get(
+                "max_retries",
+                ir_config.get_param("wecom.retry_max_retries", DEFAULT_MAX_RETRIES),
+            ),
+            base_delay=override.get(
+                "base_delay",
+                ir_config.get_param("wecom.retry_base_delay", DEFAULT_BASE_DELAY),
+            ),
+            max_delay=override.get(
+                "max_delay",
+                ir_config.get_param("wecom.retry_max_delay", DEFAULT_MAX_DELAY),
+            ),
+            deadline=override.get(
+                "deadline",
+                ir_config.get_param("wecom.retry_deadline", DEFAULT_DEADLINE),
+            ),
+        )
+
+    def get_corpid(self):
+        """
+        获取限流使用的企业ID
+        """
+        return False
+
+    def get_secret(self):
+        """
+        获取响应缓存使用的应用密钥，不同应用的可见范围不同
+        """
+        return False
+
+    def get_response_cache_state(self):
+        """
+        获取当前工作进程的响应缓存状态，用于监控
+        """
+        return WecomResponseCache.snapshot()
+
+    def invalidate_response_cache(self, function_name=None, **args):
+        """
+        使当前企业在所有工作进程中的响应缓存失效
+        :param function_name: 函数名称，为空时失效全部接口
+        :param args: 只失效请求参数包含这些键值的记录
+        """
+        return (
+            self.env["wecom.api.cache.generation"]
+            .sudo()
+            .invalidate(self.get_corpid(), function_name, **args)
+        )
+
+    def get_rate_limiter_state(self):
+        """
+        获取当前工作进程的限流器状态，用于监控
+        """
+        return WecomRateLimiter.snapshot()
+
+    def get_circuit_breaker_state(self, only_open=False):
+        """
+        获取当前工作进程的熔断器状态，用于监控
+        """
+        return WecomCircuitBreaker.snapshot(only_open=only_open)
 
     def getAccessToken(self):
         raise NotImplementedError
@@ -53,52 +262,367 @@ class WecomAbstractApi(models.AbstractModel):
         :param args : 请求参数
         :param include_agentid : 标识args含有 "agentid" 关键字，需要进行处理
         :returns 返回结果
+        上下文 wecom_bypass_response_cache 为真时不读取也不写入响应缓存，通讯录同步需要最新数据
         """
         shortUrl = urlType[0]
         method = urlType[1]
+        cache_ttl = urlType[4] if len(urlType) > 4 and "GET" == method else 0
+        if self.env.context.get("wecom_bypass_response_cache"):
+            cache_ttl = 0
+        if cache_ttl:
+            cache_key = WecomResponseCache.make_key(
+                self.get_corpid(), self.get_secret(), urlType[3], args
+            )
+            # 发送请求前读取失效代数，请求期间其他工作进程的失效会使这次写入的缓存失效；
+            # 查询结果在当前进程中复用 wecom.response_cache_generation_ttl 秒，命中缓存时通常不查询数据库
+            generation = (
+                self.env["wecom.api.cache.generation"]
+                .sudo()
+                .get_generation(
+                    self.get_corpid(),
+                    urlType[3],
+                    args,
+                    float(
+                        self.env["ir.config_parameter"]
+                        .sudo()
+                        .get_param("wecom.response_cache_generation_ttl", DEFAULT_GENERATION_TTL)
+                    ),
+                )
+            )
+            response = WecomResponseCache.get(cache_key, generation)
+            if response is not None:
+                WecomMetrics.record_cache_hit(urlType[3])
+                return response
+
+        options = self.get_request_options(urlType)
         response = {}
         for retryCnt in range(0, 3):
             try:
                 if "POST" == method:
-                    url = self.__makeUrl(shortUrl)
+                    url = self.__makeUrl(urlType)
                     if "agentid" in args and include_agentid: # type: ignore
                         url = self.__appendArgs(url, {"agentid": args["agentid"]})  # type: ignore
                         del args["agentid"] # type: ignore
-                    response = self.__httpPost(url, args)
+                    response = self.__httpPost(url, args, options)
                 elif "GET" == method:
-                    url = self.__makeUrl(shortUrl)
+                    url = self.__makeUrl(urlType)
                     url = self.__appendArgs(url, args)
-                    response = self.__httpGet(url)
+                    response = self.__httpGet(url, options)
                 else:
                     raise ApiException(-1, _("unknown method type"))
+            except ApiException:
+                raise
             except Exception as e:
                 raise ApiException(-2, e)  # 其他错误
 
             # 检查令牌是否过期
             if self.__tokenExpired(response.get("errcode")):
-                self.__refreshToken(shortUrl)
-                retryCnt += 1
+                self.__refreshToken(shortUrl, options.get("function_name"))
                 continue
             else:
                 break
+        self.__flushMetrics()
         # 检测响应
-        return self.__checkResponse(response)
+        response = self.__checkResponse(response)
+        if cache_ttl:
+            WecomResponseCache.set(
+                cache_key,  # type: ignore
+                response,
+                cache_ttl,
+                int(
+                    self.env["ir.config_parameter"]
+                    .sudo()
+                    .get_param("wecom.response_cache_size", DEFAULT_MAX_ENTRIES)
+                ),
+                generation,  # type: ignore
+            )
+        return response
+
+    def httpCallMany(self, urlType, argsList, include_agentid=False, max_concurrency=None):
+        """
+        并发调用同一个API
+        请求在有界线程池中发送，工作线程只做网络请求，令牌的获取和刷新都在调用线程中完成，
+        调用方对结果的ORM写入也应在调用线程中进行。不使用响应缓存，批量下载总是读取最新数据。
+        :param urlType : 服务端API类型和请求方式（"GET" or "POST"）
+        :param argsList : 请求参数列表
+        :param include_agentid : 标识args含有 "agentid" 关键字，需要进行处理
+        :param max_concurrency : 最大并发数，默认读取参数 "wecom.http_max_concurrency"
+        :returns 与 argsList 顺序一致的结果列表，失败的请求对应的是 ApiException 对象
+        """
+        if not argsList:
+            return []
+        if not max_concurrency:
+            max_concurrency = int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("wecom.http_max_concurrency", 8)
+            )
+        shortUrl = urlType[0]
+        options = self.get_request_options(urlType)
+        responses = [None] * len(argsList)
+        pending = list(range(len(argsList)))
+        for retryCnt in range(0, 3):
+            requests_list = []
+            for index in pending:
+                try:
+                    requests_list.append(
+                        self.__prepareRequest(urlType, argsList[index], include_agentid)
+                    )
+                except Exception as e:
+                    requests_list.append(ApiException(-2, e))
+
+            with ThreadPoolExecutor(
+                max_workers=min(max_concurrency, len(pending))
+            ) as executor:
+                results = list(
+                    executor.map(
+                        lambda request: request
+                        if isinstance(request, ApiException)
+                        else self.__sendSafe(options, *request),
+                        requests_list,
+                    )
+                )
+
+            # 检查令牌是否过期，仅重试令牌过期的请求
+            expired = []
+            for index, response in zip(pending, results):
+                responses[index] = response
+                if isinstance(response, dict) and self.__tokenExpired(
+                    response.get("errcode")
+                ):
+                    expired.append(index)
+            if not expired:
+                break
+            self.__refreshToken(shortUrl, options.get("function_name"))
+            pending = expired
+        self.__flushMetrics()
+
+        # 检测响应
+        results = []
+        for response in responses:
+            if isinstance(response, ApiException):
+                results.append(response)
+                continue
+            try:
+                results.append(self.__checkResponse(response))
+            except ApiException as ex:
+                results.append(ex)
+        return results
+
+    def __prepareRequest(self, urlType, args, include_agentid=False):
+        """
+        生成请求方式、带令牌的URL和请求参数，供 httpCallMany 在工作线程中发送
+        """
+        method = urlType[1]
+        url = self.__makeUrl(urlType)
+        if "POST" == method:
+            args = dict(args or {})
+            if "agentid" in args and include_agentid:
+                url = self.__appendArgs(url, {"agentid": args["agentid"]})
+                del args["agentid"]
+            return (
+                "POST",
+                self.__appendToken(url),
+                {"data": wecom_json.dumps(args)},
+            )
+        elif "GET" == method:
+            url = self.__appendArgs(url, args)
+            return ("GET", self.__appendToken(url), {})
+        else:
+            raise ApiException(-1, _("unknown method type"))
+
+    @classmethod
+    def __send(cls, options, method, realUrl, kwargs):
+        """
+        发送请求并解析响应，不访问ORM，可在工作线程中调用
+        按函数名称记录耗时和错误码
+        """
+        function_name = options.get("function_name")
+        start = time.monotonic()
+        try:
+            response = cls.__sendGuarded(options, method, realUrl, kwargs)
+        except ApiException as ex:
+            WecomMetrics.record_request(
+                function_name, ex.errCode, time.monotonic() - start
+            )
+            raise
+        except Exception:
+            WecomMetrics.record_request(function_name, -2, time.monotonic() - start)
+            raise
+        WecomMetrics.record_request(
+            function_name, response.get("errcode"), time.monotonic() - start
+        )
+        return response
+
+    @classmethod
+    def __sendGuarded(cls, options, method, realUrl, kwargs):
+        """
+        熔断器打开时直接抛出 ApiException(-3)，不再等待网络超时
+        """
+        circuit = options.get("circuit")
+        if not circuit:
+            return cls.__sendWithRetry(options, method, realUrl, kwargs)
+
+        corpid = options.get("corpid")
+        function_name = options.get("function_name")
+        failure_threshold, cooldown, half_open_probes = circuit
+        if not WecomCircuitBreaker.allow(
+            corpid, function_name, failure_threshold, cooldown, half_open_probes
+        ):
+            raise ApiException(
+                CIRCUIT_OPEN_CODE,
+                _("WeCom API [%s] is temporarily unavailable, please try again later.")
+                % function_name,
+            )
+        try:
+            response = cls.__sendWithRetry(options, method, realUrl, kwargs)
+        except (ApiException, WecomUploadError):
+            # 被限流器拒绝，或上传的文件在本地校验失败，与服务状态无关，不计入失败
+            WecomCircuitBreaker.release(corpid, function_name)
+            raise
+        except Exception as e:
+            WecomCircuitBreaker.record_failure(
+                corpid, function_name, e, failure_threshold, cooldown
+            )
+            raise
+        if WecomRetryPolicy.is_retryable_response(response):
+            WecomCircuitBreaker.record_failure(
+                corpid, function_name, response.get("errmsg"), failure_threshold, cooldown
+            )
+        else:
+            WecomCircuitBreaker.record_success(corpid, function_name)
+        return response
+
+    @staticmethod
+    def __sendWithRetry(options, method, realUrl, kwargs):
+        """
+        发送前等待限流器的令牌，等待时间超过 max_wait 时抛出 ApiException(-4)，不发送请求；
+        收到 45009/45033 时降低速率，暂停后重试；
+        连接错误、超时、HTTP 5xx 和系统繁忙（-1）按重试策略退避重试，POST 请求只重试连接阶段的错误
+        """
+        rate_limit = options.get("rate_limit")
+        retry_policy = options.get("retry") or WecomRetryPolicy(max_retries=0)
+        trace = options.get("trace")
+        corpid = options.get("corpid")
+        function_name = options.get("function_name")
+        # 请求体工厂每次发送前生成新的请求体，可以重试；直接传入的流式请求体只能发送一次，不能重试
+        make_body = kwargs.get("data") if callable(kwargs.get("data")) else None
+        retryable = make_body is not None or not hasattr(kwargs.get("data"), "read")
+        request_kwargs = kwargs
+        deadline = retry_policy.start()
+        attempt = 0
+        throttled = 0
+        while True:
+            if rate_limit:
+                try:
+                    WecomRateLimiter.acquire(corpid, function_name, *rate_limit)
+                except WecomThrottledError as e:
+                    raise ApiException(THROTTLED_CODE, str(e))
+            if make_body is not None:
+                data, headers = make_body()
+                request_kwargs = dict(kwargs, data=data, headers=headers)
+            data = request_kwargs.get("data")
+            bytes_sent = len(data) if isinstance(data, (bytes, str)) else getattr(data, "len", 0)
+            start = time.monotonic()
+            http_response = None
+            try:
+                http_response = WecomHttpTransport.request(
+                    method, realUrl, options, **request_kwargs
+                )
+                WecomCassetteRecorder.record(
+                    function_name,
+                    method,
+                    realUrl,
+                    request_kwargs,
+                    http_response,
+                    time.monotonic() - start,
+                )
+                WecomMetrics.record_transfer(
+                    function_name, bytes_sent, len(http_response.content)
+                )
+                if http_response.status_code >= 500:
+                    raise WecomTransientError(
+                        "HTTP %s: %s" % (http_response.status_code, http_response.reason)
+                    )
+                response = wecom_json.loads(http_response.content)
+            except Exception as e:
+                WecomTracer.record_attempt(
+                    trace,
+                    function_name,
+                    method,
+                    realUrl,
+                    attempt + throttled,
+                    time.monotonic() - start,
+                    bytes_sent,
+                    http_response=http_response,
+                    error=e,
+                )
+                if not retryable or not retry_policy.is_retryable_error(e, method):
+                    raise
+                attempt += 1
+                if not retry_policy.backoff(attempt, deadline):
+                    raise
+                WecomMetrics.record_retry(function_name, "transient")
+                continue
+            WecomTracer.record_attempt(
+                trace,
+                function_name,
+                method,
+                realUrl,
+                attempt + throttled,
+                time.monotonic() - start,
+                bytes_sent,
+                http_response=http_response,
+                response=response,
+            )
+
+            if rate_limit:
+                if response.get("errcode") in RATE_LIMITED_CODES:
+                    WecomRateLimiter.penalize(corpid, function_name, *rate_limit[:2])
+                    throttled += 1
+                    if retryable and throttled <= 3:
+                        WecomMetrics.record_retry(function_name, "rate_limited")
+                        continue
+                    return response
+                WecomRateLimiter.reward(corpid, function_name, *rate_limit[:2])
+
+            if retryable and retry_policy.is_retryable_response(response):
+                attempt += 1
+                if retry_policy.backoff(attempt, deadline):
+                    WecomMetrics.record_retry(function_name, "system_busy")
+                    continue
+            return response
+
+    @classmethod
+    def __sendSafe(cls, options, method, realUrl, kwargs):
+        try:
+            return cls.__send(options, method, realUrl, kwargs)
+        except ApiException as ex:
+            return ex
+        except Exception as e:
+            return ApiException(-2, e)  # 其他错误
 
     def httpPostFile(self, urlType, args=None, data=None, headers=None):
+        """
+        上传文件
+        :param data : 请求体；流式请求体只能读取一次，需要重试时传入无参函数，
+                      每次发送前调用，返回新的 (请求体, 请求头)
+        """
         shortUrl = urlType[0]
+        options = self.get_request_options(urlType)
         response = {}
         for retryCnt in range(0, 3):
-            url = self.__makeUrl(shortUrl)
+            url = self.__makeUrl(urlType)
             url = self.__appendArgs(url, args)
-            response = self.__httpPostFile(url, data, headers)
+            response = self.__httpPostFile(url, data, headers, options)
 
             # 检查令牌是否过期
             if self.__tokenExpired(response.get("errcode")):
-                self.__refreshToken(shortUrl)
-                retryCnt += 1
+                self.__refreshToken(shortUrl, options.get("function_name"))
                 continue
             else:
                 break
+        self.__flushMetrics()
         return self.__checkResponse(response)
 
     @staticmethod
@@ -114,12 +638,11 @@ class WecomAbstractApi(models.AbstractModel):
         return url
 
     @staticmethod
-    def __makeUrl(shortUrl):
-        base = "https://qyapi.weixin.qq.com"
-        if shortUrl[0] == "/":
-            return base + shortUrl
-        else:
-            return base + "/" + shortUrl
+    def __makeUrl(urlType):
+        # get_server_api_call 返回的第三项为预先生成的完整URL
+        if len(urlType) > 2:
+            return urlType[2]
+        return make_url(urlType[0])
 
     def __appendToken(self, url):
         if "SUITE_ACCESS_TOKEN" in url:
@@ -131,37 +654,30 @@ class WecomAbstractApi(models.AbstractModel):
         else:
             return url
 
-    def __httpPost(self, url, args):
+    def __httpPost(self, url, args, options):
         realUrl = self.__appendToken(url)
 
-        if self.get_api_debug() is True:
-            print("Wecom API POST", realUrl, args)
-
-        return requests.post(
-            realUrl, data=json.dumps(args, ensure_ascii=False).encode("utf-8")
-        ).json()
+        return self.__send(
+            options,
+            "POST",
+            realUrl,
+            {"data": wecom_json.dumps(args)},
+        )
 
-    def __httpPostFile(self, url, data, headers):
+    def __httpPostFile(self, url, data, headers, options):
         realUrl = self.__appendToken(url)
 
-        if self.get_api_debug() is True:
-            print("Wecom API POST FILE", realUrl, data, headers)
-
-        # response = requests.post(url=realUrl, data=data, headers=headers).json()
-        return requests.post(url=realUrl, data=data, headers=headers).json()
+        return self.__send(
+            options, "POST", realUrl, {"data": data, "headers": headers}
+        )
 
     def __post_file(self, url, media_file):
-        if self.get_api_debug() is True:
-            print("Wecom API POST FILE", url, media_file)
         return requests.post(url, file=media_file).json()   # type: ignore
 
-    def __httpGet(self, url):
+    def __httpGet(self, url, options):
         realUrl = self.__appendToken(url)
 
-        if self.get_api_debug() is True:
-            print("Wecom API GET", realUrl)
-
-        return requests.get(realUrl).json()
+        return self.__send(options, "GET", realUrl, {})
 
     @staticmethod
     def __checkResponse(response):
@@ -186,10 +702,23 @@ class WecomAbstractApi(models.AbstractModel):
         else:
             return False
 
-    def __refreshToken(self, url):
+    def __flushMetrics(self):
+        """
+        到达间隔时将当前进程的指标写入 wecom.api.metrics
+        """
+        interval = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("wecom.metrics_flush_interval", DEFAULT_FLUSH_INTERVAL)
+        )
+        if interval > 0 and WecomMetrics.due(interval):
+            self.env["wecom.api.metrics"].sudo().flush_process_metrics()
+
+    def __refreshToken(self, url, function_name=None):
         """
         刷新令牌
         """
+        WecomMetrics.record_token_refresh(function_name)
         if "SUITE_ACCESS_TOKEN" in url:
             self.refreshSuiteAccessToken()
         elif "PROVIDER_ACCESS_TOKEN" in url:
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+
+from .wecom_common import ApiException, make_url
+from .wecom_token_cache import WecomTokenCache
+from . import wecom_json
+from .wecom_transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .wecom_rate_limiter import (
+    WecomRateLimiter,
+    WecomThrottledError,
+    RATE_LIMITED_CODES,
+    THROTTLED_CODE,
+)
+from .wecom_retry import WecomRetryPolicy, WecomTransientError
+from .wecom_circuit_breaker import WecomCircuitBreaker, CIRCUIT_OPEN_CODE
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 16  # 默认最大并发数
+
+TOKEN_EXPIRED_CODES = (40014, 42001, 42007, 42009)
+
+
+class WecomAsyncClient(object):
+    """
+    基于 asyncio 的企业微信API 客户端，不依赖 ORM，适用于大批量的扇出请求
+    路由表来自 wecom.service_api_list._get_server_api_routes()，
+    令牌与 wecom.service_api 共用进程级缓存 WecomTokenCache，缓存中没有可用令牌时
+    在线程池中调用 token_refresher，由 wecom.service_api 协调刷新并写入数据库；
+    请求与 httpCall 一样经过限流器、重试策略和熔断器，参数来自 get_request_options()。
+
+    用法：
+        async with WecomAsyncClient(corpid, secret, routes, refresh_token) as client:
+            results = await client.call_many("USER_GET", [{"userid": "..."}])
+    """
+
+    def __init__(
+        self,
+        corpid,
+        secret,
+        routes,
+        token_refresher,
+        request_options=None,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        keep_alive=True,
+    ):
+        """
+        :param corpid : 企业ID
+        :param secret : 应用密钥
+        :param routes : {函数名称: (路由, 请求方式, 完整URL模板, ...)}
+        :param token_refresher : 同步函数 (stale_token) -> access_token，在线程池中执行，可以访问数据库
+        :param request_options : {函数名称: get_request_options() 的结果}，提供限流、重试和熔断参数
+        :param max_concurrency : 最大并发数，同时也是连接池大小
+        """
+        self.corpid = corpid
+        self.secret = secret
+        self.routes = routes
+        self.token_refresher = token_refresher
+        self.request_options = request_options or {}
+        self.max_concurrency = max_concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        self._session = None
+        self._semaphore = None
+        self._token_lock = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """
+        创建复用连接的 HTTP 会话
+        """
+        try:
+            import aiohttp
+        except ImportError:
+            raise ApiException(-2, "The python library 'aiohttp' is not installed.")
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency,
+            force_close=not self.keep_alive,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=self.connect_timeout, sock_read=self.read_timeout
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._token_lock = asyncio.Lock()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_route(self, function_name):
+        route = self.routes.get(function_name)
+        if not route:
+            raise ApiException(-1, "unknown api: %s" % function_name)
+        if len(route) > 2:
+            return route[:3]
+        return (route[0], route[1], make_url(route[0]))
+
+    @staticmethod
+    def _append_args(url, args):
+        if not args:
+            return url
+        for key, value in args.items():
+            if "?" in url:
+                url += "&" + key + "=" + str(value)
+            else:
+                url += "?" + key + "=" + str(value)
+        return url
+
+    async def _request(self, method, url, data=None):
+        async with self._semaphore:  # type: ignore
+            async with self._session.request(method, url, data=data) as response:  # type: ignore
+                content = await response.read()
+                if response.status >= 500:
+                    raise WecomTransientError("HTTP %s: %s" % (response.status, response.reason))
+                return wecom_json.loads(content)
+
+    async def _send(self, options, method, url, data=None):
+        """
+        熔断器打开时直接抛出 ApiException(-3)，与 httpCall 的 __sendGuarded 一致
+        """
+        circuit = options.get("circuit")
+        if not circuit:
+            return await self._send_with_retry(options, method, url, data)
+
+        function_name = options.get("function_name")
+        failure_threshold, cooldown, half_open_probes = circuit
+        if not WecomCircuitBreaker.allow(
+            self.corpid, function_name, failure_threshold, cooldown, half_open_probes
+        ):
+            raise ApiException(
+                CIRCUIT_OPEN_CODE,
+                "WeCom API [%s] is temporarily unavailable, please try again later."
+                % function_name,
+            )
+        try:
+            response = await self._send_with_retry(options, method, url, data)
+        except ApiException:
+            # 被限流器拒绝，请求没有发送，不计入失败
+            WecomCircuitBreaker.release(self.corpid, function_name)
+            raise
+        except asyncio.CancelledError:
+            WecomCircuitBreaker.release(self.corpid, function_name)
+            raise
+        except Exception as e:
+            WecomCircuitBreaker.record_failure(
+                self.corpid, function_name, e, failure_threshold, cooldown
+            )
+            raise
+        if WecomRetryPolicy.is_retryable_response(response):
+            WecomCircuitBreaker.record_failure(
+                self.corpid, function_name, response.get("errmsg"), failure_threshold, cooldown
+            )
+        else:
+            WecomCircuitBreaker.record_success(self.corpid, function_name)
+        return response
+
+    async def _send_with_retry(self, options, method, url, data=None):
+        """
+        与 httpCall 的 __sendWithRetry 一致：发送前等待限流器的令牌，超过 max_wait 时抛出 ApiException(-4)；
+        收到 45009/45033 时降低速率，暂停后重试；网络错误和系统繁忙（-1）按重试策略退避重试，
+        POST 请求只重试连接阶段的错误。等待都使用 asyncio.sleep，不阻塞事件循环。
+        """
+        rate_limit = options.get("rate_limit")
+        retry_policy = options.get("retry") or WecomRetryPolicy(max_retries=0)
+        function_name = options.get("function_name")
+        deadline = retry_policy.start()
+        attempt = 0
+        throttled = 0
+        while True:
+            if rate_limit:
+                try:
+                    wait = WecomRateLimiter.reserve(self.corpid, function_name, *rate_limit)
+                except WecomThrottledError as e:
+                    raise ApiException(THROTTLED_CODE, str(e))
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                response = await self._request(method, url, data=data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self._is_retryable_error(e, method):
+                    raise
+                attempt += 1
+                delay = retry_policy.delay(attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            if rate_limit:
+                if response.get("errcode") in RATE_LIMITED_CODES:
+                    WecomRateLimiter.penalize(self.corpid, function_name, *rate_limit[:2])
+                    throttled += 1
+                    if throttled <= 3:
+                        continue
+                    return response
+                WecomRateLimiter.reward(self.corpid, function_name, *rate_limit[:2])
+
+            if retry_policy.is_retryable_response(response):
+                attempt += 1
+                delay = retry_policy.delay(attempt, deadline)
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    continue
+            return response
+
+    @staticmethod
+    def _is_retryable_error(error, method):
+        """
+        GET 请求对网络错误、超时和 HTTP 5xx 重试；POST 请求只在连接建立失败时重试，请求体尚未发出
+        """
+        import aiohttp
+
+        if method == "GET":
+            return isinstance(
+                error, (WecomTransientError, aiohttp.ClientError, asyncio.TimeoutError)
+            )
+        connect_timeout = getattr(aiohttp, "ConnectionTimeoutError", None)
+        if connect_timeout is not None and isinstance(error, connect_timeout):
+            return True
+        return isinstance(error, aiohttp.ClientConnectorError) and not isinstance(
+            error, aiohttp.ClientSSLError
+        )
+
+    async def get_token(self, stale_token=None):
+        """
+        获取令牌
+        缓存中没有可用的令牌时，在线程池中调用 token_refresher，由 wecom.service_api 的
+        _refresh_token_coordinated 通过咨询锁协调刷新并写入数据库；并发协程只会调用一次
+        :param stale_token : 已被企业微信拒绝的令牌，不会被复用
+        """
+        access_token, token_expiration_time = WecomTokenCache.get(
+            self.corpid, self.secret
+        )
+        if access_token and access_token != stale_token:
+            return access_token
+        async with self._token_lock:  # type: ignore
+            access_token, token_expiration_time = WecomTokenCache.get(
+                self.corpid, self.secret
+            )
+            if access_token and access_token != stale_token:
+                return access_token
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.token_refresher, stale_token)
+
+    async def call(self, function_name, args=None, include_agentid=False):
+        """
+        调用API
+        :param function_name : 函数名称
+        :param args : 请求参数
+        :param include_agentid : 标识args含有 "agentid" 关键字，需要进行处理
+        :returns 返回结果，失败时抛出 ApiException
+        """
+        short_url, method, url = self._get_route(function_name)
+        args = dict(args or {})
+        data = None
+        if "POST" == method:
+            if "agentid" in args and include_agentid:
+                url = self._append_args(url, {"agentid": args.pop("agentid")})
+            data = wecom_json.dumps(args)
+        elif "GET" == method:
+            url = self._append_args(url, args)
+        else:
+            raise ApiException(-1, "unknown method type")
+
+        options = self.request_options.get(function_name) or {}
+        response = {}
+        access_token = None
+        for retryCnt in range(0, 3):
+            realUrl = url
+            if "ACCESS_TOKEN" in url:
+                access_token = await self.get_token(stale_token=access_token)
+                realUrl = url.replace("ACCESS_TOKEN", access_token)
+            try:
+                response = await self._send(options, method, realUrl, data=data)
+            except (asyncio.CancelledError, ApiException):
+                raise
+            except Exception as e:
+                raise ApiException(-2, e)  # 其他错误
+
+            # 检查令牌是否过期
+            if response.get("errcode") in TOKEN_EXPIRED_CODES and access_token:
+                continue
+            break
+
+        if response.get("errcode") == 0:
+            return response
+        raise ApiException(response.get("errcode"), response.get("errmsg"))
+
+    async def call_many(self, function_name, args_list, include_agentid=False):
+        """
+        并发调用同一个API
+        取消外层任务时，尚未完成的请求会被一并取消
+        :returns 与 args_list 顺序一致的结果列表，失败的请求对应的是 ApiException 对象
+        """
+        tasks = [
+            asyncio.ensure_future(self.call(function_name, args, include_agentid))
+            for args in args_list
+        ]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [
+            result
+            if not isinstance(result, BaseException) or isinstance(result, ApiException)
+            else ApiException(-2, result)
+            for result in results
+        ]
+
+
+def run_batch(
+    corpid, secret, routes, token_refresher, function_name, args_list, timeout=None, **options
+):
+    """
+    同步适配器：在独立线程的事件循环中执行一批请求并等待结果，供 ORM 代码调用
+    :param token_refresher : 刷新令牌的同步函数，见 WecomAsyncClient
+    :param timeout : 整批请求的超时时间（秒），超时后取消未完成的请求
+    :param options : 传递给 WecomAsyncClient 的参数
+    :returns 与 args_list 顺序一致的结果列表，失败的请求对应的是 ApiException 对象
+    """
+
+    async def _run():
+        async with WecomAsyncClient(
+            corpid, secret, routes, token_refresher, **options
+        ) as client:
+            return await asyncio.wait_for(
+                client.call_many(function_name, args_list), timeout
+            )
+
+    result = {}
+
+    def _target():
+        try:
+            result["value"] = asyncio.run(_run())
+        except BaseException as e:
+            result["error"] = e
+
+    # 调用线程中可能已有运行中的事件循环，统一在独立线程中执行
+    thread = threading.Thread(target=_target, name="wecom-async-batch", daemon=True)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        error = result["error"]
+        if isinstance(error, asyncio.TimeoutError):
+            raise ApiException(-2, "WeCom batch call timed out")
+        if isinstance(error, ApiException):
+            raise error
+        raise ApiException(-2, error)
+    return result["value"]
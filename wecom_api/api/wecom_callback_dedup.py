@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 4096  # 每个工作进程最多记住的回调数
+DEFAULT_TTL = 3600  # 回调去重的有效时长（秒）
+
+# 组成去重键的回调字段：事件、变更类型和变更的成员、部门、标签或消息
+KEY_FIELDS = (
+    "CreateTime",
+    "MsgType",
+    "Event",
+    "ChangeType",
+    "UserID",
+    "NewUserID",
+    "Id",
+    "TagId",
+    "MsgId",
+)
+
+
+def make_dedup_key(corpid, data, plaintext):
+    """
+    :param corpid: 企业ID
+    :param data: 回调消息的字段
+    :param plaintext: 明文 XML；同一秒内对同一对象的两次不同变更内容不同，不会被误判为重复
+    :returns 去重键
+    """
+    if isinstance(plaintext, str):
+        plaintext = plaintext.encode("utf-8")
+    parts = [corpid or ""] + [str(data.get(field) or "") for field in KEY_FIELDS]
+    parts.append(hashlib.sha1(plaintext or b"").hexdigest())
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class WecomCallbackDedup(object):
+    """
+    回调去重的进程级 LRU
+    企业微信在 5 秒内收不到响应会重试回调，同一个工作进程再次收到时直接丢弃，不必查询数据库；
+    其他工作进程收到的重试由 wecom.app.callback.dedup 表的唯一索引识别。
+    """
+
+    _lock = threading.Lock()
+    _entries = OrderedDict()
+    _pid = None
+
+    @classmethod
+    def _check_fork(cls):
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._entries = OrderedDict()
+            cls._pid = pid
+
+    @classmethod
+    def seen(cls, key, ttl=DEFAULT_TTL):
+        """
+        :returns 有效期内是否已经记住该键
+        """
+        with cls._lock:
+            cls._check_fork()
+            expires = cls._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del cls._entries[key]
+                return False
+            cls._entries.move_to_end(key)
+            return True
+
+    @classmethod
+    def add(cls, key, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        记住该键，超出上限时淘汰最久未使用的记录
+        """
+        if ttl <= 0 or max_entries <= 0:
+            return
+        with cls._lock:
+            cls._check_fork()
+            cls._entries[key] = time.monotonic() + ttl
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > max_entries:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries = OrderedDict()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from lxml import etree
+
+_local = threading.local()
+
+# 通讯录变更事件按对象排序处理：ChangeType 对应的对象类型和标识字段
+ENTITY_KEY_FIELDS = {
+    "create_user": ("user", "UserID"),
+    "update_user": ("user", "UserID"),
+    "delete_user": ("user", "UserID"),
+    "create_party": ("party", "Id"),
+    "update_party": ("party", "Id"),
+    "delete_party": ("party", "Id"),
+    "update_tag": ("tag", "TagId"),
+}
+
+
+def _get_parser():
+    """
+    每个线程一个解析器：不解析实体、不加载 DTD、不访问网络，防止 XXE 和实体膨胀攻击
+    """
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = etree.XMLParser(
+            resolve_entities=False,
+            load_dtd=False,
+            no_network=True,
+            huge_tree=False,
+            remove_comments=True,
+            remove_pis=True,
+        )
+        _local.parser = parser
+    return parser
+
+
+def parse_xml(xmltext):
+    """
+    解析企业微信回调的 XML
+    :param xmltext: bytes 或 str
+    :returns 根元素，包含 DOCTYPE 时抛出 ValueError
+    """
+    if isinstance(xmltext, str):
+        xmltext = xmltext.encode("utf-8")
+    root = etree.fromstring(xmltext, _get_parser())
+    if root.getroottree().docinfo.doctype:
+        raise ValueError("DOCTYPE is not allowed in WeCom callback messages")
+    return root
+
+
+def element_to_dict(element):
+    """
+    与 xmltodict 的结果一致：叶子节点为文本（空节点为 None），重复的节点合并为列表
+    """
+    result = {}
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+        value = element_to_dict(child) if len(child) else child.text
+        if child.tag in result:
+            existing = result[child.tag]
+            if isinstance(existing, list):
+                existing.append(value)
+            else:
+                result[child.tag] = [existing, value]
+        else:
+            result[child.tag] = value
+    return result
+
+
+class WecomCallbackEvent(object):
+    """
+    解码后的回调事件
+    每个回调只解析一次，通过上下文的 callback_event 传给事件处理方法，不必再次解析 xml_tree。
+    """
+
+    __slots__ = ("xml", "data")
+
+    def __init__(self, xml):
+        """
+        :param xml: 解密后的明文 XML
+        """
+        self.xml = xml
+        self.data = element_to_dict(parse_xml(xml))
+
+    @classmethod
+    def from_context(cls, context):
+        """
+        :returns 上下文中的回调事件，没有时解析上下文中的 xml_tree
+        """
+        event = context.get("callback_event")
+        if event is None:
+            event = cls(context.get("xml_tree"))
+        return event
+
+    @property
+    def msg_type(self):
+        return self.data.get("MsgType")
+
+    @property
+    def event(self):
+        return self.data.get("Event")
+
+    @property
+    def change_type(self):
+        return self.data.get("ChangeType")
+
+    @property
+    def entity_key(self):
+        """
+        :returns 变更对象的键，例如 user:zhangsan；同一对象的事件需要按顺序处理，其他事件返回 None
+        """
+        kind, field = ENTITY_KEY_FIELDS.get(self.change_type, (None, None))
+        if not kind or not self.data.get(field):
+            return None
+        return "%s:%s" % (kind, self.data[field])
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
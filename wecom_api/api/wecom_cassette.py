@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict, deque
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .wecom_trace import redact_url
+from .wecom_transport import WecomHttpTransport
+
+_logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+# 请求和响应中需要脱敏的字段，值替换为稳定的摘要，相同的值脱敏后仍然相同
+PII_KEYS = frozenset(
+    (
+        "mobile",
+        "telephone",
+        "email",
+        "biz_mail",
+        "address",
+        "avatar",
+        "thumb_avatar",
+        "qr_code",
+        "external_position",
+    )
+)
+# 响应中的令牌
+SECRET_KEYS = frozenset(("access_token", "ticket", "corpsecret", "secret"))
+
+
+class WecomCassetteError(Exception):
+    """
+    回放时找不到匹配的录制记录
+    """
+
+
+def _pseudonym(value):
+    return "***%s" % hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:8]
+
+
+def redact_data(data):
+    """
+    隐藏令牌，并将个人信息替换为摘要
+    """
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if key in SECRET_KEYS and value:
+                result[key] = "***"
+            elif key in PII_KEYS and value not in (None, ""):
+                result[key] = _pseudonym(value)
+            else:
+                result[key] = redact_data(value)
+        return result
+    if isinstance(data, list):
+        return [redact_data(value) for value in data]
+    return data
+
+
+def redact_body(body):
+    """
+    :param body: 请求或响应的正文（bytes 或 str），JSON 以外的内容原样返回
+    :returns 脱敏后的文本，流式请求体返回 "<stream>"
+    """
+    if body is None:
+        return ""
+    if hasattr(body, "read"):
+        return "<stream>"
+    if isinstance(body, bytes):
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return "<binary:%s>" % hashlib.sha1(body).hexdigest()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    return json.dumps(redact_data(data), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def normalize_url(url):
+    """
+    隐藏令牌并按参数名排序，作为匹配录制记录的键
+    """
+    parts = urlsplit(redact_url(url))
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)), safe="*")
+    return "%s://%s%s%s" % (parts.scheme, parts.netloc, parts.path, "?" + query if query else "")
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return io.open(path, mode, encoding="utf-8")
+
+
+class WecomCassetteRecorder(object):
+    """
+    录制企业微信API 的请求和响应
+    每次 HTTP 往返写入一行 JSON（文件名以 .gz 结尾时压缩），令牌和个人信息在写入前脱敏。
+    录制状态是进程级的，开始录制后当前进程的所有请求都会被记录。
+    """
+
+    _lock = threading.Lock()
+    _file = None
+
+    @classmethod
+    def start(cls, path):
+        with cls._lock:
+            if cls._file is not None:
+                cls._file.close()
+            cls._file = _open(path, "w")
+            cls._file.write(
+                json.dumps(
+                    {"version": CASSETTE_VERSION, "recorded_at": datetime.utcnow().isoformat()}
+                )
+                + "\n"
+            )
+        _logger.info("Start recording WeCom API traffic to %s", path)
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            if cls._file is not None:
+                cls._file.close()
+                cls._file = None
+
+    @classmethod
+    def is_recording(cls):
+        return cls._file is not None
+
+    @classmethod
+    def record(cls, function_name, method, url, kwargs, http_response, duration):
+        """
+        记录一次 HTTP 往返，由 wecom.abstract_api 在收到响应后调用
+        """
+        if cls._file is None:
+            return
+        entry = {
+            "fn": function_name,
+            "method": method,
+            "url": normalize_url(url),
+            "body": redact_body(kwargs.get("data")),
+            "status": http_response.status_code,
+            "type": http_response.headers.get("Content-Type", ""),
+            "response": redact_body(http_response.content),
+            "duration": round(duration, 4),
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with cls._lock:
+            if cls._file is not None:
+                cls._file.write(line)
+                cls._file.flush()
+
+
+class WecomReplayTransport(object):
+    """
+    回放录制的企业微信API 响应，替代 WecomHttpTransport 发送请求
+    按请求方式、脱敏后的 URL 和请求体匹配，相同的请求按录制顺序依次返回，用完后重复最后一个响应。
+    """
+
+    def __init__(self, path, latency=None):
+        """
+        :param path: 录制文件
+        :param latency: 为空时全速回放；为数字时按录制耗时乘以该系数等待，1 为原速
+        """
+        self.path = path
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        self._last = {}
+        with _open(path, "r") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("version") != CASSETTE_VERSION:
+                raise WecomCassetteError("Unsupported cassette version: %s" % header.get("version"))
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[self._key(entry["method"], entry["url"], entry["body"])].append(entry)
+
+    @staticmethod
+    def _key(method, url, body):
+        return (method, url, body)
+
+    def request(self, method, url, options=None, **kwargs):
+        key = self._key(method, normalize_url(url), redact_body(kwargs.get("data")))
+        with self._lock:
+            queue = self._entries.get(key)
+            if queue:
+                entry = queue.popleft()
+                self._last[key] = entry
+            else:
+                entry = self._last.get(key)
+        if entry is None:
+            raise WecomCassetteError(
+                "No recorded response for %s %s in %s" % (method, key[1], self.path)
+            )
+        if self.latency:
+            time.sleep(entry["duration"] * self.latency)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = "OK" if entry["status"] < 400 else "Error"
+        response.headers = CaseInsensitiveDict({"Content-Type": entry["type"]})
+        response.encoding = "utf-8"
+        response.url = url
+        response._content = entry["response"].encode("utf-8")
+        return response
+
+
+@contextmanager
+def use_cassette(path, mode="replay", latency=None):
+    """
+    录制或回放企业微信API 请求，例如：
+        with use_cassette("/tmp/sync.jsonl.gz", "record"):
+            env["wecom.department"].download_wecom_deps()
+    :param mode: "record" 或 "replay"
+    :param latency: 回放时的耗时系数，见 WecomReplayTransport
+    """
+    if mode == "record":
+        WecomCassetteRecorder.start(path)
+        try:
+            yield
+        finally:
+            WecomCassetteRecorder.stop()
+    elif mode == "replay":
+        WecomHttpTransport.replay = WecomReplayTransport(path, latency)
+        try:
+            yield
+        finally:
+            WecomHttpTransport.replay = None
+    else:
+        raise ValueError("Unknown cassette mode: %s" % mode)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+CIRCUIT_OPEN_CODE = -3  # 熔断器打开时抛出的错误码
+
+DEFAULT_FAILURE_THRESHOLD = 5  # 连续失败多少次后打开熔断器
+DEFAULT_COOLDOWN = 30.0  # 打开后拒绝请求的时长（秒）
+DEFAULT_HALF_OPEN_PROBES = 1  # 半开状态同时放行的探测请求数
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker(object):
+    """
+    熔断器
+    连续失败达到阈值后打开，冷却期内直接拒绝请求；冷却结束后进入半开状态，
+    只放行少量探测请求，探测成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_until = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def allow(self, cooldown, half_open_probes):
+        """
+        判断是否放行请求
+        :returns 放行时返回 True
+        """
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == STATE_OPEN:
+                if now < self.open_until:
+                    self.rejected += 1
+                    return False
+                self.state = STATE_HALF_OPEN
+                self.probes = 0
+            if self.probes < half_open_probes:
+                self.probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """
+        放行的请求没有发送，归还半开状态的探测名额
+        """
+        with self.lock:
+            if self.state == STATE_HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def record_success(self):
+        """
+        请求成功
+        :returns 熔断器是否由此关闭
+        """
+        if self.state == STATE_CLOSED and not self.failures:
+            return False
+        with self.lock:
+            recovered = self.state != STATE_CLOSED
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.probes = 0
+            return recovered
+
+    def record_failure(self, error, failure_threshold, cooldown):
+        """
+        请求失败
+        :returns 熔断器是否由此打开
+        """
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == STATE_HALF_OPEN or (
+                self.state == STATE_CLOSED and self.failures >= failure_threshold
+            ):
+                now = time.monotonic()
+                self.state = STATE_OPEN
+                self.opened_at = now
+                self.open_until = now + cooldown
+                self.probes = 0
+                return True
+            return False
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "key": self.key,
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in_seconds": max(0.0, self.open_until - time.monotonic())
+                if self.state == STATE_OPEN
+                else 0.0,
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+            }
+
+
+class WecomCircuitBreaker(object):
+    """
+    企业微信API 熔断器注册表
+    每个工作进程按 (corpid, function_name) 维护熔断器，企业微信服务降级时快速失败，
+    避免同步任务在套接字超时上长时间占用工作进程。
+    """
+
+    _lock = threading.Lock()
+    _breakers = {}
+    _pid = None
+
+    @classmethod
+    def _get_breaker(cls, corpid, function_name):
+        key = (corpid, function_name)
+        with cls._lock:
+            pid = os.getpid()
+            if cls._pid != pid:
+                cls._breakers = {}
+                cls._pid = pid
+            breaker = cls._breakers.get(key)
+            if breaker is None:
+                breaker = cls._breakers[key] = CircuitBreaker(key)
+        return breaker
+
+    @classmethod
+    def allow(
+        cls,
+        corpid,
+        function_name,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        cooldown=DEFAULT_COOLDOWN,
+        half_open_probes=DEFAULT_HALF_OPEN_PROBES,
+    ):
+        """
+        判断是否放行请求
+        """
+        return cls._get_breaker(corpid, function_name).allow(
+            cooldown, half_open_probes
+        )
+
+    @classmethod
+    def release(cls, corpid, function_name):
+        cls._get_breaker(corpid, function_name).release()
+
+    @classmethod
+    def record_success(cls, corpid, function_name):
+        if cls._get_breaker(corpid, function_name).record_success():
+            _logger.info(
+                "Circuit of WeCom API [%s] of corp [%s] is closed.",
+                function_name,
+                corpid,
+            )
+
+    @classmethod
+    def record_failure(
+        cls,
+        corpid,
+        function_name,
+        error,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        cooldown=DEFAULT_COOLDOWN,
+    ):
+        if cls._get_breaker(corpid, function_name).record_failure(
+            error, failure_threshold, cooldown
+        ):
+            _logger.warning(
+                "Circuit of WeCom API [%s] of corp [%s] is open for %.2f seconds, last error: %s",
+                function_name,
+                corpid,
+                cooldown,
+                error,
+            )
+
+    @classmethod
+    def reset(cls):
+        """
+        关闭当前进程的全部熔断器
+        """
+        with cls._lock:
+            cls._breakers = {}
+
+    @classmethod
+    def snapshot(cls, only_open=False):
+        """
+        当前进程所有熔断器的状态，用于监控
+        :param only_open: 只返回未关闭的熔断器
+        """
+        with cls._lock:
+            breakers = list(cls._breakers.values())
+        states = [breaker.snapshot() for breaker in breakers]
+        if only_open:
+            states = [state for state in states if state["state"] != STATE_CLOSED]
+        return states
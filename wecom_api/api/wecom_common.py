@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+# 不依赖 ORM 的公共定义，wecom_abstract_api 和 wecom_async_client 共用
+
+WECOM_API_BASE_URL = "https://qyapi.weixin.qq.com"
+
+
+def make_url(shortUrl, baseUrl=None):
+    """
+    根据路由生成完整URL
+    :param baseUrl : API 服务地址，默认为企业微信官方地址，可指向压测或联调用的替身服务
+    """
+    baseUrl = (baseUrl or WECOM_API_BASE_URL).rstrip("/")
+    if shortUrl[0] == "/":
+        return baseUrl + shortUrl
+    else:
+        return baseUrl + "/" + shortUrl
+
+
+class ApiException(Exception):
+    def __init__(self, errCode, errMsg):
+        super().__init__(errCode, errMsg)
+        self.errCode = errCode
+        self.errMsg = errMsg
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import ast
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj):
+    """
+    序列化请求体
+    :returns UTF-8 编码的 bytes，不转义中文
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson 不支持的类型（例如超过 64 位的整数），使用标准库
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """
+    直接从响应的 bytes 解析 JSON，不先解码为 str
+    :param data: bytes 或 str
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_text(obj):
+    """
+    序列化为 str，用于写入 Char/Text 字段
+    """
+    return dumps(obj).decode("utf-8")
+
+
+def loads_field(value, default=None):
+    """
+    读取 Char/Text 字段中保存的列表或字典，替代 eval()
+    兼容以前按 Python 格式（str(list)、str(dict)）保存的值
+    """
+    if not value:
+        return default
+    if not isinstance(value, str):
+        return value
+    try:
+        return loads(value)
+    except ValueError:
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            _logger.warning("Unable to parse the JSON value: %s", value)
+            return default
+
+
+def dumps_nested(data):
+    """
+    将字典中非空的列表和字典值序列化为 JSON 文本，用于把 API 返回的对象写入 Char/Text 字段
+    :returns 新的字典
+    """
+    return {
+        key: dumps_text(value) if isinstance(value, (list, dict)) and value else value
+        for key, value in data.items()
+    }
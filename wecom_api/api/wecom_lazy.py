@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import threading
+
+
+class LazyModule(object):
+    """
+    延迟导入的模块
+    pandas、pydub 等第三方库体积较大，模块级导入会拖慢每个工作进程加载注册表；
+    首次访问属性时才真正导入，之后直接使用已导入的模块。
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        return "<LazyModule %s%s>" % (
+            self.__dict__["_name"],
+            "" if self.__dict__["_module"] is None else " (loaded)",
+        )
+
+
+def lazy_import(name):
+    """
+    :param name: 模块名称，例如 "pandas"、"Crypto.Cipher.AES"
+    :returns 首次访问属性时才导入的模块代理
+    """
+    return LazyModule(name)
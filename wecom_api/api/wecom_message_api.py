@@ -25,8 +25,11 @@ class WeComMessageApi(models.AbstractModel):
         return wxapi
 
     def send_by_api(self, message, api):
-        params = self.env["ir.config_parameter"].sudo()
-        debug = params.get_param("wecom.debug_enabled")
+        """
+        立即发送一条消息并返回响应，仅用于需要立即得到 msgid 或 invaliduser 的调用方；
+        其他情况请使用 send_message，消息随当前事务提交后由发件箱发送
+        """
+        debug = self.env["wecom.abstract_api"].get_api_debug()
 
         try:
             del message["company"]  # 删除message中的 company
@@ -41,6 +44,20 @@ class WeComMessageApi(models.AbstractModel):
             if debug:
                 _logger.warning(_("Error sending message: %s") % (ex))
 
+    def queue_by_api(self, message, app, record=None):
+        """
+        将消息写入发件箱，随当前事务提交后由定时任务发送
+        事务回滚时不会发送消息；发送失败只在确定没有被执行时重试（熔断、本地限流、频率超限），不会重复发送
+        :param app: 发送消息的企业微信应用
+        :param record: 来源记录，例如触发消息的单据
+        :returns 发件箱中的意图
+        """
+        message = dict(message)
+        message.pop("company", None)  # 删除message中的 company
+        if not message.get("agentid"):
+            message["agentid"] = app.agentid
+        return self.env["wecom.api.outbox"].enqueue(app, "MESSAGE_SEND", message, record=record)
+
     def build_message(
         self,
         msgtype,
@@ -115,21 +132,21 @@ class WeComMessageApi(models.AbstractModel):
         return messages
 
     @api.model
-    def send_message(self, message):
+    def send_message(self, message, app, record=None):
         """
-        发送一条企业微信消息 到多个人员
+        发送一条企业微信消息 到多个人员，经由发件箱发送
         """
-        return self.send_by_api(message)
+        return self.queue_by_api(message, app, record=record)
 
     @api.model
-    def _send_message_batch(self, messages):
+    def _send_message_batch(self, messages, app):
         """
-        批量模式发送企业微信消息
+        批量模式发送企业微信消息，同一批消息由发件箱通过 httpCallMany 并发发送
         """
-        params = {
-            "messages": messages,
-        }
-        return self._wecom_message_send_api(params)
+        outbox = self.env["wecom.api.outbox"]
+        for message in messages:
+            outbox |= self.queue_by_api(message, app)
+        return outbox
 
     def get_messages_content(
         self,
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+from collections import defaultdict
+
+# 请求耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+DEFAULT_FLUSH_INTERVAL = 60  # 写入数据库的间隔（秒）
+
+
+def format_bucket(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class WecomMetrics(object):
+    """
+    企业微信API 的进程内指标
+    按函数名称累计请求耗时直方图、错误码计数、令牌刷新次数、重试次数和收发字节数，
+    只在内存中做加法，定期由 wecom.api.metrics 取出增量写入数据库。
+    键为 (function_name, metric, label)，值为累加值。
+    """
+
+    _lock = threading.Lock()
+    _values = defaultdict(float)
+    _pid = None
+    _last_flush = time.monotonic()
+
+    @classmethod
+    def _check_fork(cls):
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._values = defaultdict(float)
+            cls._pid = pid
+            cls._last_flush = time.monotonic()
+
+    @classmethod
+    def _add(cls, items):
+        with cls._lock:
+            cls._check_fork()
+            for key, value in items:
+                cls._values[key] += value
+
+    @classmethod
+    def record_request(cls, function_name, errcode, duration):
+        """
+        记录一次请求
+        :param errcode: 企业微信返回的错误码，网络错误等为 ApiException 的错误码
+        :param duration: 耗时（秒），包括重试
+        """
+        function_name = function_name or ""
+        for bound in LATENCY_BUCKETS:
+            if duration <= bound:
+                break
+        cls._add(
+            (
+                ((function_name, "requests", str(errcode)), 1),
+                ((function_name, "latency_bucket", format_bucket(bound)), 1),  # type: ignore
+                ((function_name, "latency_sum", ""), duration),
+            )
+        )
+
+    @classmethod
+    def record_transfer(cls, function_name, bytes_sent, bytes_received):
+        """
+        记录一次 HTTP 往返的收发字节数，重试的每次往返分别记录
+        """
+        function_name = function_name or ""
+        cls._add(
+            (
+                ((function_name, "bytes_sent", ""), bytes_sent),
+                ((function_name, "bytes_received", ""), bytes_received),
+            )
+        )
+
+    @classmethod
+    def record_retry(cls, function_name, reason):
+        """
+        记录一次重试
+        :param reason: 重试原因，例如 "transient"、"rate_limited"
+        """
+        cls._add((((function_name or "", "retries", reason), 1),))
+
+    @classmethod
+    def record_token_refresh(cls, function_name):
+        cls._add((((function_name or "", "token_refreshes", ""), 1),))
+
+    @classmethod
+    def record_cache_hit(cls, function_name):
+        cls._add((((function_name or "", "cache_hits", ""), 1),))
+
+    @classmethod
+    def due(cls, interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        是否到了写入数据库的时间，每个间隔只有一个线程得到 True
+        """
+        now = time.monotonic()
+        if now - cls._last_flush < interval:
+            return False
+        with cls._lock:
+            if now - cls._last_flush < interval:
+                return False
+            cls._last_flush = now
+            return True
+
+    @classmethod
+    def drain(cls):
+        """
+        取出并清空当前进程累计的增量
+        :returns {(function_name, metric, label): value}
+        """
+        with cls._lock:
+            cls._check_fork()
+            values, cls._values = cls._values, defaultdict(float)
+        return dict(values)
+
+    @classmethod
+    def restore(cls, values):
+        """
+        写入数据库失败时放回增量，下次再写
+        """
+        cls._add(values.items())
+
+    @classmethod
+    def snapshot(cls):
+        """
+        当前进程尚未写入数据库的增量
+        """
+        with cls._lock:
+            return dict(cls._values)
@@ -7,12 +7,14 @@ import random
 import hashlib
 import time
 import struct
-from Crypto.Cipher import AES
-import xml.etree.cElementTree as ET
 import socket
 import hashlib
 import werkzeug.urls
 import werkzeug.utils
+from .wecom_lazy import lazy_import
+from .wecom_callback_event import parse_xml
+
+AES = lazy_import("Crypto.Cipher.AES")  # 仅在加解密回调消息时使用
 
 _logger = logging.getLogger(__name__)
 
@@ -82,13 +84,13 @@ class XMLParse:
         @return: 提取出的加密消息字符串
         """
         try:
-            xml_tree = ET.fromstring(xmltext)
+            xml_tree = parse_xml(xmltext)
             encrypt = xml_tree.find("Encrypt")
             return WXBizMsgCrypt_OK, encrypt.text    # type: ignore
         except Exception as e:
             logger = logging.getLogger()
             logger.error(e)
-            return WXBizMsgCrypt_ParseXml_Error, None, None
+            return WXBizMsgCrypt_ParseXml_Error, None
 
     def generate(self, encrypt, signature, timestamp, nonce):
         """生成xml消息
@@ -223,6 +225,7 @@ class WecomMsgCrypt(object):
     def __init__(self, sToken, sEncodingAESKey, sReceiveId):
         """
         初始化消息加解密对象
+        密钥只解码一次，签名、XML 解析和加解密对象在多次调用之间复用，不保存每次请求的状态，可被多个线程共享
         :return:
         """
         try:
@@ -233,6 +236,9 @@ class WecomMsgCrypt(object):
             # return WXBizMsgCrypt_IllegalAesKey,None
         self.m_sToken = sToken
         self.m_sReceiveId = sReceiveId
+        self.sha1 = SHA1()
+        self.xmlParse = XMLParse()
+        self.prpcrypt = Prpcrypt(self.key)  # 每次加解密创建新的 AES-CBC 对象
 
     def VerifyURL(self, sMsgSignature, sTimeStamp, sNonce, sEchoStr):
         """验证URL
@@ -243,14 +249,12 @@ class WecomMsgCrypt(object):
         @param sReplyEchoStr: 解密之后的echostr，当return返回0时有效
         @return: 成功0，失败返回对应的错误码
         """
-        sha1 = SHA1()
-        ret, signature = sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, sEchoStr)
+        ret, signature = self.sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, sEchoStr)
         if ret != 0:
             return ret, None
         if not signature == sMsgSignature:
             return WXBizMsgCrypt_ValidateSignature_Error, None
-        pc = Prpcrypt(self.key)
-        ret, sReplyEchoStr = pc.decrypt(sEchoStr, self.m_sReceiveId)
+        ret, sReplyEchoStr = self.prpcrypt.decrypt(sEchoStr, self.m_sReceiveId)
         return ret, sReplyEchoStr
 
     def EncryptMsg(self, sReplyMsg, sNonce, timestamp=None):
@@ -261,20 +265,17 @@ class WecomMsgCrypt(object):
         sEncryptMsg: 加密后的可以直接回复用户的密文，包括msg_signature, timestamp, nonce, encrypt的xml格式的字符串,
         return:成功0，sEncryptMsg,失败返回对应的错误码None
         """
-        pc = Prpcrypt(self.key)
-        ret, encrypt = pc.encrypt(sReplyMsg, self.m_sReceiveId)
+        ret, encrypt = self.prpcrypt.encrypt(sReplyMsg, self.m_sReceiveId)
         encrypt = encrypt.decode("utf8")     # type: ignore
         if ret != 0:
             return ret, None
         if timestamp is None:
             timestamp = str(int(time.time()))
         # 生成安全签名
-        sha1 = SHA1()
-        ret, signature = sha1.getSHA1(self.m_sToken, timestamp, sNonce, encrypt)
+        ret, signature = self.sha1.getSHA1(self.m_sToken, timestamp, sNonce, encrypt)
         if ret != 0:
             return ret, None
-        xmlParse = XMLParse()
-        return ret, xmlParse.generate(encrypt, signature, timestamp, sNonce)
+        return ret, self.xmlParse.generate(encrypt, signature, timestamp, sNonce)
 
     def DecryptMsg(self, sPostData, sMsgSignature, sTimeStamp, sNonce):
         """检验消息的真实性，并且获取解密后的明文
@@ -286,16 +287,13 @@ class WecomMsgCrypt(object):
         # @return: 成功0，失败返回对应的错误码
         # 验证安全签名
         """
-        xmlParse = XMLParse()
-        ret, encrypt = xmlParse.extract(sPostData)   # type: ignore
+        ret, encrypt = self.xmlParse.extract(sPostData)   # type: ignore
         if ret != 0:
             return ret, None
-        sha1 = SHA1()
-        ret, signature = sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, encrypt)
+        ret, signature = self.sha1.getSHA1(self.m_sToken, sTimeStamp, sNonce, encrypt)
         if ret != 0:
             return ret, None
         if not signature == sMsgSignature:
             return WXBizMsgCrypt_ValidateSignature_Error, None
-        pc = Prpcrypt(self.key)
-        ret, xml_content = pc.decrypt(encrypt, self.m_sReceiveId)
+        ret, xml_content = self.prpcrypt.decrypt(encrypt, self.m_sReceiveId)
         return ret, xml_content
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+RATE_LIMITED_CODES = (45009, 45033)  # 接口调用超过限制 / 接口并发调用超过限制
+THROTTLED_CODE = -4  # 等待令牌超过最长时间，请求未发送
+
+DEFAULT_CORP_RATE = 300.0  # 每个企业每秒的请求数
+DEFAULT_API_RATE = 150.0  # 每个企业每个接口每秒的请求数，企业微信限制为每分钟1万次
+DEFAULT_MAX_WAIT = 60.0  # 等待令牌的最长时间（秒）
+
+MIN_RATE_FACTOR = 0.1  # 触发限流后速率最多降低到配置值的10%
+RECOVER_STEP = 0.02  # 每次成功请求恢复的速率比例
+BACKOFF_BASE = 1.0  # 触发限流后暂停的初始时间（秒）
+BACKOFF_MAX = 60.0  # 触发限流后暂停的最长时间（秒）
+
+
+class WecomThrottledError(Exception):
+    """
+    等待令牌的时间超过 max_wait，请求未发送
+    """
+
+    def __init__(self, corpid, function_name, wait, max_wait):
+        super().__init__(
+            "WeCom API [%s] of corp [%s] is throttled for %.2f seconds, "
+            "longer than the maximum wait of %.2f seconds." % (function_name, corpid, wait, max_wait)
+        )
+        self.wait = wait
+
+
+class TokenBucket(object):
+    """
+    令牌桶
+    按配置速率补充令牌，容量为1秒的请求量；触发企业微信频率限制后，
+    速率按比例降低并暂停一段时间（AIMD），随后随成功请求逐步恢复。
+    """
+
+    def __init__(self, key, rate):
+        self.key = key
+        self.rate = float(rate)
+        self.capacity = max(float(rate), 1.0)
+        self.tokens = self.capacity
+        self.factor = 1.0
+        self.blocked_until = 0.0
+        self.backoff = BACKOFF_BASE
+        self.last = time.monotonic()
+        self.waited = 0.0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def configure(self, rate):
+        rate = float(rate)
+        if rate != self.rate:
+            with self.lock:
+                self.rate = rate
+                self.capacity = max(rate, 1.0)
+                self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now):
+        elapsed = now - self.last
+        self.last = now
+        if elapsed > 0:
+            self.tokens = min(
+                self.capacity, self.tokens + elapsed * self.rate * self.factor
+            )
+
+    def reserve(self):
+        """
+        预定一个令牌
+        :returns 需要等待的秒数，0 表示可以立即发送
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / (self.rate * self.factor)
+            wait = max(wait, self.blocked_until - now)
+            if wait > 0:
+                self.waited += wait
+            return wait
+
+    def cancel(self, wait):
+        """
+        退还 reserve 预定的令牌
+        """
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+            self.waited -= max(wait, 0.0)
+
+    def penalize(self):
+        """
+        收到企业微信频率限制错误，降低速率并暂停
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.factor = max(MIN_RATE_FACTOR, self.factor / 2)
+            self.blocked_until = max(self.blocked_until, now + self.backoff)
+            self.backoff = min(BACKOFF_MAX, self.backoff * 2)
+            self.tokens = min(self.tokens, 0)
+            self.throttled += 1
+            return self.blocked_until - now
+
+    def reward(self):
+        """
+        请求成功，逐步恢复速率
+        """
+        if self.factor < 1.0 or self.backoff > BACKOFF_BASE:
+            with self.lock:
+                self.factor = min(1.0, self.factor + RECOVER_STEP)
+                self.backoff = max(BACKOFF_BASE, self.backoff / 2)
+
+    def snapshot(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return {
+                "key": self.key,
+                "rate": self.rate,
+                "effective_rate": self.rate * self.factor,
+                "tokens": self.tokens,
+                "capacity": self.capacity,
+                "blocked_seconds": max(0.0, self.blocked_until - time.monotonic()),
+                "waited_seconds": self.waited,
+                "throttled": self.throttled,
+            }
+
+
+class WecomRateLimiter(object):
+    """
+    企业微信API 客户端限流器
+    每个工作进程按企业（corpid）和接口（corpid, function_name）分别维护令牌桶，
+    请求在发送前等待令牌；需要等待的时间超过 max_wait 时退还令牌并抛出 WecomThrottledError，不发送请求。
+    """
+
+    _lock = threading.Lock()
+    _buckets = {}
+    _pid = None
+
+    @classmethod
+    def _get_bucket(cls, key, rate):
+        with cls._lock:
+            pid = os.getpid()
+            if cls._pid != pid:
+                cls._buckets = {}
+                cls._pid = pid
+            bucket = cls._buckets.get(key)
+            if bucket is None:
+                bucket = cls._buckets[key] = TokenBucket(key, rate)
+        bucket.configure(rate)
+        return bucket
+
+    @classmethod
+    def _get_buckets(cls, corpid, function_name, corp_rate, api_rate):
+        buckets = []
+        if corp_rate > 0:
+            buckets.append(cls._get_bucket((corpid,), corp_rate))
+        if api_rate > 0 and function_name:
+            buckets.append(cls._get_bucket((corpid, function_name), api_rate))
+        return buckets
+
+    @classmethod
+    def reserve(
+        cls,
+        corpid,
+        function_name,
+        corp_rate=DEFAULT_CORP_RATE,
+        api_rate=DEFAULT_API_RATE,
+        max_wait=DEFAULT_MAX_WAIT,
+    ):
+        """
+        预定企业和接口的令牌，不等待，供异步客户端自行等待
+        :returns 需要等待的秒数
+        :raises WecomThrottledError: 需要等待的时间超过 max_wait，令牌已退还
+        """
+        reserved = []
+        wait = 0.0
+        for bucket in cls._get_buckets(corpid, function_name, corp_rate, api_rate):
+            bucket_wait = bucket.reserve()
+            reserved.append((bucket, bucket_wait))
+            wait = max(wait, bucket_wait)
+        if wait > max_wait:
+            for bucket, bucket_wait in reserved:
+                bucket.cancel(bucket_wait)
+            error = WecomThrottledError(corpid, function_name, wait, max_wait)
+            _logger.warning(str(error))
+            raise error
+        return wait
+
+    @classmethod
+    def acquire(
+        cls,
+        corpid,
+        function_name,
+        corp_rate=DEFAULT_CORP_RATE,
+        api_rate=DEFAULT_API_RATE,
+        max_wait=DEFAULT_MAX_WAIT,
+    ):
+        """
+        等待企业和接口的令牌
+        :returns 实际等待的秒数
+        :raises WecomThrottledError: 需要等待的时间超过 max_wait，请求不应发送
+        """
+        wait = cls.reserve(corpid, function_name, corp_rate, api_rate, max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    @classmethod
+    def penalize(cls, corpid, function_name, corp_rate=DEFAULT_CORP_RATE, api_rate=DEFAULT_API_RATE):
+        """
+        收到 45009/45033 时降低速率并暂停
+        :returns 暂停的秒数
+        """
+        backoff = 0.0
+        for bucket in cls._get_buckets(corpid, function_name, corp_rate, api_rate):
+            backoff = max(backoff, bucket.penalize())
+        _logger.warning(
+            "WeCom API [%s] of corp [%s] hit the frequency limit, back off %.2f seconds.",
+            function_name,
+            corpid,
+            backoff,
+        )
+        return backoff
+
+    @classmethod
+    def reward(cls, corpid, function_name, corp_rate=DEFAULT_CORP_RATE, api_rate=DEFAULT_API_RATE):
+        for bucket in cls._get_buckets(corpid, function_name, corp_rate, api_rate):
+            bucket.reward()
+
+    @classmethod
+    def snapshot(cls):
+        """
+        当前进程所有令牌桶的状态，用于监控
+        """
+        with cls._lock:
+            buckets = list(cls._buckets.values())
+        return [bucket.snapshot() for bucket in buckets]
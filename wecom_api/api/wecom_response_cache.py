@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024  # 每个工作进程最多缓存的响应数
+DEFAULT_GENERATION_TTL = 2  # 复用已查询的失效代数的时长（秒），其他工作进程的失效最多延迟这么久生效
+ALL = "*"  # 失效范围：全部接口或接口的全部参数
+
+
+class WecomResponseCache(object):
+    """
+    企业微信API GET 响应的进程级缓存
+    LRU 淘汰，每条记录按接口的 TTL 过期；通讯录回调事件按企业、接口和参数精确失效。
+    键为 (corpid, secret, function_name, args)，不同应用的可见范围不同，按应用分别缓存。
+    其他工作进程的失效通过 wecom.api.cache.generation 的代数传递：写入时记录相关范围的代数，
+    读取时代数不同即视为未命中。
+    """
+
+    _lock = threading.Lock()
+    _entries = OrderedDict()
+    _generations = {}  # {(corpid, 失效范围): (过期时间, 失效代数)}
+    _pid = None
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def _check_fork(cls):
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._entries = OrderedDict()
+            cls._generations = {}
+            cls._pid = pid
+
+    @staticmethod
+    def make_key(corpid, secret, function_name, args):
+        return (
+            corpid,
+            secret,
+            function_name,
+            tuple(sorted((key, str(value)) for key, value in (args or {}).items())),
+        )
+
+    @staticmethod
+    def generation_scopes(function_name, args):
+        """
+        :returns 决定一条缓存是否有效的失效范围 [(函数名称, 参数范围)]
+        """
+        scopes = [(ALL, ALL), (function_name, ALL)]
+        scopes.extend(
+            (function_name, "%s=%s" % (key, value)) for key, value in (args or {}).items()
+        )
+        return scopes
+
+    @staticmethod
+    def invalidation_scopes(function_name=None, **args):
+        """
+        :returns 失效时需要递增代数的范围 [(函数名称, 参数范围)]，多个参数时分别递增，宁可多失效
+        """
+        if function_name is None:
+            return [(ALL, ALL)]
+        if not args:
+            return [(function_name, ALL)]
+        return [(function_name, "%s=%s" % (key, value)) for key, value in args.items()]
+
+    @classmethod
+    def get(cls, key, generation=None):
+        """
+        获取未过期的响应
+        :param generation: 当前的失效代数，与写入时不同说明已被其他工作进程失效
+        :returns 响应的副本，不存在、已过期或已失效时返回 None
+        """
+        with cls._lock:
+            cls._check_fork()
+            entry = cls._entries.get(key)
+            if entry is None:
+                cls.misses += 1
+                return None
+            if entry[0] <= time.monotonic() or entry[2] != generation:
+                del cls._entries[key]
+                cls.misses += 1
+                return None
+            cls._entries.move_to_end(key)
+            cls.hits += 1
+            response = entry[1]
+        return copy.deepcopy(response)
+
+    @classmethod
+    def set(cls, key, response, ttl, max_entries=DEFAULT_MAX_ENTRIES, generation=None):
+        """
+        写入响应
+        :param ttl: 有效时长（秒）
+        :param max_entries: 缓存上限，超出时淘汰最久未使用的记录
+        :param generation: 发送请求前读取的失效代数
+        """
+        if ttl <= 0 or max_entries <= 0:
+            return
+        response = copy.deepcopy(response)
+        with cls._lock:
+            cls._check_fork()
+            cls._entries[key] = (time.monotonic() + ttl, response, generation)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > max_entries:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def get_generation(cls, key):
+        """
+        :returns 未过期的已查询失效代数，不存在时返回 None
+        """
+        with cls._lock:
+            cls._check_fork()
+            entry = cls._generations.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    @classmethod
+    def set_generation(cls, key, generation, ttl, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        记录查询到的失效代数，ttl 秒内不再查询数据库
+        """
+        if ttl <= 0:
+            return
+        with cls._lock:
+            cls._check_fork()
+            if len(cls._generations) >= max_entries:
+                now = time.monotonic()
+                cls._generations = {
+                    key: entry for key, entry in cls._generations.items() if entry[0] > now
+                }
+                if len(cls._generations) >= max_entries:
+                    cls._generations = {}
+            cls._generations[key] = (time.monotonic() + ttl, generation)
+
+    @classmethod
+    def invalidate(cls, corpid, function_name=None, **args):
+        """
+        使当前进程的缓存失效，其他工作进程通过 wecom.api.cache.generation 失效
+        :param corpid: 企业ID
+        :param function_name: 函数名称，为空时失效该企业的全部缓存
+        :param args: 只失效请求参数包含这些键值的记录，例如 userid="zhangsan"
+        :returns 失效的记录数
+        """
+        match = {(key, str(value)) for key, value in args.items()}
+        with cls._lock:
+            cls._check_fork()
+            keys = [
+                key
+                for key in cls._entries
+                if key[0] == corpid
+                and (function_name is None or key[2] == function_name)
+                and match.issubset(key[3])
+            ]
+            for key in keys:
+                del cls._entries[key]
+        if keys:
+            _logger.debug(
+                "Invalidate %s cached WeCom responses of [%s] %s %s",
+                len(keys),
+                corpid,
+                function_name or "",
+                args or "",
+            )
+        return len(keys)
+
+    @staticmethod
+    def contact_event_scopes(change_type, data):
+        """
+        通讯录变更事件影响的缓存
+        :param change_type: 变更类型，例如 "update_user"
+        :param data: 回调消息的内容
+        :returns [(函数名称, 请求参数)]
+        """
+        scopes = []
+        if change_type in ("create_user", "update_user", "delete_user"):
+            for userid in {data.get("UserID"), data.get("NewUserID")}:
+                if userid:
+                    scopes.append(("USER_GET", {"userid": userid}))
+            if change_type == "delete_user":
+                scopes.append(("TAG_GET_MEMBER", {}))
+        elif change_type in ("create_party", "update_party", "delete_party"):
+            # 部门列表包含全部下级部门，任何部门变更都会影响上级部门的列表
+            scopes.append(("DEPARTMENT_LIST", {}))
+            if change_type == "delete_party":
+                scopes.append(("TAG_GET_MEMBER", {}))
+        elif change_type == "update_tag":
+            if data.get("TagId"):
+                scopes.append(("TAG_GET_MEMBER", {"tagid": data.get("TagId")}))
+            scopes.append(("TAG_GET_LIST", {}))
+        return scopes
+
+    @classmethod
+    def invalidate_contact_event(cls, corpid, change_type, data):
+        """
+        根据通讯录变更事件失效当前进程的相关缓存
+        """
+        for function_name, args in cls.contact_event_scopes(change_type, data):
+            cls.invalidate(corpid, function_name, **args)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries = OrderedDict()
+            cls._generations = {}
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            return {
+                "entries": len(cls._entries),
+                "hits": cls.hits,
+                "misses": cls.misses,
+            }
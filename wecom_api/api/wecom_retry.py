@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import time
+import random
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+SYSTEM_BUSY_CODES = (-1,)  # 系统繁忙，稍后重试
+
+DEFAULT_MAX_RETRIES = 3  # 最多重试次数
+DEFAULT_BASE_DELAY = 0.5  # 首次重试的最大等待时间（秒）
+DEFAULT_MAX_DELAY = 8.0  # 单次重试的最大等待时间（秒）
+DEFAULT_DEADLINE = 30.0  # 包括重试在内的总时长上限（秒）
+
+
+class WecomTransientError(Exception):
+    """
+    可重试的临时错误，例如 GET 请求返回 HTTP 5xx
+    """
+
+
+class WecomRetryPolicy(object):
+    """
+    企业微信API 的重试策略
+    GET 请求对连接错误、超时、HTTP 5xx 重试；POST 请求可能已被企业微信执行，只对连接阶段的错误重试。
+    企业微信系统繁忙（-1）按指数退避重试，
+    每次等待时间在 [0, min(max_delay, base_delay * 2^n)] 之间随机（full jitter），
+    总时长不超过 deadline。
+    """
+
+    def __init__(
+        self,
+        max_retries=DEFAULT_MAX_RETRIES,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+        deadline=DEFAULT_DEADLINE,
+    ):
+        self.max_retries = int(max_retries)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.deadline = float(deadline)
+
+    def start(self):
+        """
+        开始一次调用
+        :returns 截止时间
+        """
+        return time.monotonic() + self.deadline
+
+    def is_retryable_error(self, error, method):
+        """
+        判断异常是否可以重试
+        请求体发出后连接被重置、读取超时或返回 HTTP 5xx 时，写操作可能已被处理，
+        重试会重复发送消息、重复增删成员，因此 POST 请求只在连接建立失败时重试
+        """
+        if method == "GET":
+            return isinstance(
+                error,
+                (
+                    WecomTransientError,
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                ),
+            )
+        return self.is_connect_error(error)
+
+    @staticmethod
+    def is_connect_error(error):
+        """
+        判断是否为连接阶段的错误，此时请求尚未发出
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if not isinstance(error, requests.exceptions.ConnectionError) or isinstance(
+            error, requests.exceptions.SSLError
+        ):
+            return False
+        reason = error.args[0] if error.args else None
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        return isinstance(reason, NewConnectionError)
+
+    @staticmethod
+    def is_retryable_response(response):
+        return response.get("errcode") in SYSTEM_BUSY_CODES
+
+    def delay(self, attempt, deadline):
+        """
+        第 attempt 次重试前需要等待的秒数
+        :returns 不能继续重试时返回 None
+        """
+        if attempt > self.max_retries:
+            return None
+        delay = random.uniform(
+            0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        )
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
+
+    def backoff(self, attempt, deadline):
+        """
+        第 attempt 次重试前等待
+        :returns 是否可以继续重试
+        """
+        delay = self.delay(attempt, deadline)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
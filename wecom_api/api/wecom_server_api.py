@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import json
+import random
+import hashlib
 import requests
 from datetime import datetime, timedelta
 from odoo import api, fields, models, SUPERUSER_ID, _
+from .wecom_token_cache import WecomTokenCache
+from .wecom_async_client import run_batch
 
 # from .wecom_abstract_api import ApiException
 
@@ -25,49 +29,193 @@ class WecomServerApi(models.TransientModel):
     def InitServiceApi(self, corpid, secret):
         """
         初始化企业微信API 对象
+        令牌在进程缓存中且未到刷新时间时，直接返回内存中的记录，不访问数据库；
+        否则通过 _refresh_token_coordinated 读取或刷新令牌。
         :param corpid : 企业ID
         :param secret : 应用密钥
         :returns 模型"wecom.service_api"对象
         """
-        api = self.search(
-            [
-                ("corpid", "=", corpid),
-                ("secret", "=", secret),
-            ],
-            limit=1,
-        )
-        if not api:
-            # 创建API令牌记录
-            api = self.sudo().create(
-                {
-                    "corpid": corpid,
-                    "secret": secret,
-                }
+        access_token, token_expiration_time = WecomTokenCache.get(corpid, secret)
+        if not access_token:
+            access_token, token_expiration_time = self._refresh_token_coordinated(
+                corpid, secret
             )
-        if api["access_token"] is False or api["access_token"] == "":    # type: ignore
-            # token为空，刷新API令牌记录
-            api.refreshAccessToken()     # type: ignore
-        if (
-            api["token_expiration_time"] is False    # type: ignore
-            or api["token_expiration_time"] < datetime.now()     # type: ignore
-        ):
-            # token过期，刷新API令牌记录
-            api.refreshAccessToken()     # type: ignore
-
-        return api
+        return self._new_service_api(
+            corpid, secret, access_token, token_expiration_time
+        )
+
+    @api.model
+    def _new_service_api(self, corpid, secret, access_token, token_expiration_time):
+        """
+        构建仅存在于内存中的API 对象
+        """
+        return self.new(
+            {
+                "corpid": corpid,
+                "secret": secret,
+                "access_token": access_token,
+                "token_expiration_time": token_expiration_time,
+            }
+        )
+
+    def get_corpid(self):
+        return self.corpid
+
+    def get_secret(self):
+        return self.secret
 
     def getAccessToken(self):
         """
         获取令牌
         """
-        if self.access_token is None:
+        if not self.access_token:
             self.refreshAccessToken()
         return self.access_token
 
     def refreshAccessToken(self):
         """
         刷新模型 'wecom.service_api' 的令牌
-        同时刷新发起请求的模型 'wecom.apps' 的令牌
+        当前令牌被企业微信拒绝时调用，其他线程或工作进程已刷新的令牌会被直接复用
+        """
+        access_token, token_expiration_time = self._refresh_token_coordinated(
+            self.corpid, self.secret, stale_token=self.access_token
+        )
+        if self.id:
+            # 数据库记录已在独立事务中更新
+            self.invalidate_recordset()
+        else:
+            self.update(
+                {
+                    "access_token": access_token,
+                    "token_expiration_time": token_expiration_time,
+                }
+            )
+
+    @api.model
+    def _refresh_token_coordinated(self, corpid, secret, stale_token=None):
+        """
+        协调刷新令牌
+        进程内由 WecomTokenCache 的刷新锁保证只有一个线程刷新；
+        进程间由 PostgreSQL 咨询锁保证只有一个工作进程请求 GET_ACCESS_TOKEN，
+        其余工作进程等待锁释放后读取数据库中的新令牌。
+        :param stale_token : 已被企业微信拒绝的令牌，不会被复用
+        :returns (access_token, token_expiration_time)
+        """
+        with WecomTokenCache.refresh_lock(corpid, secret):
+            # 等待锁期间，其他线程可能已经刷新了令牌
+            access_token, token_expiration_time = WecomTokenCache.get(corpid, secret)
+            if access_token and access_token != stale_token:
+                return access_token, token_expiration_time
+
+            # 使用独立的游标，令牌的读写不受调用方事务的影响
+            with self.env.registry.cursor() as cr:
+                vals, fetched = (
+                    self.env(cr=cr, su=True)[self._name]
+                    ._refresh_token_locked(corpid, secret, stale_token)
+                )
+
+        if fetched:
+            self._write_app_token(corpid, secret, vals)
+        return vals["access_token"], vals["token_expiration_time"]
+
+    @api.model
+    def _refresh_token_locked(self, corpid, secret, stale_token):
+        """
+        持有咨询锁读取或刷新令牌
+        :returns (令牌值, 是否向企业微信请求了新令牌)
+        """
+        cr = self.env.cr
+        lock_key = self._get_token_lock_key(corpid, secret)
+        cr.execute("SELECT pg_advisory_lock(%s)", (lock_key,))
+        try:
+            # 提交以开始新的事务快照，读取其他工作进程已提交的令牌
+            cr.commit()
+            api = self.search(
+                [("corpid", "=", corpid), ("secret", "=", secret)],
+                order="token_expiration_time desc",
+                limit=1,
+            )
+            fetched = False
+            if api and self._is_token_reusable(api, stale_token):
+                vals = {
+                    "access_token": api.access_token,  # type: ignore
+                    "token_expiration_time": api.token_expiration_time,  # type: ignore
+                }
+            else:
+                if not api:
+                    # 创建API令牌记录
+                    api = self.create({"corpid": corpid, "secret": secret})
+                vals = api._fetch_access_token()  # type: ignore
+                fetched = True
+                cr.commit()
+
+            WecomTokenCache.set(
+                corpid,
+                secret,
+                vals["access_token"],
+                vals["token_expiration_time"],
+                refresh_at=self._get_token_refresh_at(vals["token_expiration_time"]),
+            )
+        finally:
+            cr.rollback()
+            cr.execute("SELECT pg_advisory_unlock(%s)", (lock_key,))
+        return vals, fetched
+
+    @api.model
+    def _get_token_lock_key(self, corpid, secret):
+        """
+        根据 (corpid, secret) 生成 PostgreSQL 咨询锁的 bigint 键
+        """
+        digest = hashlib.sha1(
+            ("wecom.service_api:%s:%s" % (corpid, secret)).encode("utf-8")
+        ).digest()
+        return int.from_bytes(digest[:8], "big", signed=True)
+
+    @api.model
+    def _get_token_refresh_options(self):
+        """
+        获取令牌提前刷新参数（秒）
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        return (
+            int(ir_config.get_param("wecom.token_refresh_margin", 300)),
+            int(ir_config.get_param("wecom.token_refresh_jitter", 120)),
+            int(ir_config.get_param("wecom.token_refresh_min_interval", 60)),
+        )
+
+    @api.model
+    def _get_token_refresh_at(self, token_expiration_time):
+        """
+        计算令牌的提前刷新时间
+        在过期前 margin 秒加上随机抖动开始刷新，避免所有工作进程同时刷新；
+        企业微信在令牌有效期内重复获取会返回相同的令牌，因此两次刷新至少间隔 min_interval 秒。
+        """
+        margin, jitter, min_interval = self._get_token_refresh_options()
+        refresh_at = token_expiration_time - timedelta(
+            seconds=margin + random.uniform(0, jitter)
+        )
+        return max(refresh_at, datetime.now() + timedelta(seconds=min_interval))
+
+    @api.model
+    def _is_token_reusable(self, api, stale_token):
+        """
+        判断数据库中的令牌是否可以直接使用，无需请求企业微信
+        """
+        if not api.access_token or api.access_token == stale_token:
+            return False
+        now = datetime.now()
+        if not api.token_expiration_time or api.token_expiration_time <= now:
+            return False
+        margin, jitter, min_interval = self._get_token_refresh_options()
+        if api.token_expiration_time - now > timedelta(seconds=margin):
+            return True
+        # 进入提前刷新窗口，但其他工作进程刚刚刷新过
+        return api.write_date > fields.Datetime.now() - timedelta(seconds=min_interval)
+
+    def _fetch_access_token(self):
+        """
+        向企业微信请求新令牌并写入记录
+        :returns 令牌值
         """
         response = self.httpCall(    # type: ignore
             self.env["wecom.service_api_list"].get_server_api_call("GET_ACCESS_TOKEN"),
@@ -81,20 +229,70 @@ class WecomServerApi(models.TransientModel):
         }
 
         self.sudo().write(dict)
+        return dict
 
-        # 写对应的应用的值
+    @api.model
+    def _write_app_token(self, corpid, secret, vals):
+        """
+        同时刷新发起请求的模型 'wecom.apps' 的令牌
+        """
         compay_id = self.env["res.company"].search(
-            [("corpid", "=", self.corpid)], limit=1
+            [("corpid", "=", corpid)], limit=1
         )
         app_id = self.env["wecom.apps"].search(
-            [("company_id", "=", compay_id.id), ("secret", "=", self.secret)], limit=1
+            [("company_id", "=", compay_id.id), ("secret", "=", secret)], limit=1
         )
 
-        app_id.sudo().write(dict)
+        app_id.sudo().write(vals)
 
-    def get_api_debug(self):
+    def asyncCallMany(self, function_name, argsList, max_concurrency=None, timeout=None):
         """
-        获取 API 调试模式
+        使用 asyncio 客户端批量调用同一个API，同步等待全部结果
+        适用于成千上万次的扇出请求；令牌在调用线程中准备好，批量请求期间令牌过期时
+        通过 _refresh_token_coordinated 在独立的游标中协调刷新；限流、重试和熔断与 httpCall 相同。
+        :param function_name : 函数名称
+        :param argsList : 请求参数列表
+        :param max_concurrency : 最大并发数，默认读取参数 "wecom.http_max_concurrency"
+        :param timeout : 整批请求的超时时间（秒）
+        :returns 与 argsList 顺序一致的结果列表，失败的请求对应的是 ApiException 对象
         """
-        ir_config = self.env["ir.config_parameter"].sudo()
-        return True if ir_config.get_param("wecom.debug_enabled") == "True" else False
+        if not argsList:
+            return []
+        if not max_concurrency:
+            max_concurrency = int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("wecom.http_max_concurrency", 8)
+            )
+        self.getAccessToken()
+        options = self.get_http_options()
+        corpid, secret = self.corpid, self.secret
+        registry, uid, context = self.env.registry, self.env.uid, self.env.context
+
+        def refresh_token(stale_token):
+            # 在事件循环的线程池中执行，不能使用调用线程的游标
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                access_token, token_expiration_time = env[
+                    self._name
+                ]._refresh_token_coordinated(corpid, secret, stale_token=stale_token)
+            return access_token
+
+        return run_batch(
+            corpid,
+            secret,
+            self.env["wecom.service_api_list"]._get_server_api_routes(),
+            refresh_token,
+            function_name,
+            argsList,
+            timeout=timeout,
+            request_options={
+                function_name: self.get_request_options(
+                    self.env["wecom.service_api_list"].get_server_api_call(function_name)
+                )
+            },
+            max_concurrency=max_concurrency,
+            connect_timeout=options["connect_timeout"],
+            read_timeout=options["read_timeout"],
+            keep_alive=options["keep_alive"],
+        )
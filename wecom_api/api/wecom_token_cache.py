@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from datetime import datetime
+
+
+class WecomTokenCache(object):
+    """
+    企业微信访问令牌的进程级缓存
+    按 (corpid, secret) 缓存令牌及其过期时间，令牌有效期内无需访问数据库；
+    同一进程内的并发刷新通过每个键独立的锁合并为一次请求（single-flight）。
+    每个令牌另存一个提前刷新时间，到达该时间后视为需要刷新。
+    """
+
+    _lock = threading.Lock()
+    _tokens = {}
+    _refresh_locks = {}
+    _pid = None
+
+    @classmethod
+    def _check_fork(cls):
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._tokens = {}
+            cls._refresh_locks = {}
+            cls._pid = pid
+
+    @classmethod
+    def get(cls, corpid, secret):
+        """
+        获取未到刷新时间的令牌
+        :returns (access_token, token_expiration_time)，不存在或需要刷新时返回 (None, None)
+        """
+        with cls._lock:
+            cls._check_fork()
+            entry = cls._tokens.get((corpid, secret))
+        if entry and entry[2] > datetime.now():
+            return entry[0], entry[1]
+        return None, None
+
+    @classmethod
+    def set(cls, corpid, secret, access_token, token_expiration_time, refresh_at=None):
+        """
+        写入令牌
+        :param refresh_at: 提前刷新时间，默认为令牌过期时间
+        """
+        if not access_token or not token_expiration_time:
+            return
+        if refresh_at is None or refresh_at > token_expiration_time:
+            refresh_at = token_expiration_time
+        with cls._lock:
+            cls._check_fork()
+            cls._tokens[(corpid, secret)] = (
+                access_token,
+                token_expiration_time,
+                refresh_at,
+            )
+
+    @classmethod
+    def invalidate(cls, corpid, secret, access_token=None):
+        """
+        使令牌失效
+        :param access_token: 仅当缓存中的令牌与之相同时才失效，避免覆盖其他线程刚刷新的令牌
+        """
+        with cls._lock:
+            cls._check_fork()
+            entry = cls._tokens.get((corpid, secret))
+            if entry and (access_token is None or entry[0] == access_token):
+                del cls._tokens[(corpid, secret)]
+
+    @classmethod
+    def clear(cls):
+        """
+        清空当前进程缓存的全部令牌，例如切换 API 服务地址后
+        """
+        with cls._lock:
+            cls._check_fork()
+            cls._tokens = {}
+
+    @classmethod
+    def refresh_lock(cls, corpid, secret):
+        """
+        获取 (corpid, secret) 的刷新锁，同一进程内同时只有一个线程刷新令牌
+        """
+        with cls._lock:
+            cls._check_fork()
+            lock = cls._refresh_locks.get((corpid, secret))
+            if lock is None:
+                lock = cls._refresh_locks[(corpid, secret)] = threading.Lock()
+        return lock
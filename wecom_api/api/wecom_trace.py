@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 1.0  # 成功请求的采样比例，失败的请求总是记录
+DEFAULT_BUFFER_SIZE = 500  # 每个工作进程保留的跟踪记录数
+
+# access_token、suite_access_token、provider_access_token、corpsecret 等敏感参数
+SECRET_PARAMS = re.compile(r"(\w*(?:access_token|secret|ticket))=[^&#]*", re.I)
+
+
+def redact_url(url):
+    """
+    隐藏 URL 中的令牌和密钥
+    """
+    return SECRET_PARAMS.sub(r"\1=***", url or "")
+
+
+class WecomTracer(object):
+    """
+    企业微信API 的进程内跟踪记录
+    每次 HTTP 往返生成一条结构化记录（接口、耗时、错误码、收发字节数），令牌和密钥已隐藏，
+    保存在固定大小的环形缓冲区中，供管理员导出。开关和采样比例由调用方传入，不访问数据库。
+    """
+
+    _lock = threading.Lock()
+    _records = deque(maxlen=DEFAULT_BUFFER_SIZE)
+    _pid = None
+
+    @classmethod
+    def _check_fork(cls, buffer_size):
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._records = deque(maxlen=buffer_size)
+            cls._pid = pid
+        elif cls._records.maxlen != buffer_size:
+            cls._records = deque(cls._records, maxlen=buffer_size)
+
+    @classmethod
+    def record_attempt(
+        cls,
+        settings,
+        function_name,
+        method,
+        url,
+        attempt,
+        duration,
+        bytes_sent=0,
+        http_response=None,
+        response=None,
+        error=None,
+    ):
+        """
+        记录一次 HTTP 往返
+        :param settings: (是否启用, 采样比例, 缓冲区大小)，见 wecom.abstract_api._get_trace_settings
+        :param attempt: 第几次发送，从 0 开始
+        :param duration: 耗时（秒）
+        """
+        if not settings or not settings[0]:
+            return
+        enabled, sample_rate, buffer_size = settings
+        errcode = response.get("errcode") if isinstance(response, dict) else None
+        failed = error is not None or errcode not in (0, None)
+        if not failed and random.random() >= sample_rate:
+            return
+
+        record = {
+            "time": datetime.utcnow().isoformat(),
+            "pid": os.getpid(),
+            "function_name": function_name,
+            "method": method,
+            "url": redact_url(url),
+            "attempt": attempt,
+            "duration_ms": round(duration * 1000, 3),
+            "status": http_response.status_code if http_response is not None else None,
+            "errcode": errcode,
+            "errmsg": response.get("errmsg") if failed and isinstance(response, dict) else None,
+            "error": redact_url(repr(error)) if error is not None else None,
+            "bytes_sent": bytes_sent,
+            "bytes_received": len(http_response.content)
+            if http_response is not None
+            else 0,
+        }
+        with cls._lock:
+            cls._check_fork(buffer_size)
+            cls._records.append(record)
+        _logger.debug("WeCom API trace: %s", record)
+
+    @classmethod
+    def dump(cls):
+        """
+        当前进程的全部跟踪记录，按时间先后排列
+        """
+        with cls._lock:
+            return list(cls._records)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._records.clear()
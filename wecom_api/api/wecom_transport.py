@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_CONNECTIONS = 4  # 每个 Session 缓存的连接池数量
+DEFAULT_POOL_MAXSIZE = 16  # 每个连接池保持的最大连接数
+DEFAULT_CONNECT_TIMEOUT = 5.0  # 建立连接的超时时间（秒）
+DEFAULT_READ_TIMEOUT = 30.0  # 读取响应的超时时间（秒）
+
+
+class WecomHttpTransport(object):
+    """
+    企业微信 HTTP 传输层
+    每个工作进程按 base url 维护一个持久化的 requests.Session，
+    复用 keep-alive 连接，避免每次 API 调用都重新建立 TLS 连接。
+    """
+
+    _lock = threading.Lock()
+    _sessions = {}
+    _pid = None
+    replay = None  # 回放录制的响应，见 wecom_cassette.use_cassette
+
+    @classmethod
+    def _base_url(cls, url):
+        parts = urlsplit(url)
+        return "%s://%s" % (parts.scheme, parts.netloc)
+
+    @classmethod
+    def _check_fork(cls):
+        """
+        prefork 模式下，子进程不能复用父进程的套接字，进程号变化时丢弃已有的 Session
+        """
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._sessions = {}
+            cls._pid = pid
+
+    @classmethod
+    def get_session(
+        cls,
+        url,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        keep_alive=True,
+    ):
+        """
+        获取 url 对应的持久化 Session
+        :param url: 请求地址，按 scheme + host 归并
+        :param pool_connections: 连接池数量
+        :param pool_maxsize: 每个连接池的最大连接数
+        :param keep_alive: 是否保持长连接
+        :returns requests.Session
+        """
+        base_url = cls._base_url(url)
+        key = (base_url, pool_connections, pool_maxsize, keep_alive)
+        with cls._lock:
+            cls._check_fork()
+            session = cls._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=pool_connections,
+                    pool_maxsize=pool_maxsize,
+                    max_retries=0,
+                    pool_block=False,
+                )
+                session.mount(base_url, adapter)
+                if not keep_alive:
+                    session.headers["Connection"] = "close"
+                cls._sessions[key] = session
+                _logger.debug(
+                    "Create WeCom HTTP session for %s, pool size: %s",
+                    base_url,
+                    pool_maxsize,
+                )
+        return session
+
+    @classmethod
+    def request(cls, method, url, options=None, **kwargs):
+        """
+        通过连接池发送请求
+        :param method: 请求方式（"GET" or "POST"）
+        :param url: 请求地址
+        :param options: 连接池参数，见 WecomHttpTransport.get_session，以及 connect_timeout/read_timeout
+        :returns requests.Response
+        """
+        if cls.replay is not None:
+            return cls.replay.request(method, url, options, **kwargs)
+        options = options or {}
+        session = cls.get_session(
+            url,
+            pool_connections=options.get("pool_connections", DEFAULT_POOL_CONNECTIONS),
+            pool_maxsize=options.get("pool_maxsize", DEFAULT_POOL_MAXSIZE),
+            keep_alive=options.get("keep_alive", True),
+        )
+        kwargs.setdefault(
+            "timeout",
+            (
+                options.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+                options.get("read_timeout", DEFAULT_READ_TIMEOUT),
+            ),
+        )
+        return session.request(method, url, **kwargs)
+
+    @classmethod
+    def close_all(cls):
+        """
+        关闭当前进程的全部 Session
+        """
+        with cls._lock:
+            for session in cls._sessions.values():
+                session.close()
+            cls._sessions = {}
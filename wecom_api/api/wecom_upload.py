@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import hashlib
+
+DEFAULT_CHUNK_SIZE = 64 * 1024  # 每次读取的最大字节数
+
+# 文件头标识，用于在上传时校验文件内容与扩展名是否一致
+MAGIC_NUMBERS = {
+    ".jpg": (b"\xff\xd8\xff",),
+    ".jpeg": (b"\xff\xd8\xff",),
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".amr": (b"#!AMR",),
+}
+
+
+class WecomUploadError(ValueError):
+    """
+    上传的文件不符合要求
+    """
+
+
+class WecomUploadStream(object):
+    """
+    上传文件的只读流
+    包装 ir.attachment 文件存储中的文件对象，MultipartEncoder 按块读取，每次最多 chunk_size 字节，
+    不会把整个文件载入内存；读取的同时统计大小、计算 MD5，并校验文件头和大小上限。
+    """
+
+    HEAD_SIZE = 8  # 校验文件头需要的字节数
+
+    def __init__(
+        self,
+        fileobj,
+        size,
+        max_size=None,
+        extension=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+    ):
+        """
+        :param fileobj: 以二进制模式打开的文件对象
+        :param size: 文件大小（字节）
+        :param max_size: 允许的最大字节数
+        :param extension: 文件扩展名，用于校验文件头，例如 ".png"
+        """
+        if max_size and size > max_size:
+            raise WecomUploadError(
+                "File size %s exceeds the limit of %s bytes" % (size, max_size)
+            )
+        self.fileobj = fileobj
+        self.size = size
+        self.max_size = max_size
+        self.magic = MAGIC_NUMBERS.get((extension or "").lower())
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.head = b""
+        self.md5 = hashlib.md5()
+        if self.magic:
+            # 发送前校验文件头，不符合时不发起请求
+            head = fileobj.read(self.HEAD_SIZE)
+            fileobj.seek(0)
+            if not any(head.startswith(magic) for magic in self.magic):
+                raise WecomUploadError("File content does not match its extension")
+
+    @classmethod
+    def from_path(cls, path, **kwargs):
+        fileobj = open(path, "rb")
+        try:
+            return cls(fileobj, os.fstat(fileobj.fileno()).st_size, **kwargs)
+        except Exception:
+            fileobj.close()
+            raise
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        return cls(io.BytesIO(data), len(data), **kwargs)
+
+    @property
+    def len(self):
+        """
+        剩余的字节数，MultipartEncoder 据此计算 Content-Length
+        """
+        return self.size - self.bytes_read
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = self.fileobj.read(size)
+        if not chunk:
+            if self.bytes_read != self.size:
+                raise WecomUploadError(
+                    "File was truncated while uploading: %s of %s bytes"
+                    % (self.bytes_read, self.size)
+                )
+            return chunk
+        if self.magic and len(self.head) < self.HEAD_SIZE:
+            self.head += chunk[: self.HEAD_SIZE - len(self.head)]
+            if len(self.head) >= min(self.HEAD_SIZE, self.size) and not any(
+                self.head.startswith(magic) for magic in self.magic
+            ):
+                raise WecomUploadError("File content does not match its extension")
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.size or (
+            self.max_size and self.bytes_read > self.max_size
+        ):
+            raise WecomUploadError("File grew while uploading")
+        self.md5.update(chunk)
+        return chunk
+
+    def rewind(self):
+        """
+        回到文件开头并重置统计，重试时用同一个文件生成新的请求体
+        """
+        self.fileobj.seek(0)
+        self.bytes_read = 0
+        self.head = b""
+        self.md5 = hashlib.md5()
+
+    def hexdigest(self):
+        return self.md5.hexdigest()
+
+    def close(self):
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -4,8 +4,6 @@ import json
 import logging
 import xml.etree.cElementTree as ET
 from lxml import etree
-import sys
-from odoo.addons.wecom_api.api.wecom_msg_crtpt import WecomMsgCrypt  # type: ignore
 from odoo import http, models, fields, _
 from odoo.http import request
 from odoo.http import Response
@@ -41,32 +39,21 @@ class StripeController(http.Controller):
         :param service: 回调服务名称 code
         文档URL: https://work.weixin.qq.com/api/doc/90000/90135/90930#3.2%20%E6%94%AF%E6%8C%81Http%20Post%E8%AF%B7%E6%B1%82%E6%8E%A5%E6%94%B6%E4%B8%9A%E5%8A%A1%E6%95%B0%E6%8D%AE
         """
-        company_id = request.env["res.company"].sudo().search([("id", "=", id)])     # type: ignore
-        sCorpID = company_id.corpid
-
-        callback_service = (
-            company_id.contacts_app_id.app_callback_service_ids.sudo().search(
-                [
-                    ("app_id", "=", company_id.contacts_app_id.id),
-                    ("code", "=", service),
-                    "|",
-                    ("active", "=", True),
-                    ("active", "=", False),
-                ]
-            )
+        # 服务、Token、解码后的密钥和加解密对象按 (公司, 服务代码) 缓存，回调服务变更时失效
+        context = (
+            request.env["wecom.app_callback_service"]  # type: ignore
+            .sudo()
+            ._get_callback_context(id, service)
         )
-        if callback_service.active is False:
+        if not context or not context[1]:
             _logger.info(
                 _("App [%s] does not have service [%s] enabled")
-                % (company_id.contacts_app_id.name, callback_service.name)
+                % (context[2] if context else "", context[3] if context else service)
             )
             return Response("success", status=200)
         else:
-            wxcpt = WecomMsgCrypt(
-                callback_service.callback_url_token,
-                callback_service.callback_aeskey,
-                sCorpID,
-            )
+            wxcpt = context[4]
+            company_id = request.env["res.company"].sudo().browse(id)     # type: ignore
 
             # 获取企业微信发送的相关参数
             sVerifyMsgSig = kw["msg_signature"]
@@ -88,8 +75,8 @@ class StripeController(http.Controller):
                     sVerifyMsgSig, sVerifyTimeStamp, sVerifyNonce, sVerifyEchoStr
                 )
                 if ret != 0:
-                    logging.error("ERR: VerifyURL ret: " + str(ret))
-                    sys.exit(1)
+                    _logger.error("ERR: VerifyURL ret: %s", ret)
+                    return Response("fail", status=400)
                 return msg
 
             if request.httprequest.method == "POST":     # type: ignore
@@ -109,23 +96,14 @@ class StripeController(http.Controller):
                     sReqData, sVerifyMsgSig, sVerifyTimeStamp, sVerifyNonce
                 )
                 if ret != 0:
-                    logging.error("ERR: DecryptMsg ret: " + str(ret))
-                    sys.exit(1)
+                    # 签名错误、无法解析（例如包含 DOCTYPE 或实体声明）的请求直接拒绝
+                    _logger.error("ERR: DecryptMsg ret: %s", ret)
+                    return Response("fail", status=400)
                 # 解密成功，msg即明文的xml消息结构体
-                # xml_tree = etree.fromstring(msg)  # xml解析为一个xml元素
-                # print("解密成功", msg)
-                try:
-                    return (
-                        request.env["wecom.app.event_type"]      # type: ignore
-                        .sudo()
-                        .with_context(xml_tree=msg, company_id=company_id)
-                        .handle_event()
-                    )  # 传递xml元素和公司
-                except:
-                    pass
-                finally:
-                    # ^ 正确响应企业微信本次的POST请求，企业微信将不会再次发送请求
-                    # ^ ·企业微信服务器在五秒内收不到响应会断掉连接，并且重新发起请求，总共重试三次
-                    # ^ ·当接收成功后，http头部返回200表示接收ok，其他错误码企业微信后台会一律当做失败并发起重试
-                    # return Response("success", status=200)
-                    pass
+                # 只写入回调收件箱，由定时任务处理事件，立即响应企业微信
+                # ^ ·企业微信服务器在五秒内收不到响应会断掉连接，并且重新发起请求，总共重试三次
+                # ^ ·当接收成功后，http头部返回200表示接收ok，其他错误码企业微信后台会一律当做失败并发起重试
+                request.env["wecom.app.callback.inbox"].sudo().receive(  # type: ignore
+                    company_id, service, msg
+                )
+                return Response("success", status=200)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import hmac
+import logging
+
+from odoo import http
+from odoo.http import request, Response
+
+_logger = logging.getLogger(__name__)
+
+
+class WecomMetricsController(http.Controller):
+    @http.route(
+        "/wecom_api/metrics",
+        type="http",
+        auth="public",
+        methods=["GET"],
+        csrf=False,
+        save_session=False,
+    )
+    def WecomApiMetrics(self, token=None, **kw):
+        """
+        以 Prometheus 文本格式导出企业微信API 指标
+        需要设置参数 "wecom.metrics_token"，请求时通过 ?token= 或 Authorization: Bearer 传入
+        """
+        expected = (
+            request.env["ir.config_parameter"]  # type: ignore
+            .sudo()
+            .get_param("wecom.metrics_token")
+        )
+        if not expected:
+            return Response("Not Found", status=404)
+
+        authorization = request.httprequest.headers.get("Authorization", "")  # type: ignore
+        if not token and authorization.startswith("Bearer "):
+            token = authorization[len("Bearer "):]
+        if not token or not hmac.compare_digest(str(token), str(expected)):
+            return Response("Forbidden", status=403)
+
+        body = request.env["wecom.api.metrics"].sudo().get_prometheus_text()  # type: ignore
+        return Response(
+            body,
+            status=200,
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
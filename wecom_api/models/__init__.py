@@ -3,3 +3,6 @@
 
 from . import wecom_server_api_error
 from . import wecom_server_api_list
+from . import wecom_api_metrics
+from . import wecom_api_outbox
+from . import wecom_api_cache_generation
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+from odoo.addons.wecom_api.api.wecom_response_cache import WecomResponseCache  # type: ignore
+
+GC_AFTER_DAYS = 1  # 失效代数的保留天数，远大于接口的缓存时长
+
+
+class WecomApiCacheGeneration(models.Model):
+    """
+    响应缓存的失效代数
+    响应缓存保存在每个工作进程的内存中，失效时在此递增对应范围的代数，事务提交后在单独的短事务中递增，
+    不与回调、发件箱的事务争用同一行；读取缓存前查询相关范围的代数，与写入缓存时不同说明已被失效。
+    范围为 (函数名称, "参数=值")，"*" 表示全部接口或接口的全部参数。
+    """
+
+    _name = "wecom.api.cache.generation"
+    _description = "Wecom API Response Cache Generation"
+    _log_access = False
+
+    corpid = fields.Char("Corp Id", required=True, readonly=True)
+    function_name = fields.Char("Request Function Name", required=True, readonly=True)
+    scope = fields.Char("Scope", required=True, readonly=True)
+    generation = fields.Integer("Generation", readonly=True, default=0)
+    bumped_date = fields.Datetime("Bumped Date", readonly=True, index=True)
+
+    _sql_constraints = [
+        (
+            "scope_uniq",
+            "unique (corpid, function_name, scope)",
+            "The cache generation scope must be unique!",
+        ),
+    ]
+
+    @api.model
+    def get_generation(self, corpid, function_name, args, ttl=0):
+        """
+        :param ttl: 在当前进程中复用查询结果的时长（秒），0 表示每次查询
+        :returns 决定该请求的缓存是否有效的代数
+        """
+        scopes = tuple(WecomResponseCache.generation_scopes(function_name, args))
+        key = (corpid or "", scopes)
+        generation = WecomResponseCache.get_generation(key) if ttl > 0 else None
+        if generation is None:
+            self.env.cr.execute(
+                """
+                SELECT function_name, scope, generation FROM wecom_api_cache_generation
+                WHERE corpid = %s AND (function_name, scope) IN %s
+                """,
+                (corpid or "", scopes),
+            )
+            generation = frozenset(self.env.cr.fetchall())
+            WecomResponseCache.set_generation(key, generation, ttl)
+        return generation
+
+    @api.model
+    def invalidate(self, corpid, function_name=None, **args):
+        """
+        使所有工作进程的缓存失效，参数同 WecomResponseCache.invalidate
+        当前进程立即失效；其他工作进程在事务提交后递增代数时失效，事务回滚时不递增
+        :returns 当前进程失效的记录数
+        """
+        postcommit = self.env.cr.postcommit
+        pending = postcommit.data.get(self._name)
+        if pending is None:
+            pending = postcommit.data[self._name] = set()
+            postcommit.add(lambda: self._bump_generations(pending))
+        pending.update(
+            (corpid or "", scope_function, scope)
+            for scope_function, scope in WecomResponseCache.invalidation_scopes(
+                function_name, **args
+            )
+        )
+        return WecomResponseCache.invalidate(corpid, function_name, **args)
+
+    @api.model
+    def _bump_generations(self, scopes):
+        """
+        在单独的短事务中递增代数，按固定顺序加锁，避免并发递增时死锁
+        """
+        with self.pool.cursor() as cr:
+            for corpid, function_name, scope in sorted(scopes):
+                cr.execute(
+                    """
+                    INSERT INTO wecom_api_cache_generation
+                        (corpid, function_name, scope, generation, bumped_date)
+                    VALUES (%s, %s, %s, 1, now() at time zone 'UTC')
+                    ON CONFLICT (corpid, function_name, scope) DO UPDATE
+                    SET generation = wecom_api_cache_generation.generation + 1,
+                        bumped_date = EXCLUDED.bumped_date
+                    """,
+                    (corpid, function_name, scope),
+                )
+
+    @api.model
+    def invalidate_contact_event(self, corpid, change_type, data):
+        """
+        根据通讯录变更事件使所有工作进程的相关缓存失效
+        """
+        for function_name, args in WecomResponseCache.contact_event_scopes(change_type, data):
+            self.invalidate(corpid, function_name, **args)
+
+    @api.autovacuum
+    def _gc_stale(self):
+        """
+        删除长时间未递增的代数；删除后相关缓存只会多一次未命中
+        """
+        self.env.cr.execute(
+            """
+            DELETE FROM wecom_api_cache_generation
+            WHERE bumped_date < now() at time zone 'UTC' - %s * interval '1 day'
+            """,
+            (GC_AFTER_DAYS,),
+        )
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models, _
+from odoo.addons.wecom_api.api.wecom_metrics import (  # type: ignore
+    WecomMetrics,
+    LATENCY_BUCKETS,
+    format_bucket,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class WecomApiMetrics(models.Model):
+    _name = "wecom.api.metrics"
+    _description = "Wecom API Metrics"
+    _order = "function_name,metric,label"
+
+    function_name = fields.Char("Request Function Name", readonly=True, index=True)
+    metric = fields.Selection(
+        [
+            ("requests", "Requests"),  # 按错误码统计的请求数
+            ("latency_bucket", "Latency bucket"),  # 耗时直方图，label 为桶上限
+            ("latency_sum", "Latency sum"),  # 累计耗时（秒）
+            ("retries", "Retries"),  # 重试次数，label 为重试原因
+            ("token_refreshes", "Token refreshes"),  # 令牌过期后的刷新次数
+            ("cache_hits", "Cache hits"),  # 响应缓存命中次数
+            ("bytes_sent", "Bytes sent"),
+            ("bytes_received", "Bytes received"),
+        ],
+        string="Metric",
+        required=True,
+        readonly=True,
+    )
+    label = fields.Char("Label", readonly=True, default="")
+    value = fields.Float("Value", readonly=True, default=0)
+
+    _sql_constraints = [
+        (
+            "metric_uniq",
+            "unique (function_name, metric, label)",
+            "The metric is unique !",
+        ),
+    ]
+
+    @api.model
+    def flush_process_metrics(self):
+        """
+        将当前工作进程累计的指标增量写入数据库
+        使用独立游标和累加更新，多个工作进程并发写入互不覆盖，也不受调用方事务回滚的影响
+        """
+        values = WecomMetrics.drain()
+        if not values:
+            return
+        try:
+            with self.env.registry.cursor() as cr:
+                query = """
+                    INSERT INTO wecom_api_metrics (function_name, metric, label, value,
+                        create_uid, create_date, write_uid, write_date)
+                    VALUES (%s, %s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+                    ON CONFLICT (function_name, metric, label)
+                    DO UPDATE SET value = wecom_api_metrics.value + EXCLUDED.value,
+                        write_date = EXCLUDED.write_date
+                """
+                for (function_name, metric, label), value in sorted(values.items()):
+                    if value:
+                        cr.execute(
+                            query,
+                            (function_name, metric, label, value, self.env.uid, self.env.uid),
+                        )
+        except Exception as e:
+            WecomMetrics.restore(values)
+            _logger.warning(_("Failed to save WeCom API metrics: %s"), e)
+
+    @api.model
+    def get_prometheus_text(self):
+        """
+        以 Prometheus 文本格式导出数据库中的指标，以及当前进程尚未写入的增量
+        """
+        totals = defaultdict(float)
+        for res in self.sudo().search_read([], ["function_name", "metric", "label", "value"]):
+            totals[(res["function_name"] or "", res["metric"], res["label"] or "")] += res["value"]
+        for key, value in WecomMetrics.snapshot().items():
+            totals[key] += value
+
+        by_metric = defaultdict(dict)
+        for (function_name, metric, label), value in totals.items():
+            by_metric[metric][(function_name, label)] = value
+
+        def escape(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = []
+
+        def counter(metric, name, help_text, label_name=None):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s counter" % name)
+            for (function_name, label), value in sorted(by_metric[metric].items()):
+                labels = 'function="%s"' % escape(function_name)
+                if label_name:
+                    labels += ',%s="%s"' % (label_name, escape(label))
+                lines.append("%s{%s} %s" % (name, labels, repr(float(value))))
+
+        counter(
+            "requests", "wecom_api_requests_total", "WeCom API requests by errcode.", "errcode"
+        )
+
+        name = "wecom_api_request_duration_seconds"
+        lines.append("# HELP %s WeCom API request duration, including retries." % name)
+        lines.append("# TYPE %s histogram" % name)
+        functions = sorted(
+            {function_name for function_name, label in by_metric["latency_bucket"]}
+        )
+        for function_name in functions:
+            labels = 'function="%s"' % escape(function_name)
+            cumulative = 0.0
+            for bound in LATENCY_BUCKETS:
+                cumulative += by_metric["latency_bucket"].get(
+                    (function_name, format_bucket(bound)), 0.0
+                )
+                lines.append(
+                    '%s_bucket{%s,le="%s"} %s'
+                    % (name, labels, format_bucket(bound), repr(cumulative))
+                )
+            lines.append(
+                "%s_sum{%s} %s"
+                % (name, labels, repr(by_metric["latency_sum"].get((function_name, ""), 0.0)))
+            )
+            lines.append("%s_count{%s} %s" % (name, labels, repr(cumulative)))
+
+        counter("retries", "wecom_api_retries_total", "WeCom API retries by reason.", "reason")
+        counter(
+            "token_refreshes",
+            "wecom_api_token_refreshes_total",
+            "Access token refreshes after the token expired.",
+        )
+        counter("cache_hits", "wecom_api_cache_hits_total", "WeCom API response cache hits.")
+        counter("bytes_sent", "wecom_api_sent_bytes_total", "Request body bytes sent.")
+        counter(
+            "bytes_received", "wecom_api_received_bytes_total", "Response body bytes received."
+        )
+        return "\n".join(lines) + "\n"
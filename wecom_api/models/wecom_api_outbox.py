@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from datetime import timedelta
+from collections import OrderedDict, defaultdict
+
+from odoo import api, fields, models, _
+from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException  # type: ignore
+from odoo.addons.wecom_api.api.wecom_retry import SYSTEM_BUSY_CODES  # type: ignore
+from odoo.addons.wecom_api.api.wecom_circuit_breaker import CIRCUIT_OPEN_CODE  # type: ignore
+from odoo.addons.wecom_api.api.wecom_rate_limiter import THROTTLED_CODE  # type: ignore
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200  # 每批取出的意图数
+DEFAULT_MAX_ATTEMPTS = 5  # 最多发送次数，超过后标记为失败
+RETRY_BASE_DELAY = 60  # 首次重试的等待时间（秒），之后按 2^n 增长
+RETRY_MAX_DELAY = 3600  # 单次重试的最大等待时间（秒）
+
+# 网络错误、系统繁忙、熔断、本地限流、接口调用频率超限，稍后重试；其他错误码直接标记为失败
+RETRYABLE_CODES = set(SYSTEM_BUSY_CODES) | {-2, CIRCUIT_OPEN_CODE, THROTTLED_CODE, 45009, 45033}
+
+# 非幂等的接口只在请求确定没有被执行时重试（熔断、本地限流、频率超限），网络错误和系统繁忙时重试可能重复发送消息
+NON_IDEMPOTENT_FUNCTIONS = ("MESSAGE_SEND", "LINKEDCORP_MESSAGE_SEND", "EXTERNALCONTACT_MESSAGE_SEND")
+NOT_SENT_CODES = {CIRCUIT_OPEN_CODE, THROTTLED_CODE, 45009, 45033}
+
+# 增删标签成员的意图可以合并
+MEMBER_FUNCTIONS = ("TAG_ADD_MEMBER", "TAG_DELETE_MEMBER")
+
+# 发送时才展开为实际请求的意图，由来源记录的 _wecom_outbox_expand 生成请求，例如读取远程标签成员后比较增删
+EXPANDED_FUNCTIONS = ("TAG_SYNC_MEMBER",)
+
+# 写操作成功后需要失效的缓存：{函数名称: [(缓存的函数名称, 按此参数匹配)]}
+CACHE_INVALIDATIONS = {
+    "TAG_CREATE": [("TAG_GET_LIST", None)],
+    "TAG_UPDATE": [("TAG_GET_LIST", None)],
+    "TAG_DELETE": [("TAG_GET_LIST", None), ("TAG_GET_MEMBER", "tagid")],
+    "TAG_ADD_MEMBER": [("TAG_GET_MEMBER", "tagid")],
+    "TAG_DELETE_MEMBER": [("TAG_GET_MEMBER", "tagid")],
+}
+
+
+class WecomApiOutbox(models.Model):
+    """
+    企业微信写操作的发件箱
+    ORM 操作在同一事务中写入意图，事务提交后由定时任务分批发送；
+    同一 merge_key 的意图按顺序发送，连续的标签成员增删合并为一次 addtagusers/deltagusers，
+    随后的 TAG_DELETE 会取消之前尚未发送的标签更新和成员变更。
+    意图只记录所属的应用，应用密钥在发送时读取，不保存在发件箱中。
+    """
+
+    _name = "wecom.api.outbox"
+    _description = "Wecom API Outbox"
+    _order = "id"
+
+    company_id = fields.Many2one("res.company", string="Company", index=True, readonly=True)
+    corpid = fields.Char("Corp Id", required=True, readonly=True)
+    app_model = fields.Char("Application Model", readonly=True)
+    app_id = fields.Many2oneReference("Application", model_field="app_model", readonly=True)
+    function_name = fields.Char("Request Function Name", required=True, readonly=True, index=True)
+    payload = fields.Text("Payload", readonly=True)  # JSON
+    merge_key = fields.Char("Merge Key", readonly=True, index=True)
+    res_model = fields.Char("Resource Model", readonly=True)
+    res_id = fields.Many2oneReference("Resource ID", model_field="res_model", readonly=True)
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("done", "Done"),
+            ("merged", "Merged"),  # 已合并到其他意图，或被随后的删除取消
+            ("failed", "Failed"),
+        ],
+        string="Status",
+        required=True,
+        default="pending",
+        readonly=True,
+        index=True,
+    )
+    attempts = fields.Integer("Attempts", readonly=True, default=0)
+    next_attempt = fields.Datetime(
+        "Next Attempt", readonly=True, default=fields.Datetime.now, index=True
+    )
+    last_error = fields.Text("Last Error", readonly=True)
+    response = fields.Text("Response", readonly=True)
+
+    @api.model
+    def enqueue(self, app, function_name, payload, merge_key=None, record=None):
+        """
+        写入一条待发送的意图，随调用方的事务一起提交或回滚
+        :param app: 发送请求的企业微信应用，例如公司的通讯录应用，需要有 company_id 和 secret 字段
+        :param payload: 请求参数，可以被 JSON 序列化
+        :param merge_key: 需要保持顺序或可合并的意图使用相同的键，例如同一个标签
+        :param record: 来源记录，发送前调用其 _wecom_outbox_payload 补全参数，成功后调用 _wecom_outbox_done
+        """
+        return self.sudo().create(
+            {
+                "company_id": record.company_id.id
+                if record is not None and "company_id" in record._fields
+                else self.env.company.id,
+                "corpid": app.company_id.corpid,
+                "app_model": app._name,
+                "app_id": app.id,
+                "function_name": function_name,
+                "payload": json.dumps(payload),
+                "merge_key": merge_key,
+                "res_model": record._name if record is not None else False,
+                "res_id": record.id if record is not None else False,
+            }
+        )
+
+    def action_retry(self):
+        """
+        重新发送失败的意图
+        """
+        self.filtered(lambda item: item.state == "failed").write(
+            {"state": "pending", "attempts": 0, "next_attempt": fields.Datetime.now()}
+        )
+
+    @api.model
+    def cron_flush(self, limit=None):
+        """
+        分批发送到期的意图，每批发送后提交
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        limit = limit or int(ir_config.get_param("wecom.outbox_batch_size", DEFAULT_BATCH_SIZE))
+        while True:
+            self.flush_model()
+            self.env.cr.execute(
+                """
+                SELECT id FROM wecom_api_outbox
+                WHERE state = 'pending' AND next_attempt <= now() at time zone 'UTC'
+                AND NOT EXISTS (
+                    SELECT 1 FROM wecom_api_outbox earlier
+                    WHERE earlier.merge_key = wecom_api_outbox.merge_key
+                    AND earlier.state = 'pending'
+                    AND earlier.id < wecom_api_outbox.id
+                    AND earlier.next_attempt > now() at time zone 'UTC'
+                )
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (limit,),
+            )
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+            self.sudo().browse(ids)._flush_batch()
+            if self.env.registry.in_test_mode():
+                break
+            self.env.cr.commit()  # type: ignore
+            if len(ids) < limit:
+                break
+
+    def _flush_batch(self):
+        """
+        按应用分组，合并后发送
+        同一 merge_key 的请求按顺序分轮发送，每轮中同一接口的请求通过 httpCallMany 并发发送
+        """
+        by_app = defaultdict(lambda: self.browse())
+        for item in self:
+            by_app[(item.app_model, item.app_id)] |= item
+
+        for items in by_app.values():
+            app = items[:1]._get_app()
+            if app is None:
+                items.write(
+                    {
+                        "state": "failed",
+                        "last_error": _("The WeCom application of this operation no longer exists."),
+                    }
+                )
+                continue
+            try:
+                wxapi = self.env["wecom.service_api"].InitServiceApi(
+                    app.company_id.corpid, app.secret
+                )
+            except ApiException as ex:
+                for item in items:
+                    item._record_failure(ex)
+                continue
+
+            # 成员增删相互抵消时计划为空，这些意图已标记为 merged，不参与分轮发送
+            queues = [
+                queue
+                for queue in (group._plan_calls() for key, group in items._group_by_merge_key())
+                if queue
+            ]
+            while queues:
+                wave = [queue.pop(0) for queue in queues]
+                by_function = defaultdict(list)
+                for call in wave:
+                    by_function[call[0]].append(call)
+                failed = self.browse()
+                for function_name, calls in by_function.items():
+                    if function_name in EXPANDED_FUNCTIONS:
+                        failed |= self._send_expanded_calls(wxapi, function_name, calls)
+                    else:
+                        failed |= self._send_calls(wxapi, function_name, calls)
+
+                # 失败后同一 merge_key 的后续意图推迟到与失败的意图一起重试，保持顺序
+                next_queues = []
+                for call, queue in zip(wave, queues):
+                    if call[2] & failed:
+                        retry_at = max(call[2].mapped("next_attempt"))
+                        for later in queue:
+                            later[2].filtered(lambda item: item.state == "pending").write(
+                                {"next_attempt": retry_at}
+                            )
+                    elif queue:
+                        next_queues.append(queue)
+                queues = next_queues
+
+    def _group_by_merge_key(self):
+        """
+        :returns [(merge_key, 意图)]，没有 merge_key 的意图各自一组
+        """
+        groups = OrderedDict()
+        for item in self.sorted("id"):
+            key = item.merge_key or "id:%s" % item.id
+            groups[key] = groups.get(key, self.browse()) | item
+        return list(groups.items())
+
+    def _plan_calls(self):
+        """
+        合并同一 merge_key 的意图
+        :returns [(function_name, payload, 意图)]
+        """
+        calls = []
+        members = None  # 连续的成员变更：{"userlist"/"partylist": {成员: 是否增加}}
+
+        def close_members():
+            if not members:
+                return
+            for function_name, add in (("TAG_ADD_MEMBER", True), ("TAG_DELETE_MEMBER", False)):
+                payload = dict(members["base"])
+                for key in ("userlist", "partylist"):
+                    payload[key] = [m for m, is_add in members[key].items() if is_add == add]
+                if payload["userlist"] or payload["partylist"]:
+                    calls.append((function_name, payload, members["items"]))
+            if not any(call[2] == members["items"] for call in calls):
+                # 增删相互抵消，无需发送
+                members["items"].write({"state": "merged"})
+
+        for item in self:
+            payload = json.loads(item.payload or "{}")
+            if item.function_name in MEMBER_FUNCTIONS:
+                if members is None:
+                    members = {
+                        "base": {k: v for k, v in payload.items() if k not in ("userlist", "partylist")},
+                        "userlist": OrderedDict(),
+                        "partylist": OrderedDict(),
+                        "items": self.browse(),
+                    }
+                is_add = item.function_name == "TAG_ADD_MEMBER"
+                for key in ("userlist", "partylist"):
+                    for member in payload.get(key) or []:
+                        members[key].pop(member, None)
+                        members[key][member] = is_add
+                members["items"] |= item
+                continue
+
+            close_members()
+            members = None
+            if item.function_name in ("TAG_UPDATE",) + EXPANDED_FUNCTIONS and calls and calls[-1][0] == item.function_name:
+                # 连续的更新、同步只发送最后一次
+                calls[-1][2].write({"state": "merged"})
+                calls[-1] = (item.function_name, payload, item)
+            elif item.function_name == "TAG_DELETE":
+                superseded = [
+                    call for call in calls if call[0] in MEMBER_FUNCTIONS + EXPANDED_FUNCTIONS + ("TAG_UPDATE",)
+                ]
+                for call in superseded:
+                    call[2].write({"state": "merged"})
+                calls = [call for call in calls if call not in superseded]
+                calls.append((item.function_name, payload, item))
+            else:
+                calls.append((item.function_name, payload, item))
+        close_members()
+        return calls
+
+    def _send_calls(self, wxapi, function_name, calls):
+        """
+        并发发送同一接口的请求，并记录每条意图的结果
+        :returns 发送失败的意图
+        """
+        argsList = []
+        for call in calls:
+            argsList.append(call[2][:1]._resolve_payload(call[1]))
+        responses = wxapi.httpCallMany(
+            self.env["wecom.service_api_list"].get_server_api_call(function_name),
+            argsList,
+        )
+        failed = self.browse()
+        for call, args, response in zip(calls, argsList, responses):
+            # 合并的成员变更可能对应增、删两次请求，任一失败都整体重试，重复增删不影响结果
+            if isinstance(response, ApiException):
+                for item in call[2]:
+                    item._record_failure(response)
+                failed |= call[2]
+            else:
+                self._invalidate_cache(wxapi, function_name, args)
+                call[2]._record_success(function_name, args, response)
+        return failed
+
+    def _send_expanded_calls(self, wxapi, function_name, calls):
+        """
+        逐条展开并发送，展开时读取的远程数据是发送时的最新状态
+        :returns 发送失败的意图
+        """
+        failed = self.browse()
+        for call in calls:
+            item = call[2][:1]
+            args = item._resolve_payload(call[1])
+            record = item._get_source_record()
+            result = {"errcode": 0, "errmsg": "ok"}
+            try:
+                if record is not None and hasattr(record, "_wecom_outbox_expand"):
+                    for real_function, real_args in record._wecom_outbox_expand(
+                        wxapi, function_name, args
+                    ):
+                        response = wxapi.httpCall(
+                            self.env["wecom.service_api_list"].get_server_api_call(real_function),
+                            real_args,
+                        )
+                        self._invalidate_cache(wxapi, real_function, real_args)
+                        for key in ("invalidlist", "invalidparty"):
+                            if response.get(key):
+                                result.setdefault(key, []).append(response[key])
+            except ApiException as ex:
+                for failed_item in call[2]:
+                    failed_item._record_failure(ex)
+                failed |= call[2]
+            else:
+                call[2]._record_success(function_name, args, result)
+        return failed
+
+    def _invalidate_cache(self, wxapi, function_name, args):
+        """
+        写操作成功后失效所有工作进程中相关的缓存
+        """
+        generation = self.env["wecom.api.cache.generation"].sudo()
+        for cached, param in CACHE_INVALIDATIONS.get(function_name, []):
+            if param is None:
+                generation.invalidate(wxapi.corpid, cached)
+            elif args.get(param):
+                generation.invalidate(wxapi.corpid, cached, **{param: args[param]})
+
+    def _resolve_payload(self, payload):
+        """
+        发送前由来源记录补全参数，例如刚创建的标签的 tagid
+        """
+        record = self._get_source_record()
+        if record is not None and hasattr(record, "_wecom_outbox_payload"):
+            return record._wecom_outbox_payload(self.function_name, payload)
+        return payload
+
+    def _get_app(self):
+        """
+        :returns 意图所属的应用，已删除时返回 None
+        """
+        if not self.app_model or not self.app_id or self.app_model not in self.env:
+            return None
+        app = self.env[self.app_model].sudo().browse(self.app_id).exists()
+        return app or None
+
+    def _get_source_record(self):
+        if not self.res_model or not self.res_id or self.res_model not in self.env:
+            return None
+        record = self.env[self.res_model].browse(self.res_id).exists()
+        return record or None
+
+    def _record_success(self, function_name, payload, response):
+        invalid = {
+            key: response[key]
+            for key in ("invalidlist", "invalidparty")
+            if response.get(key)
+        }
+        for item in self:
+            item.write(
+                {
+                    "state": "done",
+                    "attempts": item.attempts + (item.state == "pending"),
+                    "response": json.dumps(response),
+                    "last_error": _("Invalid members: %s") % json.dumps(invalid)
+                    if invalid
+                    else False,
+                }
+            )
+            record = item._get_source_record()
+            if record is not None and hasattr(record, "_wecom_outbox_done"):
+                record._wecom_outbox_done(function_name, payload, response)
+
+    def _record_failure(self, ex):
+        ir_config = self.env["ir.config_parameter"].sudo()
+        max_attempts = int(ir_config.get_param("wecom.outbox_max_attempts", DEFAULT_MAX_ATTEMPTS))
+        attempts = self.attempts + 1
+        vals = {
+            "state": "pending",
+            "attempts": attempts,
+            "last_error": "%s: %s" % (ex.errCode, ex.errMsg),
+        }
+        retryable_codes = (
+            NOT_SENT_CODES if self.function_name in NON_IDEMPOTENT_FUNCTIONS else RETRYABLE_CODES
+        )
+        if ex.errCode in retryable_codes and attempts < max_attempts:
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+            vals["next_attempt"] = fields.Datetime.now() + timedelta(seconds=delay)
+        else:
+            vals["state"] = "failed"
+            _logger.warning(
+                _("WeCom outbox item %s [%s] failed: %s"), self.id, self.function_name, vals["last_error"]
+            )
+        self.write(vals)
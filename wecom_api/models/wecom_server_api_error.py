@@ -1,16 +1,14 @@
 # -*- coding: utf-8 -*-
 
-import operator
+import io
+import os
 import requests
 import logging
+from collections import defaultdict
 from urllib.parse import quote, unquote
-import pandas as pd
-
-# pd.set_option("max_colwidth", 4096)
-# pd.set_option("max_colwidth", 10)
 
 from lxml import etree
-from odoo import api, fields, models, SUPERUSER_ID, _
+from odoo import api, fields, models, tools, SUPERUSER_ID, _
 
 _logger = logging.getLogger(__name__)
 
@@ -38,15 +36,45 @@ class WecomServerApiError(models.Model):
 
     sequence = fields.Integer(default=0)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(WecomServerApiError, self).create(vals_list)
+        if not self.env.context.get("wecom_defer_clear_caches"):
+            self.clear_caches()
+        return res
+
+    def write(self, vals):
+        res = super(WecomServerApiError, self).write(vals)
+        if not self.env.context.get("wecom_defer_clear_caches"):
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(WecomServerApiError, self).unlink()
+        self.clear_caches()
+        return res
+
+    @tools.ormcache()
+    def _get_error_catalog(self):
+        """
+        错误码表，每个工作进程加载一次，模型变更时失效
+        :returns {错误码: (错误说明, 排查方法)}
+        """
+        return {
+            res["code"]: (res["name"], res["method"])
+            for res in self.sudo().search_read([], ["code", "name", "method"], order="sequence desc")
+        }
+
     def get_error_by_code(self, code):
-        res = self.search(
-            [("code", "=", code)],
-            limit=1,
-        )
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            code = 0
+        name, method = self._get_error_catalog().get(code, (False, False))
         return {
-            "code": res.code,        # type: ignore
-            "name": res.name,    # type: ignore
-            "method": res.method, # type: ignore
+            "code": code if name else 0,
+            "name": name,
+            "method": method,
         }
 
     def cron_pull_global_error_code(self):
@@ -57,114 +85,190 @@ class WecomServerApiError(models.Model):
         """
         使用爬虫爬取 全局错误码
         URL的一般格式为： protocol://hostname[:port]/path/[;parameters][?query]#fragment
+        使用 ETag/Last-Modified 条件请求，页面未变化时不解析；只写入新增或变化的错误码。
+        无法访问网络时，读取参数 "wecom.global_error_code_local_file" 指定的本地页面副本，每次下载成功后更新该副本。
         """
         ir_config = self.env["ir.config_parameter"].sudo()
-        url = ir_config.get_param("wecom.global_error_code_url")
-
         codes = ir_config.get_param("wecom.global_error_code_item_selection_code")
 
         state = False
-        msg= ""
+        msg = ""
         try:
             _logger.info(_("Start pulling the global error code of WeCom."))
-            page_text = requests.get(url=url).text
-            tree = etree.HTML(page_text)     # type: ignore
-
-            codes_elements = tree.xpath(codes)
-
-            methods = []
-
-            for code_element in codes_elements:
-                code_element_str = code_element.xpath("text()")[0]
-                error_code = code_element_str.split("：", 1)[1:][0]
-
-                method_element = code_element.getnext()
-                method = etree.tostring(method_element, encoding="utf-8", pretty_print=True ).decode()   # type: ignore
-
-                if " " in error_code:
-                    # 一个元素存在多个错误码
-                    multiple_codes = error_code.split(" ", 1)
-                    for multiple_code in multiple_codes:
-                        multiple_dic = {}
-                        multiple_dic["code"] = multiple_code
-                        multiple_dic["method"] = method
-                        methods.append(multiple_dic)
-                else:
-                    dic = {}
-                    dic["code"] = error_code
-                    dic["method"] = method
-                    methods.append(dic)
-
-            table = tree.xpath("//div[@class='cherry-table-container']/table")  # 取出表格
-            table = etree.tostring(
-                table[0], encoding="utf-8"   # type: ignore
-            ).decode()  # 将第一个表格转成string格式
-            table = table.replace("<th>错误码</th>", "<th>code</th>")
-            table = table.replace("<th>错误说明</th>", "<th>name</th>")
-            table = table.replace("<th>排查方法</th>", "<th>method</th>")
-
-            df = pd.read_html(table, encoding="utf-8", header=0)[0]  # pandas读取table
-            if 'Unnamed: 3' in df.columns:
-                del df['Unnamed: 3']
-
-            error_results = list(df.T.to_dict().values())  # 转换成列表嵌套字典的格式
-
-            errors = []
-            for index, error in enumerate(error_results):
-                if (error["code"] == 40054) or (error["code"] == 40055):
-                    error["method"] = self.replaceMethod(str(error["code"]), methods)
-                elif error["method"] == "查看帮助":
-                    error["method"] = self.replaceMethod(str(error["code"]), methods)
-                error["sequence"] = index
-                errors.append(error)
-
+            page_text, validators = self._fetch_error_code_page()
+            if page_text is None:
+                state = True
+                msg = _("The WeCom global error code has not changed.")
+                _logger.info(msg)
+                return {"state": state, "msg": msg}
+            errors = self._parse_error_code_page(page_text, codes)
+            created, updated = self._upsert_error_codes(errors)
+            # 解析和写入成功后才记录，失败时下次重新下载
+            for key, value in validators.items():
+                ir_config.set_param(key, value)
         except Exception as e:
             msg = _("Failed to pull WeCom global error code, reason:%s") % str(e)
             _logger.warning(msg)
             state = False
         else:
-            # 写入到odoo
-            for error in errors:
-                res = self.search(
-                    [("code", "=", error["code"])],
-                    limit=1,
-                )
-                if not res:
-                    self.sudo().create(
-                        {
-                            "code": error["code"],
-                            "name": error["name"],
-                            "method": error["method"],
-                            "sequence": error["sequence"],
-                        }
-                    )
-                else:
-                    res.sudo().write(    # type: ignore
-                        {
-                            "name": error["name"],
-                            "method": error["method"],
-                            "sequence": error["sequence"],
-                        }
-                    )
             state = True
-            msg = _("Successfully pulled the WeCom global error code!")
+            msg = _(
+                "Successfully pulled the WeCom global error code! %s created, %s updated."
+            ) % (created, updated)
             _logger.info(msg)
 
-        finally:
-            return {"state": state, "msg": msg}
+        return {"state": state, "msg": msg}
+
+    @api.model
+    def _fetch_error_code_page(self):
+        """
+        获取全局错误码页面
+        :returns (页面内容, {参数: ETag/Last-Modified})，页面未变化时页面内容为 None
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        url = ir_config.get_param("wecom.global_error_code_url")
+        local_file = self._get_error_code_local_file()
+        etag = ir_config.get_param("wecom.global_error_code_etag")
+        last_modified = ir_config.get_param("wecom.global_error_code_last_modified")
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            response = requests.get(url=url, headers=headers, timeout=30)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            if not local_file or not os.path.isfile(local_file):
+                raise
+            _logger.warning(
+                _("Failed to download the WeCom global error code page (%s), use local file: %s"),
+                e,
+                local_file,
+            )
+            with io.open(local_file, "r", encoding="utf-8") as f:
+                return f.read(), {}
+
+        if response.status_code == 304:
+            return None, {}
+        response.encoding = response.encoding or "utf-8"
+        if local_file:
+            try:
+                os.makedirs(os.path.dirname(local_file), exist_ok=True)
+                with io.open(local_file, "w", encoding="utf-8") as f:
+                    f.write(response.text)
+            except OSError as e:
+                _logger.warning(_("Failed to save the WeCom global error code page to %s: %s"), local_file, e)
+        return response.text, {
+            "wecom.global_error_code_etag": response.headers.get("ETag") or "",
+            "wecom.global_error_code_last_modified": response.headers.get("Last-Modified") or "",
+        }
+
+    @api.model
+    def _get_error_code_local_file(self):
+        """
+        全局错误码页面的本地副本，相对路径位于 Odoo 数据目录下
+        """
+        local_file = self.env["ir.config_parameter"].sudo().get_param("wecom.global_error_code_local_file")
+        if local_file and not os.path.isabs(local_file):
+            local_file = os.path.join(tools.config["data_dir"], local_file)
+        return local_file
+
+    @api.model
+    def _parse_error_code_page(self, page_text, codes):
+        """
+        解析全局错误码页面
+        :param codes: 定位错误码标题的路径表达式，标题后面是该错误码的排查方法
+        :returns [{"code", "name", "method", "sequence"}]
+        """
+        tree = etree.HTML(page_text)  # type: ignore
+
+        # 标题中的错误码及其后的排查方法，例如 "错误码：40054 40055"
+        methods = {}
+        for code_element in tree.xpath(codes):
+            code_element_str = "".join(code_element.xpath("text()"))
+            if "：" not in code_element_str:
+                continue
+            error_code = code_element_str.split("：", 1)[1].strip()
+            method_element = code_element.getnext()
+            if method_element is None:
+                continue
+            method = etree.tostring(method_element, encoding="utf-8", pretty_print=True).decode()  # type: ignore
+            # 一个元素可能存在多个错误码
+            for multiple_code in error_code.split():
+                methods.setdefault(multiple_code, method)
+
+        table = tree.xpath("//div[@class='cherry-table-container']/table")  # 取出表格
+        if not table:
+            raise ValueError(_("The error code table was not found in the page."))
+        rows = table[0].xpath(".//tr")
+        header = ["".join(cell.itertext()).strip() for cell in rows[0].xpath("./th|./td")]
+        columns = {"错误码": "code", "错误说明": "name", "排查方法": "method"}
+        index = {columns[title]: i for i, title in enumerate(header) if title in columns}
+
+        errors = []
+        for row in rows[1:]:
+            cells = ["".join(cell.itertext()).strip() for cell in row.xpath("./td")]
+            try:
+                code = int(cells[index["code"]])
+            except (IndexError, KeyError, ValueError):
+                continue
+            error = {
+                "code": code,
+                "name": cells[index["name"]] if index.get("name", len(cells)) < len(cells) else "",
+                "method": cells[index["method"]] if index.get("method", len(cells)) < len(cells) else "",
+                "sequence": len(errors),
+            }
+            if code in (40054, 40055) or error["method"] == "查看帮助":
+                error["method"] = self.replaceMethod(str(code), methods)
+            errors.append(error)
+        return errors
+
+    @api.model
+    def _upsert_error_codes(self, errors):
+        """
+        批量写入错误码，只创建新增的、更新变化的
+        相同的变更合并为一次 write，全部写入后只清空一次缓存
+        :returns (新增数, 更新数)
+        """
+        model = self.sudo().with_context(wecom_defer_clear_caches=True)
+        existing = {
+            res["code"]: res
+            for res in model.search_read([], ["code", "name", "method", "sequence"])
+        }
+        to_create = []
+        to_write = defaultdict(list)  # {变更: [记录ID]}
+        seen = set()
+        for error in errors:
+            if error["code"] in seen:
+                continue
+            seen.add(error["code"])
+            res = existing.get(error["code"])
+            if not res:
+                to_create.append(error)
+                continue
+            vals = {
+                key: error[key]
+                for key in ("name", "method", "sequence")
+                if (res[key] or "") != (error[key] or "")
+            }
+            if vals:
+                to_write[tuple(sorted(vals.items()))].append(res["id"])
+        for vals, ids in to_write.items():
+            model.browse(ids).write(dict(vals))
+        if to_create:
+            model.create(to_create)
+        if to_write or to_create:
+            self.clear_caches()
+        return len(to_create), sum(len(ids) for ids in to_write.values())
 
     def replaceMethod(self, code, methods):
         """
         替换 排查方法
         """
-        df = pd.DataFrame(methods)
-        method = df["method"][df["code"] == code].to_string(
-            index=False
-        )  # 取 包含指定code 值的 "method"列
-
+        method = methods.get(code, "")
         if method[-2:] == "\\n":
             method = method[:-2] # 去掉最后的换行符
-
         return method
 
     def getMiddleStr(self, content, startStr, endStr):
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import re
-from odoo import api, fields, models, SUPERUSER_ID, _
+from odoo import api, fields, models, tools, SUPERUSER_ID, _
+from odoo.addons.wecom_api.api.wecom_abstract_api import make_url, WECOM_API_BASE_URL  # type: ignore
 
 
 class WecomServerApiList(models.Model):
@@ -47,21 +48,68 @@ class WecomServerApiList(models.Model):
         default="GET",
     )
     description = fields.Html(string="Description")
+    cacheable = fields.Boolean(
+        "Cacheable Response", default=False
+    )  # 幂等的 GET 接口，响应可以在进程内缓存
+    cache_ttl = fields.Integer("Cache TTL (seconds)", default=300)
     sequence = fields.Integer(default=0)
 
     _sql_constraints = [
         ("function_name_uniq", "unique (function_name)", "The function is unique !",),
     ]
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(WecomServerApiList, self).create(vals_list)
+        self.clear_caches()
+        return res
+
+    def write(self, vals):
+        res = super(WecomServerApiList, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(WecomServerApiList, self).unlink()
+        self.clear_caches()
+        return res
+
+    @tools.ormcache()
+    def _get_server_api_routes(self):
+        """
+        企业微信API路由表，每次加载注册表时构建一次，模型或系统参数变更时失效
+        完整URL使用参数 "wecom.api_base_url" 作为服务地址
+        :returns {函数名称: (路由, 请求方式, 完整URL模板, 函数名称, 缓存时长)}
+        """
+        base_url = (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("wecom.api_base_url", WECOM_API_BASE_URL)
+        )
+        routes = {}
+        for res in self.sudo().search_read(
+            [],
+            ["function_name", "short_url", "request_type", "cacheable", "cache_ttl"],
+        ):
+            routes[res["function_name"]] = (
+                res["short_url"],
+                res["request_type"],
+                make_url(res["short_url"], base_url),
+                res["function_name"],
+                res["cache_ttl"]
+                if res["cacheable"] and res["request_type"] == "GET"
+                else 0,
+            )
+        return routes
+
     def get_server_api_call(self, function_name):
         """
         根据函数名称获取 企业微信API的路由和请求方式
         :param function_name : 函数名称
-        :returns 企业微信API的路由和请求方式的集合
+        :returns 企业微信API的路由、请求方式、完整URL模板、函数名称和缓存时长的集合
         """
-        # ['/cgi-bin/gettoken', 'GET']
-        data = []
-        res = self.search([("function_name", "=", function_name)], limit=1,)
-        data.append(res.short_url)   # type: ignore
-        data.append(res.request_type)    # type: ignore
-        return data
+        # ['/cgi-bin/gettoken', 'GET', 'https://qyapi.weixin.qq.com/cgi-bin/gettoken', 'GET_ACCESS_TOKEN', 0]
+        route = self._get_server_api_routes().get(function_name)
+        if route is None:
+            return [False, False]
+        return list(route)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from odoo.tests.common import TransactionCase
+
+
+class TestWecomApiOutbox(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.outbox = self.env["wecom.api.outbox"]
+        # 发件箱只需要应用的 _name、id、company_id.corpid 和 secret
+        self.app = SimpleNamespace(
+            _name="res.company",
+            id=self.env.company.id,
+            company_id=SimpleNamespace(corpid="wwtest"),
+            secret="secret",
+        )
+        self.wxapi = MagicMock(corpid="wwtest")
+        self.wxapi.httpCallMany.side_effect = lambda url_type, args_list: [
+            {"errcode": 0, "errmsg": "ok"} for _args in args_list
+        ]
+        Outbox = type(self.outbox)
+        patcher_app = patch.object(Outbox, "_get_app", lambda item: self.app)
+        patcher_api = patch.object(
+            type(self.env["wecom.service_api"]),
+            "InitServiceApi",
+            lambda model, corpid, secret: self.wxapi,
+        )
+        for patcher in (patcher_app, patcher_api):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cancelled_member_changes_are_merged(self):
+        """
+        同一标签先增后删同一成员，合并后无需发送；不能影响同一批中其他标签的意图
+        """
+        added = self.outbox.enqueue(
+            self.app, "TAG_ADD_MEMBER", {"tagid": 1, "userlist": ["zhangsan"]}, merge_key="tag,1"
+        )
+        removed = self.outbox.enqueue(
+            self.app, "TAG_DELETE_MEMBER", {"tagid": 1, "userlist": ["zhangsan"]}, merge_key="tag,1"
+        )
+        other = self.outbox.enqueue(
+            self.app, "TAG_UPDATE", {"tagid": 2, "tagname": "other"}, merge_key="tag,2"
+        )
+
+        (added | removed | other)._flush_batch()
+
+        self.assertEqual((added | removed).mapped("state"), ["merged", "merged"])
+        self.assertEqual(other.state, "done")
+        self.assertEqual(self.wxapi.httpCallMany.call_count, 1)
+        args_list = self.wxapi.httpCallMany.call_args[0][1]
+        self.assertEqual(args_list, [{"tagid": 2, "tagname": "other"}])
@@ -18,8 +18,7 @@ class WecomApiToolsAction(models.AbstractModel):
         """
         API 错误弹框
         """
-        ir_config = self.env["ir.config_parameter"].sudo()
-        debug = ir_config.get_param("wecom.debug_enabled")
+        debug = self.env["wecom.abstract_api"].get_api_debug()
         error = self.env["wecom.service_api_error"].get_error_by_code(ex.errCode)
 
         if debug:
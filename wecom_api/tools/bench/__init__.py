@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+
+# 压测工具：企业微信替身服务和基准测试，不随插件加载，使用方法见 wecom_api/readme.md
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException  # type: ignore
+
+from .common import BENCH_CORPID, BENCH_SECRET, print_report, summarize, timed, use_base_url
+from .fake_server import FakeOrg, FakeWecomServer
+
+
+def _row(name, server, before, count, seconds, responses):
+    delta = server.snapshot() - before
+    row = summarize(name, [seconds])
+    row.update(
+        count=count,
+        per_second=round(count / seconds, 1) if seconds else 0.0,
+        failed=sum(1 for response in responses if isinstance(response, ApiException)),
+        requests=delta["requests"],
+        connections=delta["connections"],
+    )
+    return row
+
+
+def run(env, count=2000, latency=0.02, max_concurrency=32, sequential=200):
+    """
+    比较逐条 httpCall、线程池 httpCallMany 和 asyncio asyncCallMany 批量调用 USER_GET 的吞吐量
+    每个请求在替身服务中等待 latency 秒，模拟企业微信的网络延迟；限流参数 wecom.rate_limit_* 同样生效。
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import bench_async
+        bench_async.run(env, count=5000, latency=0.05)
+    :param count: httpCallMany 和 asyncCallMany 的请求数
+    :param max_concurrency: 两种批量调用的最大并发数
+    :param sequential: 逐条 httpCall 的请求数，延迟较高时可以少于 count
+    :returns 报告的各行
+    """
+    server = FakeWecomServer(FakeOrg(users=count), latency=latency)
+    rows = []
+    with server, use_base_url(env, server.url):
+        wxapi = env["wecom.service_api"].InitServiceApi(BENCH_CORPID, BENCH_SECRET)
+        url_type = env["wecom.service_api_list"].get_server_api_call("USER_GET")
+        args_list = [{"userid": server.org.userid(index)} for index in range(count)]
+
+        before = server.snapshot()
+        responses = []
+
+        def call_sequential():
+            for args in args_list[:sequential]:
+                try:
+                    responses.append(wxapi.httpCall(url_type, args))
+                except ApiException as e:
+                    responses.append(e)
+
+        seconds, _result = timed(call_sequential)
+        rows.append(_row("httpCall", server, before, len(responses), seconds, responses))
+
+        before = server.snapshot()
+        seconds, responses = timed(
+            wxapi.httpCallMany, url_type, args_list, max_concurrency=max_concurrency
+        )
+        rows.append(_row("httpCallMany", server, before, count, seconds, responses))
+
+        before = server.snapshot()
+        seconds, responses = timed(
+            wxapi.asyncCallMany, "USER_GET", args_list, max_concurrency=max_concurrency
+        )
+        rows.append(_row("asyncCallMany", server, before, count, seconds, responses))
+    print_report(
+        "USER_GET x %s, latency %ss, max_concurrency %s" % (count, latency, max_concurrency),
+        rows,
+    )
+    return rows
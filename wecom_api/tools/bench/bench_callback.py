@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from odoo.addons.wecom_api.api.wecom_msg_crtpt import WecomMsgCrypt  # type: ignore
+
+from .common import print_report, summarize, use_base_url
+from .fake_server import FakeOrg, FakeWecomServer, WecomCallbackEmitter, contact_event_xml
+
+
+def _uncached_crypt(env, company_id, code):
+    """
+    与缓存前的回调控制器相同：每个请求查询公司和回调服务，并新建 WecomMsgCrypt
+    """
+    company = env["res.company"].sudo().search([("id", "=", company_id)])
+    service = env["wecom.app_callback_service"].sudo().search(
+        [
+            ("app_id", "=", company.contacts_app_id.id),
+            ("code", "=", code),
+            "|",
+            ("active", "=", True),
+            ("active", "=", False),
+        ]
+    )
+    return WecomMsgCrypt(service.callback_url_token, service.callback_aeskey, company.corpid)
+
+
+def _cached_crypt(env, company_id, code):
+    return env["wecom.app_callback_service"].sudo()._get_callback_context(company_id, code)[4]
+
+
+def run(env, company=None, count=2000, service_code="contacts", odoo_url=None):
+    """
+    测量回调入口每秒可处理的请求数：查找回调服务、构建解密对象并验证签名、解密消息
+    uncached 与缓存前的控制器相同，cached 使用按 (公司, 服务代码) 缓存的解密上下文；
+    每个请求前清空 ORM 缓存，与每个 HTTP 请求使用新的环境一致。不写入收件箱。
+    指定 odoo_url 时再向运行中的 Odoo 发送 HTTP 请求，测量包含写入收件箱的完整吞吐量；
+    期间 wecom.api_base_url 指向替身服务，收件箱中的回调不会调用真实的企业微信。
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import bench_callback
+        bench_callback.run(env, count=5000)
+    :param company: 公司，需要启用通讯录应用的回调服务，默认当前公司
+    :returns 报告的各行
+    """
+    company = company or env.company
+    context = env["wecom.app_callback_service"].sudo()._get_callback_context(
+        company.id, service_code
+    )
+    if not context or not context[1]:
+        raise ValueError(
+            "Company %s has no active callback service %s" % (company.name, service_code)
+        )
+    service = env["wecom.app_callback_service"].sudo().browse(context[0])
+    emitter = WecomCallbackEmitter(
+        service.callback_url_token, service.callback_aeskey, company.corpid
+    )
+    org = FakeOrg()
+    requests = [emitter.build(contact_event_xml(org, index, company.corpid)) for index in range(count)]
+
+    rows = []
+    for name, get_crypt in (("uncached", _uncached_crypt), ("cached", _cached_crypt)):
+        durations = []
+        for params, body in requests:
+            env.invalidate_all()
+            start = time.perf_counter()
+            crypt = get_crypt(env, company.id, service_code)
+            ret, _plaintext = crypt.DecryptMsg(
+                body, params["msg_signature"], params["timestamp"], params["nonce"]
+            )
+            durations.append(time.perf_counter() - start)
+            if ret != 0:
+                raise ValueError("DecryptMsg failed with %s" % ret)
+        rows.append(summarize(name, durations))
+
+    if odoo_url:
+        url = "%s/wecom_callback/%s/%s" % (odoo_url.rstrip("/"), company.id, service_code)
+        durations = []
+        with FakeWecomServer(org) as server, use_base_url(env, server.url):
+            for index in range(count):
+                start = time.perf_counter()
+                emitter.post(url, contact_event_xml(org, count + index, company.corpid))
+                durations.append(time.perf_counter() - start)
+            # 恢复服务地址前处理完写入收件箱的回调
+            env.cr.commit()
+            while env["wecom.app.callback.inbox"].sudo().cron_process():
+                env.cr.commit()
+        rows.append(summarize("http", durations))
+    print_report("Callback entry, %s requests" % count, rows)
+    return rows
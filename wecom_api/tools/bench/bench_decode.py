@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import xml.etree.ElementTree as ET
+
+import xmltodict
+from lxml import etree
+
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent, parse_xml  # type: ignore
+
+from .common import best_of, print_report
+from .fake_server import FakeOrg, WecomCallbackEmitter, contact_event_xml
+
+# 仅用于生成信封，不需要与任何回调服务一致
+BENCH_TOKEN = "bench"
+BENCH_AES_KEY = "abcdefghijklmnopqrstuvwxyz0123456789ABCDEFG"
+
+
+def _before(envelope, plaintext):
+    """
+    单次解码前：ElementTree 提取 Encrypt，xmltodict 分发事件，事件处理方法再用 lxml 解析一次
+    """
+    ET.fromstring(envelope).find("Encrypt")
+    xmltodict.parse(plaintext)["xml"]
+    {child.tag: child.text for child in etree.fromstring(plaintext)}
+
+
+def _after(envelope, plaintext):
+    """
+    单次解码后：加固的解析器提取 Encrypt，明文只解析一次为 WecomCallbackEvent
+    """
+    parse_xml(envelope).find("Encrypt")
+    WecomCallbackEvent(plaintext)
+
+
+def run(count=10000, repeat=3):
+    """
+    每个回调的 XML 解码耗时（微秒），事件为成员、部门和标签变更轮流出现
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import bench_decode
+        bench_decode.run(count=20000)
+    :param repeat: 每项重复次数，取最快的一次
+    :returns 报告的各行
+    """
+    org = FakeOrg()
+    emitter = WecomCallbackEmitter(BENCH_TOKEN, BENCH_AES_KEY, "wwbench")
+    events = []
+    for index in range(count):
+        plaintext = contact_event_xml(org, index, "wwbench").encode("utf-8")
+        events.append((emitter.build(plaintext)[1], plaintext))
+
+    cases = (
+        ("envelope_elementtree", lambda envelope, plaintext: ET.fromstring(envelope).find("Encrypt")),
+        ("envelope_parse_xml", lambda envelope, plaintext: parse_xml(envelope).find("Encrypt")),
+        ("xmltodict", lambda envelope, plaintext: xmltodict.parse(plaintext)["xml"]),
+        ("WecomCallbackEvent", lambda envelope, plaintext: WecomCallbackEvent(plaintext)),
+        ("before_total", _before),
+        ("after_total", _after),
+    )
+    rows = []
+    for name, decode in cases:
+
+        def decode_all(decode=decode):
+            for envelope, plaintext in events:
+                decode(envelope, plaintext)
+
+        seconds = best_of(decode_all, repeat)
+        rows.append(
+            {
+                "name": name,
+                "count": count,
+                "us_per_event": round(seconds / count * 1e6, 1),
+                "events_per_second": round(count / seconds) if seconds else 0,
+            }
+        )
+    print_report("Callback XML decode, %s events" % count, rows)
+    return rows
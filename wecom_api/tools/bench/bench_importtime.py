@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import subprocess
+
+from .common import print_report
+
+# 应按需导入的第三方库，加载插件时不应出现在 sys.modules 中
+HEAVY_MODULES = ("pandas", "pydub", "html2text", "passlib", "markdown", "Crypto")
+
+MARKER = "wecom-bench-importtime"
+
+CHILD_SCRIPT = """
+import sys, json
+import odoo
+from odoo.modules import module
+odoo.tools.config.parse_config(["--addons-path", %(addons_path)r])
+module.initialize_sys_path()
+sys.stderr.write(%(marker)r + "\\n")
+sys.stderr.flush()
+for name in %(modules)r:
+    __import__(name)
+print(json.dumps(sorted(name for name in %(heavy)r if name in sys.modules)))
+"""
+
+
+def _discover_addons():
+    """
+    :returns 与 wecom_api 位于同一目录下的全部插件
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    return sorted(
+        name
+        for name in os.listdir(root)
+        if os.path.isfile(os.path.join(root, name, "__manifest__.py"))
+    )
+
+
+def _parse_importtime(stderr):
+    """
+    :returns [(自身耗时 us, 累计耗时 us, 模块名称)]，只包含启动 Odoo 之后的导入
+    """
+    entries = []
+    started = False
+    for line in stderr.splitlines():
+        if line.strip() == MARKER:
+            started = True
+            continue
+        if not started or not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        entries.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return entries
+
+
+def profile(modules, addons_path, python=None):
+    """
+    在新的解释器中以 -X importtime 导入 modules
+    :returns (导入记录, 已加载的重量级库)
+    """
+    script = CHILD_SCRIPT % {
+        "addons_path": addons_path,
+        "marker": MARKER,
+        "modules": list(modules),
+        "heavy": list(HEAVY_MODULES),
+    }
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    result = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr[-2000:])
+    heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return _parse_importtime(result.stderr), heavy
+
+
+def run(addons=None, top=15, python=None):
+    """
+    插件导入耗时报告：每个插件在独立的解释器中导入，报告自身的累计导入耗时、导入的模块数
+    和已加载的重量级库（应为空）；随后同时导入全部插件，列出自身耗时最长的 top 个模块。
+    在 odoo-bin shell 中运行（使用当前的 addons_path）：
+        from odoo.addons.wecom_api.tools.bench import bench_importtime
+        bench_importtime.run()
+    :param addons: 插件名称列表，默认为与 wecom_api 同目录的全部插件
+    :returns (各插件的报告行, 最慢模块的报告行)
+    """
+    from odoo.tools import config
+
+    addons = addons or _discover_addons()
+    addons_path = config["addons_path"]
+    rows = []
+    for addon in addons:
+        package = "odoo.addons.%s" % addon
+        entries, heavy = profile([package], addons_path, python)
+        cumulative = max(
+            (entry[1] for entry in entries if entry[2] == package), default=0
+        )
+        rows.append(
+            {
+                "addon": addon,
+                "cumulative_ms": round(cumulative / 1000.0, 1),
+                "modules": len(entries),
+                "heavy_loaded": ",".join(heavy) or "-",
+            }
+        )
+    print_report("Addon import time (each addon in a fresh interpreter)", rows)
+
+    entries, heavy = profile(["odoo.addons.%s" % addon for addon in addons], addons_path, python)
+    slowest = [
+        {"module": name, "self_ms": round(own / 1000.0, 1), "cumulative_ms": round(total / 1000.0, 1)}
+        for own, total, name in sorted(entries, reverse=True)[:top]
+    ]
+    print_report(
+        "Slowest imports with all addons loaded (total %.1f ms, heavy loaded: %s)"
+        % (sum(entry[0] for entry in entries) / 1000.0, ",".join(heavy) or "-"),
+        slowest,
+    )
+    return rows, slowest
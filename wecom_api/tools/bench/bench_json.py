@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from odoo.addons.wecom_api.api import wecom_json  # type: ignore
+
+from .common import best_of, print_report
+from .fake_server import FakeOrg
+
+
+def run(users=100000, repeat=3):
+    """
+    在 users 个成员的 user/list 响应上比较标准库与 wecom_json 的编解码耗时，
+    以及逐个成员保存部门列表时 json.dumps + eval 与 dumps_text + loads_field 的往返耗时
+    安装 orjson 后 wecom_json 自动使用它，报告中的 backend 列显示实际使用的库。
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import bench_json
+        bench_json.run(users=100000)
+    :param repeat: 每项重复次数，取最快的一次
+    :returns 报告的各行
+    """
+    org = FakeOrg(users=users, departments=max(users // 20, 1), tags=max(users // 100, 1))
+    payload = {"errcode": 0, "errmsg": "ok", "userlist": [org.user(index) for index in range(users)]}
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    departments = [user["department"] + [user["main_department"]] for user in payload["userlist"]]
+
+    def stdlib_roundtrip():
+        for value in departments:
+            eval(json.dumps(value))
+
+    def codec_roundtrip():
+        for value in departments:
+            wecom_json.loads_field(wecom_json.dumps_text(value))
+
+    cases = (
+        ("encode", "json.dumps", lambda: json.dumps(payload, ensure_ascii=False).encode("utf-8")),
+        ("encode", "wecom_json.dumps", lambda: wecom_json.dumps(payload)),
+        ("decode", "json.loads(str)", lambda: json.loads(body.decode("utf-8"))),
+        ("decode", "wecom_json.loads", lambda: wecom_json.loads(body)),
+        ("field_roundtrip", "json.dumps+eval", stdlib_roundtrip),
+        ("field_roundtrip", "wecom_json", codec_roundtrip),
+    )
+    rows = []
+    for operation, name, func in cases:
+        seconds = best_of(func, repeat)
+        rows.append(
+            {
+                "operation": operation,
+                "name": name,
+                "seconds": round(seconds, 3),
+                "users_per_second": round(users / seconds) if seconds else 0,
+            }
+        )
+    print_report(
+        "user/list with %s users, %.1f MB, backend %s"
+        % (users, len(body) / 1024.0 / 1024.0, wecom_json.JSON_BACKEND),
+        rows,
+    )
+    return rows
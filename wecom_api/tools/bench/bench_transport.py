@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import requests
+
+from odoo.addons.wecom_api.api.wecom_transport import WecomHttpTransport  # type: ignore
+
+from .common import print_report, summarize, timed
+from .fake_server import FakeOrg, FakeWecomServer
+
+
+def _calls(server, send, count):
+    token = requests.get(
+        server.url + "/cgi-bin/gettoken", params={"corpid": "bench", "corpsecret": "bench"}
+    ).json()["access_token"]
+    url = server.url + "/cgi-bin/user/get"
+    durations = []
+    for index in range(count):
+        seconds, response = timed(
+            send, url, {"access_token": token, "userid": server.org.userid(index % server.org.users)}
+        )
+        response.raise_for_status()
+        durations.append(seconds)
+    return durations
+
+
+def run(count=1000, latency=0.0):
+    """
+    比较每次请求新建连接与 WecomHttpTransport 连接池的单次调用耗时和连接数
+    本地替身服务使用 HTTP，节省的只是 TCP 握手；访问企业微信时还会省去每次的 TLS 握手。
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import bench_transport
+        bench_transport.run(count=2000)
+    :returns 报告的各行
+    """
+    cases = (
+        ("requests.get", lambda url, params: requests.get(url, params=params, timeout=30)),
+        (
+            "transport_no_keep_alive",
+            lambda url, params: WecomHttpTransport.request(
+                "GET", url, {"keep_alive": False}, params=params
+            ),
+        ),
+        (
+            "transport_pooled",
+            lambda url, params: WecomHttpTransport.request("GET", url, params=params),
+        ),
+    )
+    rows = []
+    with FakeWecomServer(FakeOrg(users=1000), latency=latency) as server:
+        for name, send in cases:
+            before = server.snapshot()
+            durations = _calls(server, send, count)
+            delta = server.snapshot() - before
+            rows.append(
+                summarize(name, durations, connections=delta["connections"] - 1)
+            )
+        WecomHttpTransport.close_all()
+    print_report("USER_GET x %s, latency %ss" % (count, latency), rows)
+    return rows
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+import requests
+
+from .common import print_report
+from .fake_server import FakeOrg, FakeWecomServer
+
+UPLOAD_MODULE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "api",
+    "wecom_upload.py",
+)
+
+# 子进程只导入上传需要的库，不加载 Odoo，峰值 RSS 只反映一次上传
+CHILD_SCRIPT = """
+import os, sys, json, time, base64, resource, importlib.util
+import requests
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+
+spec = importlib.util.spec_from_file_location("wecom_upload", %(module)r)
+wecom_upload = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(wecom_upload)
+
+def rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def before(path, url, tmpdir):
+    # 以前的路径：读取 Binary 字段得到 base64 值（保留在 ORM 缓存中），解码后写入临时目录，再从临时文件上传
+    with open(path, "rb") as fp:
+        value = base64.b64encode(fp.read())
+    tmp_path = os.path.join(tmpdir, os.path.basename(path))
+    with open(tmp_path, "wb") as fp:
+        fp.write(base64.b64decode(value))
+    with open(tmp_path, "rb") as fp:
+        encoder = MultipartEncoder(fields={"media": (os.path.basename(path), fp, "text/plain")})
+        return requests.post(url, data=encoder, headers={"Content-Type": encoder.content_type})
+
+def after(path, url, tmpdir):
+    # 现在的路径：直接从文件存储按块读取
+    with wecom_upload.WecomUploadStream.from_path(path) as stream:
+        encoder = MultipartEncoder(
+            fields={"media": (os.path.basename(path), stream, "application/octet-stream")}
+        )
+        return requests.post(url, data=encoder, headers={"Content-Type": encoder.content_type})
+
+baseline = rss_kb()
+start = time.perf_counter()
+response = %(case)s(%(path)r, %(url)r, %(tmpdir)r)
+seconds = time.perf_counter() - start
+response.raise_for_status()
+print(json.dumps({"baseline_kb": baseline, "peak_kb": rss_kb(), "seconds": seconds, "response": response.json()}))
+"""
+
+CASES = (("base64_tempfile", "before"), ("upload_stream", "after"))
+
+
+def _measure(case, path, url, tmpdir, python=None):
+    """
+    在新的解释器中上传一次
+    :returns 子进程的结果：导入后的 RSS、上传后的峰值 RSS（KB）和耗时
+    """
+    script = CHILD_SCRIPT % {
+        "module": UPLOAD_MODULE,
+        "case": case,
+        "path": path,
+        "url": url,
+        "tmpdir": tmpdir,
+    }
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    result = subprocess.run(
+        [python or sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(sizes_mb=(1, 10, 20), python=None):
+    """
+    上传素材的峰值内存：比较以前 base64 解码到临时文件再上传与 WecomUploadStream 直接从文件存储按块上传
+    每次上传在新的解释器中进行，报告导入后到上传结束的峰值 RSS 增量；文件为随机内容，上传到本地替身服务。
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import bench_upload
+        bench_upload.run(sizes_mb=(1, 10, 20))
+    :param sizes_mb: 文件大小（MB）
+    :returns 报告的各行
+    """
+    workdir = tempfile.mkdtemp(prefix="wecom-bench-upload-")
+    rows = []
+    try:
+        with FakeWecomServer(FakeOrg(users=1)) as server:
+            token = requests.get(
+                server.url + "/cgi-bin/gettoken",
+                params={"corpid": "bench", "corpsecret": "bench"},
+                timeout=30,
+            ).json()["access_token"]
+            url = "%s/cgi-bin/media/upload?access_token=%s&type=file" % (server.url, token)
+            for size_mb in sizes_mb:
+                path = os.path.join(workdir, "media-%smb.bin" % size_mb)
+                with open(path, "wb") as fp:
+                    for _index in range(size_mb):
+                        fp.write(os.urandom(1024 * 1024))
+                size = os.path.getsize(path)
+                for name, case in CASES:
+                    tmpdir = tempfile.mkdtemp(dir=workdir)
+                    before = server.snapshot()
+                    result = _measure(case, path, url, tmpdir, python)
+                    delta = server.snapshot() - before
+                    if result["response"].get("errcode") or delta["media_bytes"] < size:
+                        raise RuntimeError("Upload of %s failed: %s" % (path, result["response"]))
+                    rows.append(
+                        {
+                            "size_mb": size_mb,
+                            "name": name,
+                            "peak_rss_mb": round(
+                                (result["peak_kb"] - result["baseline_kb"]) / 1024.0, 1
+                            ),
+                            "seconds": round(result["seconds"], 3),
+                        }
+                    )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report("Material upload peak RSS (above the interpreter after imports)", rows)
+    return rows
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+from contextlib import contextmanager
+
+from odoo.addons.wecom_api.api.wecom_token_cache import WecomTokenCache  # type: ignore
+from odoo.addons.wecom_api.api.wecom_response_cache import WecomResponseCache  # type: ignore
+
+# 不依赖公司配置的基准测试使用的企业ID和应用密钥，替身服务接受任意值
+BENCH_CORPID = "wwbench000000000000"
+BENCH_SECRET = "bench-secret"
+
+
+def timed(func, *args, **kwargs):
+    """
+    :returns (耗时（秒）, 返回值)
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def best_of(func, repeat=3):
+    """
+    :returns 重复调用 func 中最快一次的耗时（秒），排除 GC 和调度的干扰
+    """
+    return min(timed(func)[0] for _index in range(max(repeat, 1)))
+
+
+def summarize(name, durations, total=None, **extra):
+    """
+    汇总一组耗时
+    :param durations: 每次操作的耗时（秒）
+    :param total: 总耗时（秒），并发执行时不等于各次耗时之和
+    :returns 报告中的一行
+    """
+    durations = sorted(durations)
+    count = len(durations)
+    total = sum(durations) if total is None else total
+
+    def percentile(p):
+        if not durations:
+            return 0.0
+        return durations[min(int(count * p), count - 1)] * 1000
+
+    row = {
+        "name": name,
+        "count": count,
+        "seconds": round(total, 3),
+        "per_second": round(count / total, 1) if total else 0.0,
+        "p50_ms": round(percentile(0.5), 3),
+        "p95_ms": round(percentile(0.95), 3),
+    }
+    row.update(extra)
+    return row
+
+
+def print_report(title, rows, stream=None):
+    """
+    以对齐的表格输出报告
+    """
+    stream = stream or sys.stdout
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    widths = {
+        column: max([len(column)] + [len(str(row.get(column, ""))) for row in rows])
+        for column in columns
+    }
+    stream.write("\n%s\n" % title)
+    stream.write("  ".join(column.ljust(widths[column]) for column in columns) + "\n")
+    for row in rows:
+        stream.write(
+            "  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns)
+            + "\n"
+        )
+    stream.flush()
+
+
+@contextmanager
+def use_base_url(env, url):
+    """
+    临时将 wecom.api_base_url 指向 url，例如 FakeWecomServer.url
+    切换前后清空当前进程的令牌和响应缓存；数据库中保存的令牌在真实服务上会因 40014 自动刷新。
+    基准测试会提交事务，请在专用的数据库中运行。
+    """
+    ir_config = env["ir.config_parameter"].sudo()
+    previous = ir_config.get_param("wecom.api_base_url")
+    ir_config.set_param("wecom.api_base_url", url)
+    env.cr.commit()
+    WecomTokenCache.clear()
+    WecomResponseCache.clear()
+    try:
+        yield
+    finally:
+        env.cr.rollback()
+        ir_config.set_param("wecom.api_base_url", previous or False)
+        env.cr.commit()
+        WecomTokenCache.clear()
+        WecomResponseCache.clear()
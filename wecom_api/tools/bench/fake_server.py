@@ -0,0 +1,663 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import struct
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from urllib.parse import parse_qs, urlencode, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TOKEN_TTL = 7200  # 令牌有效期（秒），与企业微信一致
+DEPARTMENT_FANOUT = 10  # 部门树每个部门的子部门数
+
+
+class FakeOrg(object):
+    """
+    按序号生成的企业通讯录
+    成员、部门和标签都由序号计算得出，不在内存中保存，10 万成员的企业也只占用很少内存。
+    成员 i 属于部门 i % departments + 1，标签 i % tags + 1；部门 1 为根部门，其余部门每 10 个挂在同一个上级部门下。
+    """
+
+    def __init__(self, users=1000, departments=50, tags=20):
+        self.users = max(int(users), 0)
+        self.departments = max(int(departments), 1)
+        self.tags = max(int(tags), 0)
+
+    def userid(self, index):
+        return "user%06d" % index
+
+    def user_index(self, userid):
+        """
+        :returns 成员序号，成员不存在时返回 None
+        """
+        if not userid or not userid.lower().startswith("user"):
+            return None
+        try:
+            index = int(userid[4:])
+        except ValueError:
+            return None
+        return index if 0 <= index < self.users else None
+
+    def user(self, index):
+        department_id = index % self.departments + 1
+        tagid = index % self.tags + 1 if self.tags else None
+        return {
+            "userid": self.userid(index),
+            "name": "成员%s" % index,
+            "department": [department_id],
+            "order": [0],
+            "position": "工程师",
+            "mobile": "138%08d" % index,
+            "gender": str(index % 2 + 1),
+            "email": "%s@example.com" % self.userid(index),
+            "biz_mail": "",
+            "is_leader_in_dept": [0],
+            "direct_leader": [],
+            "avatar": "",
+            "thumb_avatar": "",
+            "telephone": "",
+            "alias": "",
+            "address": "",
+            "open_userid": "",
+            "main_department": department_id,
+            "extattr": {"attrs": []},
+            "status": 1,
+            "qr_code": "",
+            "external_position": "",
+            "external_profile": {"external_attr": []},
+            "isleader": 0,
+            "enable": 1,
+            "hide_mobile": 0,
+            "tagid": [tagid] if tagid else [],
+        }
+
+    def department_parent(self, department_id):
+        if department_id <= 1:
+            return 0
+        return (department_id - 2) // DEPARTMENT_FANOUT + 1
+
+    def department(self, department_id):
+        return {
+            "id": department_id,
+            "name": "部门%s" % department_id,
+            "name_en": "Department %s" % department_id,
+            "department_leader": [],
+            "parentid": self.department_parent(department_id),
+            "order": 100000000 - department_id,
+        }
+
+    def department_tree(self, department_id):
+        """
+        :returns 部门及其全部下级部门的 ID
+        """
+        if not 1 <= department_id <= self.departments:
+            return []
+        result = []
+        queue = [department_id]
+        while queue:
+            current = queue.pop(0)
+            result.append(current)
+            first = (current - 1) * DEPARTMENT_FANOUT + 2
+            queue.extend(range(first, min(first + DEPARTMENT_FANOUT, self.departments + 1)))
+        return result
+
+    def department_user_indexes(self, department_id):
+        if not 1 <= department_id <= self.departments:
+            return range(0)
+        return range(department_id - 1, self.users, self.departments)
+
+    def tag_user_indexes(self, tagid):
+        if not 1 <= tagid <= self.tags:
+            return range(0)
+        return range(tagid - 1, self.users, self.tags)
+
+
+class WecomCallbackEmitter(object):
+    """
+    生成企业微信回调请求：按企业微信的规则加密消息并计算签名
+    加解密独立于 wecom_msg_crtpt 实现，可以验证回调接收端的解密逻辑。
+    """
+
+    BODY_TEMPLATE = (
+        "<xml><ToUserName><![CDATA[%(corpid)s]]></ToUserName>"
+        "<AgentID><![CDATA[%(agentid)s]]></AgentID>"
+        "<Encrypt><![CDATA[%(encrypt)s]]></Encrypt></xml>"
+    )
+
+    def __init__(self, token, encoding_aes_key, corpid, agentid=""):
+        """
+        :param token: 回调服务的 Token
+        :param encoding_aes_key: 回调服务的 EncodingAESKey（43 位）
+        :param corpid: 企业ID
+        """
+        from Crypto.Cipher import AES
+
+        self.AES = AES
+        self.token = token
+        self.key = base64.b64decode(encoding_aes_key + "=")
+        self.corpid = corpid
+        self.agentid = agentid
+
+    def encrypt(self, message):
+        """
+        :param message: 明文 XML
+        :returns base64 编码的密文
+        """
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        text = os.urandom(16) + struct.pack("!I", len(message)) + message + self.corpid.encode("utf-8")
+        pad = 32 - len(text) % 32
+        text += bytes([pad]) * pad
+        cipher = self.AES.new(self.key, self.AES.MODE_CBC, self.key[:16])
+        return base64.b64encode(cipher.encrypt(text)).decode("ascii")
+
+    def sign(self, timestamp, nonce, encrypt):
+        return hashlib.sha1(
+            "".join(sorted([self.token, timestamp, nonce, encrypt])).encode("utf-8")
+        ).hexdigest()
+
+    def build(self, message):
+        """
+        :param message: 明文 XML
+        :returns (URL 参数, 请求体)
+        """
+        timestamp = str(int(time.time()))
+        nonce = str(random.randint(10 ** 8, 10 ** 9))
+        encrypt = self.encrypt(message)
+        params = {
+            "msg_signature": self.sign(timestamp, nonce, encrypt),
+            "timestamp": timestamp,
+            "nonce": nonce,
+        }
+        body = self.BODY_TEMPLATE % {
+            "corpid": self.corpid,
+            "agentid": self.agentid,
+            "encrypt": encrypt,
+        }
+        return params, body.encode("utf-8")
+
+    def post(self, url, message, timeout=10):
+        """
+        向回调地址发送一条加密的回调
+        :returns (HTTP 状态码, 响应内容)
+        """
+        params, body = self.build(message)
+        request = urllib.request.Request(
+            "%s%s%s" % (url, "&" if "?" in url else "?", urlencode(params)),
+            data=body,
+            headers={"Content-Type": "text/xml"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def contact_event_xml(org, index, corpid="", change_type=None):
+    """
+    生成通讯录变更事件的明文 XML，按序号轮流生成成员、部门和标签的变更
+    :param org: FakeOrg
+    :param index: 事件序号
+    """
+    if change_type is None:
+        change_type = ("update_user", "update_party", "update_tag")[index % 3]
+    if change_type.endswith("_user"):
+        userid = org.userid(index % max(org.users, 1))
+        fields = "<UserID><![CDATA[%s]]></UserID><Name><![CDATA[成员%s]]></Name>" % (userid, index)
+    elif change_type.endswith("_party"):
+        department_id = index % org.departments + 1
+        fields = "<Id>%s</Id><Name><![CDATA[部门%s]]></Name><ParentId>%s</ParentId>" % (
+            department_id,
+            department_id,
+            org.department_parent(department_id),
+        )
+    else:
+        tagid = index % max(org.tags, 1) + 1
+        fields = "<TagId>%s</TagId><AddUserItems><![CDATA[%s]]></AddUserItems>" % (
+            tagid,
+            org.userid(index % max(org.users, 1)),
+        )
+    return (
+        "<xml><ToUserName><![CDATA[%s]]></ToUserName><FromUserName><![CDATA[sys]]></FromUserName>"
+        "<CreateTime>%s</CreateTime><MsgType><![CDATA[event]]></MsgType>"
+        "<Event><![CDATA[change_contact]]></Event><ChangeType>%s</ChangeType>%s</xml>"
+    ) % (corpid, int(time.time()), change_type, fields)
+
+
+class FakeWecomHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，连接数可用于比较连接复用
+    disable_nagle_algorithm = True  # 响应头和响应体分两次写入，避免长连接上的 Nagle 与延迟确认叠加等待
+
+    def setup(self):
+        super(FakeWecomHandler, self).setup()
+        self.server.fake.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        body = self._read_body()
+        status, payload = self.server.fake.handle(
+            method, parts.path, query, body, self.headers.get("Content-Type", "")
+        )
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            # 客户端要求关闭连接时明确告知，否则客户端可能复用已关闭的连接
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeWecomServer(object):
+    """
+    企业微信 API 替身服务
+    实现 service_api_list_data.xml 中通讯录、标签、消息和素材的常用路由，
+    可注入延迟、错误码和 HTTP 5xx，并统计连接数、各路由的请求数和返回的错误码。
+    将系统参数 wecom.api_base_url 指向 url 属性即可让 API 调用发往本服务。
+    """
+
+    def __init__(
+        self,
+        org=None,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        errors=None,
+        http_error_rate=0.0,
+        token_ttl=DEFAULT_TOKEN_TTL,
+        corpid=None,
+        secret=None,
+        seed=None,
+    ):
+        """
+        :param org: FakeOrg，默认 1000 个成员
+        :param port: 监听端口，0 表示随机端口
+        :param latency: 每个请求的固定延迟（秒）
+        :param jitter: 在固定延迟上追加 0~jitter 秒的随机延迟
+        :param errors: {错误码: 概率}，例如 {42001: 0.01, 45009: 0.01, -1: 0.01}，不影响 gettoken
+        :param http_error_rate: 返回 HTTP 502 的概率
+        :param token_ttl: 令牌有效期（秒），过期后返回 42001
+        :param corpid: 只接受该企业ID，为空时接受任意企业ID
+        :param secret: 只接受该应用密钥，为空时接受任意密钥
+        """
+        self.org = org or FakeOrg()
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = dict(errors or {})
+        self.http_error_rate = http_error_rate
+        self.token_ttl = token_ttl
+        self.corpid = corpid
+        self.secret = secret
+        self.random = random.Random(seed)
+        self.routes = {
+            "/cgi-bin/gettoken": self.gettoken,
+            "/cgi-bin/department/list": self.department_list,
+            "/cgi-bin/department/simplelist": self.department_simplelist,
+            "/cgi-bin/user/get": self.user_get,
+            "/cgi-bin/user/simplelist": self.user_simplelist,
+            "/cgi-bin/user/list": self.user_list,
+            "/cgi-bin/user/list_id": self.user_list_id,
+            "/cgi-bin/tag/list": self.tag_list,
+            "/cgi-bin/tag/get": self.tag_get,
+            "/cgi-bin/tag/create": self.tag_create,
+            "/cgi-bin/tag/update": self.ok,
+            "/cgi-bin/tag/delete": self.ok,
+            "/cgi-bin/tag/addtagusers": self.tag_members,
+            "/cgi-bin/tag/deltagusers": self.tag_members,
+            "/cgi-bin/message/send": self.message_send,
+            "/cgi-bin/media/upload": self.media_upload,
+        }
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._sequence = 0
+        self.stats = Counter()
+        self._httpd = _HTTPServer((host, port), FakeWecomHandler)
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def start(self):
+        """
+        在后台线程中运行
+        """
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="fake-wecom-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = Counter()
+
+    def _next_id(self):
+        with self._lock:
+            self._sequence += 1
+            return self._sequence
+
+    # ------------------------------------------------------------
+    # 请求处理
+    # ------------------------------------------------------------
+    def handle(self, method, path, query, body, content_type=""):
+        """
+        :returns (HTTP 状态码, 响应 JSON)
+        """
+        route = self.routes.get(path)
+        self.count("requests")
+        self.count("route:%s" % path)
+        if route is None:
+            return 404, {"errcode": 404, "errmsg": "not found"}
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.http_error_rate and self.random.random() < self.http_error_rate:
+            self.count("http:502")
+            return 502, {"errcode": -1, "errmsg": "bad gateway"}
+
+        args = dict(query)
+        if method == "POST" and body and "multipart" not in content_type:
+            try:
+                args.update(json.loads(body))
+            except ValueError:
+                return self._error(40063, "invalid json")
+        if route != self.gettoken:
+            errcode = self._check_token(args.get("access_token")) or self._inject_error()
+            if errcode:
+                return self._error(errcode)
+        result = route(args, body)
+        if "errcode" not in result:
+            result = dict(errcode=0, errmsg="ok", **result)
+        self.count("errcode:%s" % result["errcode"])
+        return 200, result
+
+    def _error(self, errcode, errmsg=None):
+        self.count("errcode:%s" % errcode)
+        return 200, {"errcode": errcode, "errmsg": errmsg or "fake error %s" % errcode}
+
+    def _check_token(self, access_token):
+        if not access_token:
+            return 41001
+        with self._lock:
+            expires = self._tokens.get(access_token)
+        if expires is None:
+            return 40014
+        if expires <= time.monotonic():
+            return 42001
+        return 0
+
+    def _inject_error(self):
+        for errcode, rate in self.errors.items():
+            if rate and self.random.random() < rate:
+                return errcode
+        return 0
+
+    def expire_tokens(self):
+        """
+        使全部令牌立即过期，之后的请求返回 42001
+        """
+        with self._lock:
+            for token in self._tokens:
+                self._tokens[token] = 0
+
+    # ------------------------------------------------------------
+    # 路由
+    # ------------------------------------------------------------
+    def ok(self, args, body):
+        return {}
+
+    def gettoken(self, args, body):
+        if self.corpid and args.get("corpid") != self.corpid:
+            return {"errcode": 40013, "errmsg": "invalid corpid"}
+        if self.secret and args.get("corpsecret") != self.secret:
+            return {"errcode": 40001, "errmsg": "invalid secret"}
+        self.count("gettoken")
+        token = "fake-token-%s-%s" % (os.getpid(), self._next_id())
+        with self._lock:
+            self._tokens[token] = time.monotonic() + self.token_ttl
+        return {"access_token": token, "expires_in": self.token_ttl}
+
+    def department_list(self, args, body):
+        department_id = int(args.get("id") or 1)
+        return {
+            "department": [
+                self.org.department(item) for item in self.org.department_tree(department_id)
+            ]
+        }
+
+    def department_simplelist(self, args, body):
+        department_id = int(args.get("id") or 1)
+        return {
+            "department_id": [
+                {
+                    "id": item,
+                    "parentid": self.org.department_parent(item),
+                    "order": 100000000 - item,
+                }
+                for item in self.org.department_tree(department_id)
+            ]
+        }
+
+    def user_get(self, args, body):
+        index = self.org.user_index(args.get("userid"))
+        if index is None:
+            return {"errcode": 60111, "errmsg": "userid not found"}
+        return self.org.user(index)
+
+    def _department_users(self, args):
+        department_id = int(args.get("department_id") or 1)
+        departments = (
+            self.org.department_tree(department_id)
+            if str(args.get("fetch_child")) == "1"
+            else [department_id]
+        )
+        for item in departments:
+            for index in self.org.department_user_indexes(item):
+                yield index
+
+    def user_simplelist(self, args, body):
+        return {
+            "userlist": [
+                {
+                    "userid": self.org.userid(index),
+                    "name": "成员%s" % index,
+                    "department": [index % self.org.departments + 1],
+                }
+                for index in self._department_users(args)
+            ]
+        }
+
+    def user_list(self, args, body):
+        return {"userlist": [self.org.user(index) for index in self._department_users(args)]}
+
+    def user_list_id(self, args, body):
+        offset = int(args.get("cursor") or 0)
+        limit = min(max(int(args.get("limit") or 1000), 1), 10000)
+        end = min(offset + limit, self.org.users)
+        return {
+            "next_cursor": str(end) if end < self.org.users else "",
+            "dept_user": [
+                {
+                    "userid": self.org.userid(index),
+                    "department": index % self.org.departments + 1,
+                }
+                for index in range(offset, end)
+            ],
+        }
+
+    def tag_list(self, args, body):
+        return {
+            "taglist": [
+                {"tagid": tagid, "tagname": "标签%s" % tagid}
+                for tagid in range(1, self.org.tags + 1)
+            ]
+        }
+
+    def tag_get(self, args, body):
+        tagid = int(args.get("tagid") or 0)
+        if not 1 <= tagid <= self.org.tags:
+            return {"errcode": 40068, "errmsg": "invalid tagid"}
+        return {
+            "tagname": "标签%s" % tagid,
+            "userlist": [
+                {"userid": self.org.userid(index), "name": "成员%s" % index}
+                for index in self.org.tag_user_indexes(tagid)
+            ],
+            "partylist": [],
+        }
+
+    def tag_create(self, args, body):
+        return {"tagid": int(args.get("tagid") or self.org.tags + self._next_id())}
+
+    def tag_members(self, args, body):
+        return {"invalidlist": "", "invalidparty": []}
+
+    def message_send(self, args, body):
+        self.count("messages")
+        return {
+            "invaliduser": "",
+            "invalidparty": "",
+            "invalidtag": "",
+            "unlicenseduser": "",
+            "msgid": "fake-msg-%s" % self._next_id(),
+            "response_code": "",
+        }
+
+    def media_upload(self, args, body):
+        self.count("media_bytes", len(body))
+        return {
+            "type": args.get("type") or "file",
+            "media_id": "fake-media-%s" % self._next_id(),
+            "created_at": str(int(time.time())),
+        }
+
+
+def _parse_error(value):
+    errcode, _sep, rate = value.partition(":")
+    return int(errcode), float(rate or 0.01)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="企业微信 API 替身服务，将系统参数 wecom.api_base_url 指向本服务的地址"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18069)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--departments", type=int, default=50)
+    parser.add_argument("--tags", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="追加的随机延迟上限（秒）")
+    parser.add_argument(
+        "--error",
+        action="append",
+        type=_parse_error,
+        default=[],
+        metavar="ERRCODE:RATE",
+        help="按概率返回错误码，例如 --error 45009:0.01 --error -1:0.005",
+    )
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="返回 HTTP 502 的概率")
+    parser.add_argument("--token-ttl", type=int, default=DEFAULT_TOKEN_TTL)
+    parser.add_argument("--corpid")
+    parser.add_argument("--secret")
+    options = parser.parse_args(argv)
+
+    server = FakeWecomServer(
+        FakeOrg(options.users, options.departments, options.tags),
+        host=options.host,
+        port=options.port,
+        latency=options.latency,
+        jitter=options.jitter,
+        errors=dict(options.error),
+        http_error_rate=options.http_error_rate,
+        token_ttl=options.token_ttl,
+        corpid=options.corpid,
+        secret=options.secret,
+    )
+    sys.stdout.write(
+        "Fake WeCom server on %s (users=%s, departments=%s, tags=%s)\n"
+        % (server.url, options.users, options.departments, options.tags)
+    )
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout.write("%s\n" % json.dumps(server.snapshot(), sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
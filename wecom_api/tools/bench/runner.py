@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException  # type: ignore
+
+from .common import print_report, summarize, timed, use_base_url
+from .fake_server import FakeOrg, FakeWecomServer, WecomCallbackEmitter, contact_event_xml
+
+_logger = logging.getLogger(__name__)
+
+SECTIONS = ("sync_contacts", "callbacks", "messages")
+
+
+def _server_columns(server, before):
+    """
+    :returns 替身服务在本项测试期间收到的请求数、连接数和非 0 错误码
+    """
+    delta = server.snapshot() - before
+    errcodes = sorted(
+        "%s:%s" % (key[len("errcode:") :], value)
+        for key, value in delta.items()
+        if key.startswith("errcode:") and key != "errcode:0"
+    )
+    return {
+        "requests": delta["requests"],
+        "connections": delta["connections"],
+        "gettoken": delta["gettoken"],
+        "errcodes": ",".join(errcodes) or "-",
+    }
+
+
+def _get_contacts_app(env, company):
+    return env["wecom.apps"].sudo().search(
+        [("company_id", "=", company.id), ("type_code", "=", "['contacts']")], limit=1
+    )
+
+
+def bench_sync_contacts(env, server, company):
+    """
+    完整同步一次通讯录：部门、成员和标签
+    """
+    app = _get_contacts_app(env, company)
+    if not app:
+        _logger.warning("Company [%s] has no contacts app, skip sync_contacts.", company.name)
+        return []
+    before = server.snapshot()
+    seconds, _result = timed(app.sync_contacts)
+    env.cr.commit()
+    return [
+        summarize("sync_contacts", [seconds], users=server.org.users, **_server_columns(server, before))
+    ]
+
+
+def bench_callbacks(env, server, company, count, service_code="contacts", odoo_url=None):
+    """
+    接收并处理通讯录变更回调
+    指定 odoo_url 时向运行中的 Odoo 发送 HTTP 请求，否则在当前进程中执行回调控制器的解密和写入收件箱；
+    随后由 wecom.app.callback.inbox 的 cron_process 处理收件箱，计时包含事件处理中调用替身服务的时间。
+    """
+    callback_service = env["wecom.app_callback_service"].sudo()
+    context = callback_service._get_callback_context(company.id, service_code)
+    if not context or not context[1]:
+        _logger.warning(
+            "Company [%s] has no active callback service [%s], skip callbacks.",
+            company.name,
+            service_code,
+        )
+        return []
+    service = callback_service.browse(context[0])
+    emitter = WecomCallbackEmitter(
+        service.callback_url_token, service.callback_aeskey, company.corpid
+    )
+    inbox = env["wecom.app.callback.inbox"].sudo()
+    url = "%s/wecom_callback/%s/%s" % ((odoo_url or "").rstrip("/"), company.id, service_code)
+
+    durations = []
+    for index in range(count):
+        message = contact_event_xml(server.org, index, company.corpid)
+        if odoo_url:
+            seconds, (status, _body) = timed(emitter.post, url, message)
+            if status != 200:
+                _logger.warning("Callback %s rejected with HTTP %s", index, status)
+        else:
+            params, body = emitter.build(message)
+            start = time.perf_counter()
+            crypt = callback_service._get_callback_context(company.id, service_code)[4]
+            ret, plaintext = crypt.DecryptMsg(
+                body, params["msg_signature"], params["timestamp"], params["nonce"]
+            )
+            if ret == 0:
+                inbox.receive(company, service_code, plaintext)
+            env.cr.commit()
+            seconds = time.perf_counter() - start
+        durations.append(seconds)
+    rows = [summarize("callbacks_receive", durations, via="http" if odoo_url else "inline")]
+
+    env.cr.commit()  # 开始新的事务，读取 HTTP 请求写入的回调
+    before = server.snapshot()
+    start = time.perf_counter()
+    processed = 0
+    while True:
+        batch = inbox.cron_process()
+        env.cr.commit()
+        if not batch:
+            break
+        processed += batch
+    seconds = time.perf_counter() - start
+    row = summarize("callbacks_process", [seconds], **_server_columns(server, before))
+    row.update(count=processed, per_second=round(processed / seconds, 1) if seconds else 0.0)
+    rows.append(row)
+    return rows
+
+
+def bench_messages(env, server, company, count):
+    """
+    发送应用消息：逐条调用 httpCall，以及通过 httpCallMany 并发发送
+    """
+    app = _get_contacts_app(env, company)
+    if not app:
+        return []
+    wxapi = env["wecom.service_api"].InitServiceApi(company.corpid, app.secret)
+    url_type = env["wecom.service_api_list"].get_server_api_call("MESSAGE_SEND")
+    args_list = [
+        {
+            "touser": server.org.userid(index % max(server.org.users, 1)),
+            "msgtype": "text",
+            "agentid": app.agentid,
+            "text": {"content": "benchmark message %s" % index},
+        }
+        for index in range(count)
+    ]
+
+    rows = []
+    before = server.snapshot()
+    durations = []
+    for args in args_list:
+        start = time.perf_counter()
+        try:
+            wxapi.httpCall(url_type, args)
+        except ApiException as e:
+            _logger.warning("MESSAGE_SEND failed: %s", e)
+        durations.append(time.perf_counter() - start)
+    rows.append(summarize("messages_httpCall", durations, **_server_columns(server, before)))
+
+    before = server.snapshot()
+    seconds, _responses = timed(wxapi.httpCallMany, url_type, args_list)
+    row = summarize("messages_httpCallMany", [seconds], **_server_columns(server, before))
+    row.update(count=count, per_second=round(count / seconds, 1) if seconds else 0.0)
+    rows.append(row)
+    return rows
+
+
+def run(
+    env,
+    company=None,
+    users=1000,
+    departments=50,
+    tags=20,
+    latency=0.0,
+    jitter=0.0,
+    errors=None,
+    http_error_rate=0.0,
+    callbacks=300,
+    messages=300,
+    service_code="contacts",
+    odoo_url=None,
+    sections=SECTIONS,
+):
+    """
+    启动替身服务，将 wecom.api_base_url 临时指向它，端到端测量通讯录同步、回调和消息发送
+    在 odoo-bin shell 中运行，会提交事务，请使用专用的数据库：
+        from odoo.addons.wecom_api.tools.bench import runner
+        runner.run(env, users=100000, departments=5000, tags=1000, latency=0.02, errors={45009: 0.01})
+    :param company: 公司，默认当前公司，需要配置企业ID和通讯录应用
+    :param errors: {错误码: 概率}，见 FakeWecomServer
+    :param odoo_url: 运行中的 Odoo 地址，指定时回调通过 HTTP 发送
+    :returns 报告的各行
+    """
+    company = company or env.company
+    server = FakeWecomServer(
+        FakeOrg(users, departments, tags),
+        latency=latency,
+        jitter=jitter,
+        errors=errors,
+        http_error_rate=http_error_rate,
+    )
+    rows = []
+    with server, use_base_url(env, server.url):
+        if "sync_contacts" in sections:
+            rows += bench_sync_contacts(env, server, company)
+        if "callbacks" in sections:
+            rows += bench_callbacks(env, server, company, callbacks, service_code, odoo_url)
+        if "messages" in sections:
+            rows += bench_messages(env, server, company, messages)
+    print_report(
+        "WeCom benchmark against %s (users=%s, departments=%s, tags=%s, latency=%ss)"
+        % (server.url, users, departments, tags, latency),
+        rows,
+    )
+    return rows
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import logging
+import subprocess
+
+_logger = logging.getLogger(__name__)
+
+REPLY_PREFIX = "WECOM_BENCH "  # 子进程输出中的结果行，与日志区分
+
+
+def _spawn(env, corpid, secret, userid):
+    """
+    启动一个独立的工作进程，自行加载注册表并使用自己的数据库连接，与 prefork 的工作进程相同
+    配置通过标准输入传递，不出现在进程参数中
+    """
+    from odoo.tools import config
+
+    args = ["--addons-path", config["addons_path"]]
+    if config.rcfile and os.path.exists(config.rcfile):
+        args = ["-c", config.rcfile] + args
+    for key, flag in (
+        ("db_host", "--db_host"),
+        ("db_port", "--db_port"),
+        ("db_user", "--db_user"),
+        ("db_password", "--db_password"),
+        ("data_dir", "--data-dir"),
+    ):
+        if config.get(key):
+            args += [flag, str(config[key])]
+    child_env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        env=child_env,
+        text=True,
+    )
+    options = {
+        "args": args,
+        "dbname": env.cr.dbname,
+        "corpid": corpid,
+        "secret": secret,
+        "userid": userid,
+    }
+    proc.stdin.write(json.dumps(options) + "\n")
+    proc.stdin.flush()
+    return proc
+
+
+def _read_reply(proc):
+    while True:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("Benchmark worker %s exited with %s" % (proc.pid, proc.wait()))
+        if line.startswith(REPLY_PREFIX):
+            return json.loads(line[len(REPLY_PREFIX) :])
+
+
+def _reply(value):
+    sys.stdout.write(REPLY_PREFIX + json.dumps(value) + "\n")
+    sys.stdout.flush()
+
+
+def _worker_main():
+    """
+    子进程：读取已提交的令牌，收到 go 后调用一次 USER_GET；令牌被拒绝（42001）时按正常流程协调刷新
+    """
+    options = json.loads(sys.stdin.readline())
+    import odoo
+    from odoo import api, SUPERUSER_ID
+
+    odoo.tools.config.parse_config(options["args"])
+    registry = odoo.registry(options["dbname"])
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        wxapi = env["wecom.service_api"].InitServiceApi(options["corpid"], options["secret"])
+        url_type = env["wecom.service_api_list"].get_server_api_call("USER_GET")
+        _reply({"ready": True, "token": wxapi.access_token})
+        for line in sys.stdin:
+            if line.strip() != "go":
+                break
+            try:
+                wxapi.httpCall(url_type, {"userid": options["userid"]})
+                _reply({"ok": True, "token": wxapi.access_token})
+            except Exception as e:
+                _reply({"ok": False, "error": str(e)})
+
+
+def run(env, workers=8, rounds=3):
+    """
+    多进程令牌刷新测试
+    父进程获取并提交令牌后启动 workers 个独立进程，它们应直接复用数据库中的令牌；
+    每一轮替身服务使全部令牌失效，各进程同时调用 API 收到 42001，
+    通过咨询锁协调后只有一个进程请求 GET_ACCESS_TOKEN，其余进程读取它提交的新令牌。
+    在 odoo-bin shell 中运行：
+        from odoo.addons.wecom_api.tools.bench import token_refresh
+        token_refresh.run(env, workers=16)
+    :returns 每轮的结果，GET_ACCESS_TOKEN 次数不符合预期时抛出 AssertionError
+    """
+    from .common import BENCH_CORPID, BENCH_SECRET, print_report, use_base_url
+    from .fake_server import FakeOrg, FakeWecomServer
+
+    server = FakeWecomServer(FakeOrg(users=10))
+    userid = server.org.userid(0)
+    rows = []
+    with server, use_base_url(env, server.url):
+        # 删除之前运行留下的令牌，由父进程请求第一个令牌
+        env["wecom.service_api"].sudo().search(
+            [("corpid", "=", BENCH_CORPID), ("secret", "=", BENCH_SECRET)]
+        ).unlink()
+        env.cr.commit()
+        env["wecom.service_api"].InitServiceApi(BENCH_CORPID, BENCH_SECRET)
+        env.cr.commit()
+
+        before = server.snapshot()
+        procs = [_spawn(env, BENCH_CORPID, BENCH_SECRET, userid) for _index in range(workers)]
+        try:
+            replies = [_read_reply(proc) for proc in procs]
+            rows.append(
+                {
+                    "round": "start",
+                    "workers": workers,
+                    "ok": sum(1 for reply in replies if reply.get("ready")),
+                    "tokens": len({reply.get("token") for reply in replies}),
+                    "gettoken": (server.snapshot() - before)["gettoken"],
+                    "expected": 0,
+                }
+            )
+            for round_index in range(1, rounds + 1):
+                server.expire_tokens()
+                before = server.snapshot()
+                for proc in procs:
+                    proc.stdin.write("go\n")
+                    proc.stdin.flush()
+                replies = [_read_reply(proc) for proc in procs]
+                for reply in replies:
+                    if not reply.get("ok"):
+                        _logger.warning("Benchmark worker failed: %s", reply.get("error"))
+                rows.append(
+                    {
+                        "round": round_index,
+                        "workers": workers,
+                        "ok": sum(1 for reply in replies if reply.get("ok")),
+                        "tokens": len({reply.get("token") for reply in replies}),
+                        "gettoken": (server.snapshot() - before)["gettoken"],
+                        "expected": 1,
+                    }
+                )
+        finally:
+            for proc in procs:
+                try:
+                    proc.stdin.close()
+                    proc.wait(timeout=30)
+                except Exception:
+                    proc.kill()
+    print_report("Token refresh across %s worker processes" % workers, rows)
+    unexpected = [row for row in rows if row["gettoken"] != row["expected"]]
+    if unexpected:
+        raise AssertionError("Unexpected GET_ACCESS_TOKEN calls: %s" % unexpected)
+    return rows
+
+
+if __name__ == "__main__":
+    _worker_main()
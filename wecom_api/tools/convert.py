@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
-import html2text
 from odoo import api, models, tools, _
+from ..api.wecom_lazy import lazy_import
+
+html2text = lazy_import("html2text")
 
 class WecomApiToolsTypeConvert(models.AbstractModel):
     _name = "wecomapi.tools.convert"
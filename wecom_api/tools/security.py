@@ -5,11 +5,11 @@ import logging
 import hashlib
 import random
 import hashlib
-from Crypto.Cipher import AES
-from passlib.context import CryptContext
 import xml.etree.cElementTree as ET
 import hashlib
+from ..api.wecom_lazy import lazy_import
 
+passlib_context = lazy_import("passlib.context")
 
 _logger = logging.getLogger(__name__)
 
@@ -43,7 +43,7 @@ class WecomApiToolsSecurity(models.AbstractModel):
         else:
             passwd = "".join(random.choice(NUMLIST) for i in range(int(rang)))
 
-        crypt_context = CryptContext(
+        crypt_context = passlib_context.CryptContext(
             schemes=["pbkdf2_sha512", "plaintext"], deprecated=["plaintext"]
         )
         hash_password = (
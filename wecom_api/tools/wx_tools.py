@@ -4,10 +4,8 @@ from PIL import Image
 import os
 import base64
 import random
-import html2text
 import platform
 import hashlib
-from passlib.context import CryptContext
 
 from odoo import api, models, tools, _
 from odoo.modules.module import get_module_resource
@@ -29,10 +29,12 @@
         "views/res_company_views.xml",
         "views/wecom_service_api_list_views.xml",
         "views/wecom_service_api_error_views.xml",
+        "views/wecom_api_outbox_views.xml",
         "views/wecom_apps_views.xml",
         "views/wecom_app_config_views.xml",
         "views/wecom_app_callback_service_views.xml",
         "views/wecom_app_event_type_views.xml",
+        "views/wecom_app_callback_inbox_views.xml",
         "views/wecom_app_type_views.xml",
         "views/wecom_app_subtype_views.xml",
         "views/wecom_base_views.xml",
@@ -18,3 +18,5 @@ from . import wecom_apps
 from . import wecom_app_callback_service
 from . import wecom_app_config
 from . import wecom_app_event_type
+from . import wecom_app_callback_inbox
+from . import wecom_app_callback_dedup
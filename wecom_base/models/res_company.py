@@ -22,4 +22,9 @@ class Company(models.Model):
         string="Expiration time of Wecom JSAPI ticket", copy=False
     )
 
-    
\ No newline at end of file
+    def write(self, vals):
+        res = super(Company, self).write(vals)
+        if "corpid" in vals or "contacts_app_id" in vals:
+            # 回调服务的解密上下文使用企业ID和通讯录应用
+            self.env["wecom.app_callback_service"].clear_caches()
+        return res
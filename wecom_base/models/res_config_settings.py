@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import json
 from datetime import datetime, timedelta
 from random import weibullvariate
 from odoo import models, fields, api, _
@@ -35,6 +36,11 @@ class ResConfigSettings(models.TransientModel):
     )
 
     debug_enabled = fields.Boolean("Turn on debug mode", default=True)
+    trace_sample_rate = fields.Float(
+        "Trace sample rate",
+        config_parameter="wecom.trace_sample_rate",
+        default=1.0,
+    )  # 成功请求的采样比例，失败的请求总是记录
 
     resources_path = fields.Char(
         "WeCom resources storage path",
@@ -51,6 +57,20 @@ class ResConfigSettings(models.TransientModel):
         config_parameter="wecom.global_error_code_item_selection_code",
     )  # 错误码排查方法的选取属性。
 
+    circuit_failure_threshold = fields.Integer(
+        "Circuit breaker failure threshold",
+        config_parameter="wecom.circuit_failure_threshold",
+        default=5,
+    )
+    circuit_cooldown = fields.Integer(
+        "Circuit breaker cool-down (seconds)",
+        config_parameter="wecom.circuit_cooldown",
+        default=30,
+    )
+    open_circuits = fields.Text(
+        "Open circuits", compute="_compute_open_circuits"
+    )  # 当前工作进程中未关闭的熔断器
+
     module_rainbow_community_theme = fields.Boolean("Rainbow Community Theme")
     module_wecom_contacts = fields.Boolean("WeCom Contacts")
     module_wecom_contacts_sync = fields.Boolean("WeCom Contacts Synchronized")
@@ -74,6 +94,45 @@ class ResConfigSettings(models.TransientModel):
         ir_config = self.env["ir.config_parameter"].sudo()
         ir_config.set_param("wecom.debug_enabled", self.debug_enabled or "False")
 
+    def action_dump_wecom_api_traces(self):
+        """
+        下载当前工作进程的 API 跟踪记录
+        """
+        records = self.env["wecom.abstract_api"].get_trace_records()
+        attachment = self.env["ir.attachment"].create(
+            {
+                "name": "wecom_api_traces_%s.json"
+                % fields.Datetime.now().strftime("%Y%m%d%H%M%S"),
+                "raw": json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8"),
+                "mimetype": "application/json",
+                "res_model": self._name,
+            }
+        )
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/web/content/%s?download=true" % attachment.id,
+            "target": "self",
+        }
+
+    def _compute_open_circuits(self):
+        states = self.env["wecom.abstract_api"].get_circuit_breaker_state(
+            only_open=True
+        )
+        lines = [
+            "%s / %s: %s, %s failures, retry in %.0fs, last error: %s"
+            % (
+                state["key"][0] or "-",
+                state["key"][1],
+                state["state"],
+                state["failures"],
+                state["retry_in_seconds"],
+                state["last_error"],
+            )
+            for state in states
+        ]
+        for record in self:
+            record.open_circuits = "\n".join(lines) or _("All circuits are closed.")  # type: ignore
+
     def open_wecom_company(self):
         return {
             "type": "ir.actions.act_window",
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models
+from odoo.addons.wecom_api.api.wecom_callback_dedup import (  # type: ignore
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_TTL,
+    WecomCallbackDedup,
+    make_dedup_key,
+)
+
+
+class WeComAppCallbackDedup(models.Model):
+    """
+    已接收回调的去重键
+    唯一索引保证多个工作进程同时收到同一回调的重试时只有一个写入收件箱，超过有效期的键由自动清理删除。
+    """
+
+    _name = "wecom.app.callback.dedup"
+    _description = "Wecom Application Callback Dedup Key"
+    _log_access = False
+
+    key = fields.Char("Key", required=True, readonly=True)
+    received_date = fields.Datetime(
+        "Received Date", required=True, readonly=True, default=fields.Datetime.now, index=True
+    )
+
+    _sql_constraints = [
+        ("key_uniq", "unique (key)", "The callback dedup key must be unique!"),
+    ]
+
+    @api.model
+    def is_duplicate(self, company_id, xml_tree, event=None):
+        """
+        判断回调是否已经接收过，未接收过时记住它
+        先查进程内的 LRU，未命中再写入去重表，写入冲突说明其他请求已经接收
+        :param company_id: 公司
+        :param xml_tree: 明文 XML
+        :param event: 已解码的 WecomCallbackEvent，为空时不去重
+        :returns 是否重复
+        """
+        if event is None:
+            return False
+        key = make_dedup_key(company_id.corpid if company_id else "", event.data, xml_tree)
+
+        ir_config = self.env["ir.config_parameter"].sudo()
+        ttl = int(ir_config.get_param("wecom.callback_dedup_ttl", DEFAULT_TTL))
+        if ttl <= 0:
+            return False
+        if WecomCallbackDedup.seen(key, ttl):
+            return True
+        max_entries = int(
+            ir_config.get_param("wecom.callback_dedup_cache_size", DEFAULT_MAX_ENTRIES)
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO wecom_app_callback_dedup (key, received_date)
+            VALUES (%s, now() at time zone 'UTC')
+            ON CONFLICT (key) DO NOTHING
+            RETURNING id
+            """,
+            (key,),
+        )
+        if not self.env.cr.fetchone():
+            WecomCallbackDedup.add(key, ttl, max_entries)
+            return True
+        # 事务提交后才记入 LRU，回滚时重试的回调仍会被接收
+        self.env.cr.postcommit.add(lambda: WecomCallbackDedup.add(key, ttl, max_entries))
+        return False
+
+    @api.autovacuum
+    def _gc_expired(self):
+        """
+        删除超过有效期的去重键
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        ttl = int(ir_config.get_param("wecom.callback_dedup_ttl", DEFAULT_TTL))
+        self.env.cr.execute(
+            """
+            DELETE FROM wecom_app_callback_dedup
+            WHERE received_date < now() at time zone 'UTC' - %s * interval '1 second'
+            """,
+            (max(ttl, 0),),
+        )
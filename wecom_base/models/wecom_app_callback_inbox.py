@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100  # 每批处理的回调数
+DEFAULT_MAX_ATTEMPTS = 3  # 最多处理次数，超过后标记为失败
+DEFAULT_RETENTION_DAYS = 7  # 已处理的回调保留天数
+RETRY_BASE_DELAY = 60  # 首次重试的等待时间（秒），之后按 2^n 增长
+DEFAULT_POLL_INTERVAL = 5  # 独立消费进程没有待处理回调时的轮询间隔（秒）
+
+
+class WeComAppCallbackInbox(models.Model):
+    """
+    企业微信回调收件箱
+    回调请求验证、解密后只写入收件箱并立即返回 "success"，避免企业微信在 5 秒内收不到响应而重试；
+    事件处理代码、ORM 写入和调用企业微信API 都由定时任务分批执行。
+    同一成员、部门或标签（entity_key）的回调严格按接收顺序处理：前面的回调等待重试或已失败时，
+    后面的回调不会被领取，失败的回调重新处理或删除后才继续，避免旧的变更覆盖新的状态。
+    """
+
+    _name = "wecom.app.callback.inbox"
+    _description = "Wecom Application Callback Inbox"
+    _order = "id"
+
+    company_id = fields.Many2one("res.company", string="Company", index=True, readonly=True)
+    service_code = fields.Char("Service Code", readonly=True)
+    entity_key = fields.Char("Entity Key", readonly=True, index=True)
+    xml_tree = fields.Text("Message", readonly=True)  # 解密后的明文 XML
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        string="Status",
+        required=True,
+        default="pending",
+        readonly=True,
+        index=True,
+    )
+    attempts = fields.Integer("Attempts", readonly=True, default=0)
+    next_attempt = fields.Datetime(
+        "Next Attempt", readonly=True, default=fields.Datetime.now, index=True
+    )
+    processed_date = fields.Datetime("Processed Date", readonly=True)
+    last_error = fields.Text("Last Error", readonly=True)
+
+    @api.model
+    def receive(self, company_id, service_code, xml_tree):
+        """
+        保存解密后的回调消息，并唤醒处理收件箱的定时任务
+        :param company_id: 公司
+        :param service_code: 回调服务代码
+        :param xml_tree: 明文 XML
+        :returns 收件箱记录，重复的回调返回空记录
+        """
+        try:
+            event = WecomCallbackEvent(xml_tree)
+        except Exception as e:
+            # 无法解析的消息仍然保存，处理失败后可在收件箱中查看
+            _logger.warning("Unable to decode WeChat Work callback of service [%s]: %s", service_code, e)
+            event = None
+        if self.env["wecom.app.callback.dedup"].sudo().is_duplicate(company_id, xml_tree, event):
+            _logger.info(_("Drop duplicate WeChat Work callback of service [%s]."), service_code)
+            return self.browse()
+        item = self.sudo().create(
+            {
+                "company_id": company_id.id if company_id else False,
+                "service_code": service_code,
+                "entity_key": event.entity_key if event is not None else False,
+                "xml_tree": xml_tree.decode("utf-8") if isinstance(xml_tree, bytes) else xml_tree,
+            }
+        )
+        cron = self.env.ref(
+            "wecom_base.ir_cron_process_wecom_callback_inbox", raise_if_not_found=False
+        )
+        if cron:
+            cron.sudo()._trigger()
+        return item
+
+    def action_retry(self):
+        """
+        重新处理失败的回调，同一对象后续的回调在它处理完成后继续处理
+        """
+        self.filtered(lambda item: item.state == "failed").write(
+            {"state": "pending", "attempts": 0, "next_attempt": fields.Datetime.now()}
+        )
+
+    @api.model
+    def cron_process(self, limit=None):
+        """
+        分批处理到期的回调，每批处理后提交
+        多个工作进程可以同时调用，已被其他进程锁定的回调会被跳过；
+        同一 entity_key 还有更早的待处理或失败的回调时不领取，等前一条处理完后在下一批领取
+        :returns 处理的回调数
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        limit = limit or int(
+            ir_config.get_param("wecom.callback_inbox_batch_size", DEFAULT_BATCH_SIZE)
+        )
+        processed = 0
+        while True:
+            self.flush_model()
+            self.env.cr.execute(
+                """
+                SELECT id FROM wecom_app_callback_inbox
+                WHERE state = 'pending' AND next_attempt <= now() at time zone 'UTC'
+                AND NOT EXISTS (
+                    SELECT 1 FROM wecom_app_callback_inbox earlier
+                    WHERE earlier.entity_key = wecom_app_callback_inbox.entity_key
+                    AND earlier.company_id IS NOT DISTINCT FROM wecom_app_callback_inbox.company_id
+                    AND earlier.state IN ('pending', 'failed')
+                    AND earlier.id < wecom_app_callback_inbox.id
+                )
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (limit,),
+            )
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+            self.sudo().browse(ids)._process_batch()
+            processed += len(ids)
+            if self.env.registry.in_test_mode():
+                break
+            self.env.cr.commit()  # type: ignore
+        return processed
+
+    @api.model
+    def run_consumer(self, poll_interval=DEFAULT_POLL_INTERVAL, max_idle=None):
+        """
+        在定时任务之外持续处理收件箱
+        ir.cron 同一任务同时只运行一个实例，回调量大时可以在额外的进程中运行，例如：
+        odoo-bin shell -d <db> 中执行 env["wecom.app.callback.inbox"].run_consumer()
+        多个消费进程与定时任务可以同时运行，同一对象的回调仍按顺序处理。
+        :param poll_interval: 没有待处理回调时的等待时间（秒）
+        :param max_idle: 连续空闲超过该秒数后退出，为空时一直运行
+        :returns 处理的回调数
+        """
+        processed = 0
+        idle_since = time.monotonic()
+        while True:
+            count = self.cron_process()
+            processed += count
+            if count:
+                idle_since = time.monotonic()
+                continue
+            # 结束当前事务，下次查询才能看到其他进程新写入的回调
+            self.env.cr.commit()  # type: ignore
+            if max_idle is not None and time.monotonic() - idle_since >= max_idle:
+                return processed
+            time.sleep(poll_interval)
+
+    def _process_batch(self):
+        """
+        按接收顺序处理回调，单条失败只回滚该条的修改
+        """
+        event_type = self.env["wecom.app.event_type"].sudo()
+        for item in self:
+            try:
+                with self.env.cr.savepoint():
+                    event_type._process_event(item.xml_tree, item.company_id)
+            except Exception as e:
+                _logger.exception(
+                    "Error processing WeChat Work callback inbox item %s: %s", item.id, str(e)
+                )
+                item._record_failure(e)
+            else:
+                item.write(
+                    {
+                        "state": "done",
+                        "attempts": item.attempts + 1,
+                        "processed_date": fields.Datetime.now(),
+                        "last_error": False,
+                    }
+                )
+
+    def _record_failure(self, ex):
+        ir_config = self.env["ir.config_parameter"].sudo()
+        max_attempts = int(
+            ir_config.get_param("wecom.callback_inbox_max_attempts", DEFAULT_MAX_ATTEMPTS)
+        )
+        attempts = self.attempts + 1
+        vals = {"attempts": attempts, "last_error": str(ex)}
+        if attempts < max_attempts:
+            vals["next_attempt"] = fields.Datetime.now() + timedelta(
+                seconds=RETRY_BASE_DELAY * 2 ** (attempts - 1)
+            )
+        else:
+            vals["state"] = "failed"
+            _logger.warning(
+                _("WeCom callback inbox item %s failed: %s"), self.id, vals["last_error"]
+            )
+        self.write(vals)
+
+    @api.autovacuum
+    def _gc_processed(self):
+        """
+        删除超过保留天数的已处理回调
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        days = int(
+            ir_config.get_param("wecom.callback_inbox_retention_days", DEFAULT_RETENTION_DAYS)
+        )
+        self.sudo().search(
+            [
+                ("state", "=", "done"),
+                ("processed_date", "<", fields.Datetime.now() - timedelta(days=days)),
+            ]
+        ).unlink()
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import requests
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
+from odoo.addons.wecom_api.api.wecom_abstract_api import make_url  # type: ignore
+from odoo.addons.wecom_api.api.wecom_msg_crtpt import WecomMsgCrypt  # type: ignore
 
 
 class WeComAppCallbackService(models.Model):
@@ -104,7 +106,10 @@ class WeComAppCallbackService(models.Model):
             # 这里应该调用企业微信的API来验证回调配置
             # 以下是一个示例，实际实现需要根据企业微信的API文档来编写
             response = requests.post(
-                "https://qyapi.weixin.qq.com/cgi-bin/callback/check",
+                make_url(
+                    "/cgi-bin/callback/check",
+                    self.env["ir.config_parameter"].sudo().get_param("wecom.api_base_url"),
+                ),
                 json={
                     "url": self.callback_url,
                     "token": self.callback_url_token,
@@ -124,12 +129,50 @@ class WeComAppCallbackService(models.Model):
     @api.model
     def create(self, vals):
         record = super(WeComAppCallbackService, self).create(vals)
+        self.clear_caches()
         record.validate_callback_config()
         return record
 
     def write(self, vals):
         result = super(WeComAppCallbackService, self).write(vals)
+        self.clear_caches()
         if 'callback_url' in vals or 'callback_url_token' in vals or 'callback_aeskey' in vals:
             for record in self:
                 record.validate_callback_config()
         return result
+
+    def unlink(self):
+        result = super(WeComAppCallbackService, self).unlink()
+        self.clear_caches()
+        return result
+
+    @api.model
+    @tools.ormcache("company_id", "code")
+    def _get_callback_context(self, company_id, code):
+        """
+        回调服务的解密上下文，按 (公司, 服务代码) 缓存，回调服务、公司的企业ID或通讯录应用变更时失效
+        :returns (服务ID, 是否启用, 应用名称, 服务名称, WecomMsgCrypt 对象)，找不到服务时返回 None
+        """
+        company = self.env["res.company"].sudo().browse(company_id).exists()
+        if not company:
+            return None
+        domain = [("code", "=", code), "|", ("active", "=", True), ("active", "=", False)]
+        if "contacts_app_id" in company._fields and company.contacts_app_id:
+            domain.append(("app_id", "=", company.contacts_app_id.id))
+        else:
+            domain.append(("app_id.company_id", "=", company.id))
+        service = self.sudo().search(domain, limit=1)
+        if not service:
+            return None
+        crypt = None
+        if service.active:
+            crypt = WecomMsgCrypt(
+                service.callback_url_token, service.callback_aeskey, company.corpid
+            )
+        return (
+            service.id,
+            service.active,
+            service.app_id.name,
+            service.name,
+            crypt,
+        )
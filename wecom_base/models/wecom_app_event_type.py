@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import re
 import logging
 from typing import Dict, Any, Optional
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError
-from odoo.tools.safe_eval import safe_eval
-from lxml import etree
+from odoo.tools.safe_eval import test_python_expr, test_expr, unsafe_eval, _SAFE_OPCODES, _BUILTINS
 from odoo.http import Response
-import xmltodict
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
 
 _logger = logging.getLogger(__name__)
 
+# 旧数据中只引用模型方法的代码，例如 "model.wecom_event_change_contact_user"，按原生处理方法调用
+METHOD_REFERENCE = re.compile(r"^\s*model\.([A-Za-z_]\w*)\s*(?:\(\s*command\s*\))?\s*$")
+
 class WeComAppEventType(models.Model):
     """
     企业微信应用事件类型管理
@@ -68,6 +71,13 @@ class WeComAppEventType(models.Model):
         help="处理此事件时要执行的Python代码"
     )
 
+    # 原生处理方法
+    handler = fields.Char(
+        string="Handler Method",
+        copy=False,
+        help="关联模型上的方法名称，以 model.<方法>(command) 直接调用，不经过 safe_eval；设置后忽略Python代码"
+    )
+
     # 命令
     command = fields.Char(
         string="Command",
@@ -75,78 +85,165 @@ class WeComAppEventType(models.Model):
         help="与事件关联的命令，如果适用"
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(WeComAppEventType, self).create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        result = super(WeComAppEventType, self).write(vals)
+        self.clear_caches()
+        return result
+
+    def unlink(self):
+        result = super(WeComAppEventType, self).unlink()
+        self.clear_caches()
+        return result
+
+    @api.model
+    @tools.ormcache()
+    def _get_dispatch_table(self) -> Dict[tuple, tuple]:
+        """
+        事件分发表，事件类型变更时失效
+        :returns {(消息类型, 事件代码, 变更类型): (ID, 名称, 模型, 原生处理方法, 预编译的代码, 命令)}
+        """
+        table = {}
+        for event in self.sudo().search([]):
+            key = (event.msg_type or "", event.event or "", event.change_type or "")
+            if key not in table:
+                table[key] = event._make_dispatch_entry()
+        return table
+
+    def _make_dispatch_entry(self) -> tuple:
+        """
+        解析目标模型，校验并预编译代码
+        """
+        self.ensure_one()
+        model_name = self.model_ids[:1].model
+        handler = self.handler
+        codeobj = None
+        if not handler and self.code:
+            reference = METHOD_REFERENCE.match(self.code)
+            if reference:
+                handler = reference.group(1)
+            else:
+                try:
+                    codeobj = test_expr(self.code, _SAFE_OPCODES, mode="exec")
+                except Exception as e:
+                    _logger.error(_("Invalid Python code in event [%s]: %s"), self.name, str(e))
+        if handler and (model_name not in self.env or not hasattr(self.env[model_name], handler)):
+            _logger.error(
+                _("Handler method [%s] of event [%s] not found on model [%s]"),
+                handler, self.name, model_name
+            )
+            handler = None
+        return (self.id, self.name, model_name, handler, codeobj, self.command)
+
     @api.model
-    def handle_event(self, xml_tree: str, company_id: int) -> Response:
+    def handle_event(self, xml_tree: Optional[str] = None, company_id: Any = None) -> Response:
         """
         处理来自企业微信的回调事件
-        :param xml_tree: XML格式的事件数据
-        :param company_id: 公司ID
+        :param xml_tree: XML格式的事件数据，默认读取上下文中的 xml_tree
+        :param company_id: 公司，默认读取上下文中的 company_id
         :return: HTTP响应
         """
+        if xml_tree is None:
+            xml_tree = self.env.context.get("xml_tree")
+        if company_id is None:
+            company_id = self.env.context.get("company_id")
         try:
-            # 解析XML数据
-            xml_dict = xmltodict.parse(xml_tree)
-            event_str = xml_dict['xml'].get('Event')
-            changetype_str = xml_dict['xml'].get('ChangeType')
+            self._process_event(xml_tree, company_id)
+        except Exception as e:
+            _logger.exception("Error processing WeChat Work event: %s", str(e))
+        return Response("success", status=200)
 
-            _logger.info(
-                _("Received callback notification from WeChat Work, event [%s], change type [%s]."),
-                event_str, changetype_str
-            )
+    @api.model
+    def _process_event(self, xml_tree: str, company_id: Any) -> None:
+        """
+        解析并执行回调事件，处理失败时抛出异常，供回调收件箱记录和重试
+        :param xml_tree: XML格式的事件数据
+        :param company_id: 公司
+        """
+        # 解析XML数据，解码结果通过上下文传给事件处理方法
+        event = WecomCallbackEvent(xml_tree)
+        event_str = event.event
+        changetype_str = event.change_type
 
-            # 查找对应的事件处理器
-            event = self.sudo().search([
-                ('event', '=', event_str),
-                ('change_type', '=', changetype_str)
-            ], limit=1)
+        _logger.info(
+            _("Received callback notification from WeChat Work, event [%s], change type [%s]."),
+            event_str, changetype_str
+        )
 
-            if not event:
-                _logger.warning(
-                    _("Cannot find event handler for event [%s] change type [%s], ignoring."),
-                    event_str, changetype_str
-                )
-                return Response("success", status=200)
+        # 通讯录变更，失效所有工作进程中对应的API响应缓存
+        if event_str == "change_contact" and company_id:
+            self.env["wecom.api.cache.generation"].sudo().invalidate_contact_event(
+                company_id.corpid, changetype_str, event.data
+            )
+
+        # 查找对应的事件处理器
+        entry = self._get_dispatch_table().get(
+            (event.msg_type or "", event_str or "", changetype_str or "")
+        )
 
-            # 如果找到事件处理器并且有代码，则执行
-            if event.code:
-                event.with_context(xml_tree=xml_tree, company_id=company_id).sudo().run()
+        if not entry:
+            _logger.warning(
+                _("Cannot find event handler for event [%s] change type [%s], ignoring."),
+                event_str, changetype_str
+            )
+            return
 
-            return Response("success", status=200)
+        self._dispatch(entry, event, company_id)
 
+    @api.model
+    def _dispatch(self, entry: tuple, event: WecomCallbackEvent, company_id: Any) -> None:
+        """
+        执行分发表中的处理器
+        :param entry: 见 _get_dispatch_table
+        :param event: 已解码的回调事件
+        """
+        name, model_name, handler, codeobj, command = entry[1:]
+        if not handler and codeobj is None:
+            return
+        env = self.sudo().with_context(
+            xml_tree=event.xml, callback_event=event, company_id=company_id
+        ).env
+        model = env[model_name] if model_name else None
+        try:
+            if handler:
+                getattr(model, handler)(command)
+            else:
+                # 代码已在构建分发表时校验并编译，这里直接执行，不再逐次检查
+                unsafe_eval(
+                    codeobj,
+                    {
+                        '__builtins__': _BUILTINS,
+                        'env': env,
+                        'model': model,
+                        'xml_tree': event.xml,
+                        'data': event.data,
+                        'company_id': company_id,
+                        'command': command,
+                        'log': lambda message, level='info': _logger.log(getattr(logging, level.upper()), message)
+                    },
+                )
         except Exception as e:
-            _logger.exception("Error processing WeChat Work event: %s", str(e))
-            return Response("success", status=200)
+            _logger.exception(_("Error executing code for event [%s]: %s"), name, str(e))
+            raise UserError(_("Error executing event code: %s") % str(e))
 
     def run(self) -> None:
         """
         执行与事件相关的代码
         """
         self.ensure_one()
-        xml_tree = self.env.context.get('xml_tree')
-        company_id = self.env.context.get('company_id')
-
-        if not self.code:
+        if not self.handler and not self.code:
             _logger.warning(_("No code defined for event [%s]"), self.name)
             return
-
-        try:
-            # 使用safe_eval执行代码，提供必要的上下文
-            safe_eval(
-                self.code,
-                {
-                    'env': self.env,
-                    'model': self.env[self.model_ids.model],
-                    'xml_tree': xml_tree,
-                    'company_id': company_id,
-                    'command': self.command,
-                    'log': lambda message, level='info': _logger.log(getattr(logging, level.upper()), message)
-                },
-                mode="exec",
-                nocopy=True
-            )
-        except Exception as e:
-            _logger.exception(_("Error executing code for event [%s]: %s"), self.name, str(e))
-            raise UserError(_("Error executing event code: %s") % str(e))
+        self._dispatch(
+            self._make_dispatch_entry(),
+            WecomCallbackEvent.from_context(self.env.context),
+            self.env.context.get('company_id'),
+        )
 
     @api.constrains('code')
     def _check_code(self):
@@ -155,7 +252,6 @@ class WeComAppEventType(models.Model):
         """
         for record in self:
             if record.code:
-                try:
-                    compile(record.code, "<string>", "exec")
-                except SyntaxError as e:
-                    raise UserError(_("Invalid Python code in event [%s]: %s") % (record.name, str(e)))
\ No newline at end of file
+                message = test_python_expr(expr=record.code, mode="exec")
+                if message:
+                    raise UserError(_("Invalid Python code in event [%s]: %s") % (record.name, message))
\ No newline at end of file
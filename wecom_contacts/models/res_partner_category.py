@@ -65,7 +65,7 @@ class PartnerCategory(models.Model):
             company = self.env.company
         if company.is_wecom_organization:
             try:
-                wxapi = self.env["wecom.service_api"].InitServiceApi(
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                     company.corpid, company.contacts_app_id.secret
                 )
                 response = wxapi.httpCall(
@@ -4,11 +4,10 @@ import logging
 import base64
 from pdb import _rstr
 import time
-from lxml import etree
 from odoo import api, fields, models, _
 
-import xmltodict
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException    # type: ignore
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
 
 _logger = logging.getLogger(__name__)
 
@@ -234,10 +233,8 @@ class Department(models.Model):
     # 企微通讯录事件
     # ------------------------------------------------------------
     def wecom_event_change_contact_party(self, cmd):
-        xml_tree = self.env.context.get("xml_tree")
         company_id = self.env.context.get("company_id")
-        xml_tree_str = etree.fromstring(bytes.decode(xml_tree))  # type: ignore
-        dic = lxml_to_dict(xml_tree_str)["xml"]  # type: ignore
+        dic = WecomCallbackEvent.from_context(self.env.context).data
         # print("department dic", dic)
 
         domain = [
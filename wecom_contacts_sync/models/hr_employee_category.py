@@ -3,13 +3,12 @@
 import logging
 import base64
 import time
-from lxml import etree
 from odoo import api, fields, models, _
 
 # from lxml_to_dict import lxml_to_dict
 # from xmltodict import lxml_to_dict
-import xmltodict
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException    # type: ignore
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
 
 _logger = logging.getLogger(__name__)
 
@@ -94,199 +93,66 @@ class EmployeeCategory(models.Model):
     def create_wecom_tag(self):
         """
         创建企微标签
+        写入发件箱，由定时任务发送，创建成功后回写 tagid
         """
         debug = self.env["ir.config_parameter"].sudo().get_param("wecom.debug_enabled")
-        company = self.company_id
-        if not company:
-            company = self.env.company
-
-        params = {}
-        try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
-                company.corpid, company.contacts_app_id.secret   # type: ignore
-            )
-            if self.tagid:
-                if debug:
-                    _logger.info(_("Update contacts tags: %s to WeCom") % self.name)
-                response = wxapi.httpCall(
-                    self.env["wecom.service_api_list"].get_server_api_call(
-                        "TAG_CREATE"
-                    ),
-                    {"tagid": self.tagid, "tagname": self.name},
-                )
-
-                message = _("Successfully updated tag.")
-            else:
-                if debug:
-                    _logger.info(_("Create contacts tags: %s to WeCom") % self.name)
-                response = wxapi.httpCall(
-                    self.env["wecom.service_api_list"].get_server_api_call(
-                        "TAG_CREATE"
-                    ),
-                    {"tagname": self.name},
-                )
-
-                self.write({"tagid": response["tagid"]})
-                message = _("Tag successfully created.")
-
-            if response["errcode"] == 0:
-                params = {
-                    "title": _("Success"),
-                    "message": message,
-                    "sticky": False,  # 延时关闭
-                    "className": "bg-success",
-                    "next": {
-                        "type": "ir.actions.client",
-                        "tag": "reload",
-                    },  # 刷新窗体
-                }
-                action = {
-                    "type": "ir.actions.client",
-                    "tag": "display_notification",
-                    "params": {
-                        "title": params["title"],
-                        "type": "success",
-                        "message": params["message"],
-                        "sticky": params["sticky"],
-                        "next": params["next"],
-                    },
-                }
-                return action
-        except ApiException as ex:
-            return self.env["wecomapi.tools.action"].ApiExceptionDialog(
-                ex, raise_exception=True
-            )
+        payload = {"tagname": self.name}
+        if self.tagid:
+            if debug:
+                _logger.info(_("Update contacts tags: %s to WeCom") % self.name)
+            payload["tagid"] = self.tagid
+            message = _("Tag update has been queued.")
+        else:
+            if debug:
+                _logger.info(_("Create contacts tags: %s to WeCom") % self.name)
+            message = _("Tag creation has been queued.")
+        if not self._has_pending_wecom_tag_create():
+            self._enqueue_wecom_tag("TAG_CREATE", payload)
+        return self._wecom_outbox_notification(message)
 
     def upload_wecom_tag(self):
         """
         上传企微标签
+        将创建/更新标签及同步成员写入发件箱，由定时任务合并后发送；
+        同步成员在发送时才读取远程成员并与本地比较，比较结果不会因排队而过期
         """
         debug = self.env["ir.config_parameter"].sudo().get_param("wecom.debug_enabled")
-        params = {}
-        try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
-                self.company_id.corpid, self.company_id.contacts_app_id.secret   # type: ignore
-            )
-            tagid = 0
-            # 创建标签和更新标签
-            if self.tagid:
-                tagid = self.tagid
-                # 更新标签
-                if debug:
-                    _logger.info(_("Update contacts tags: %s to WeCom") % self.name)
-                response = wxapi.httpCall(
-                    self.env["wecom.service_api_list"].get_server_api_call(
-                        "TAG_UPDATE"
-                    ),
-                    {"tagid": self.tagid, "tagname": self.name},
-                )
-
-                message = _("Successfully updated tag.")
-            else:
-                # 创建标签
-                if debug:
-                    _logger.info(_("Create contacts tags: %s to WeCom") % self.name)
-                if debug:
-                    _logger.info(_("Create contacts tags: %s to WeCom") % self.name)
-                response = wxapi.httpCall(
-                    self.env["wecom.service_api_list"].get_server_api_call(
-                        "TAG_CREATE"
-                    ),
-                    {"tagname": self.name},
-                )
-                tagid = response["tagid"]
-                message = _("Tag successfully created.")
-
-            if tagid:
-                # 比较本地和远程数据，增加和删除标签成员
-                add_tag_members, del_tag_members = self.upload_compare_data(
-                    wxapi, tagid
-                )
-
-                add_tag_members.update({"tagid": tagid})
-                del_tag_members.update({"tagid": tagid})
-
-                if (
-                    len(add_tag_members["userlist"]) > 0
-                    or len(add_tag_members["partylist"]) > 0
-                ):
-                    # 添加远程标签成员
-                    response = wxapi.httpCall(
-                        self.env["wecom.service_api_list"].get_server_api_call(
-                            "TAG_ADD_MEMBER"
-                        ),
-                        add_tag_members,
-                    )
-                if (
-                    len(del_tag_members["userlist"]) > 0
-                    or len(del_tag_members["partylist"]) > 0
-                ):
-                    # 删除远程标签尘缘
-                    response = wxapi.httpCall(
-                        self.env["wecom.service_api_list"].get_server_api_call(
-                            "TAG_DELETE_MEMBER"
-                        ),
-                        del_tag_members,
-                    )
-        except ApiException as ex:
-            error = self.env["wecom.service_api_error"].get_error_by_code(ex.errCode)
-            params.update(
-                {
-                    "title": _("Fail"),
-                    "message": _("API error: %s, error name: %s, error message: %s")
-                    % (str(ex.errCode), error["name"], ex.errMsg),
-                    "type": "warning",
-                    "sticky": True,
-                    "className": "bg-warning",
-                }
+        if self.tagid:
+            # 更新标签
+            if debug:
+                _logger.info(_("Update contacts tags: %s to WeCom") % self.name)
+            self._enqueue_wecom_tag(
+                "TAG_UPDATE", {"tagid": self.tagid, "tagname": self.name}
             )
+            message = _("Tag update has been queued.")
         else:
-            params.update(
-                {
-                    "title": _("Success"),
-                    "message": message,
-                    "type": "success",
-                    "sticky": False,  # 延时关闭
-                    "className": "bg-success",
-                }
-            )
-            print(tagid)
-            if response["errmsg"] == "created":
-                self.write({"tagid": tagid})
-                params.update(
-                    {
-                        "next": {
-                            "type": "ir.actions.client",
-                            "tag": "reload",
-                        },
-                    }  # 刷新窗体
-                )
-
-        finally:
-            action = {
-                "type": "ir.actions.client",
-                "tag": "display_notification",
-                "params": params,
-            }
-            return action
+            # 创建标签，tagid 在发送时由创建结果补全
+            if debug:
+                _logger.info(_("Create contacts tags: %s to WeCom") % self.name)
+            if not self._has_pending_wecom_tag_create():
+                self._enqueue_wecom_tag("TAG_CREATE", {"tagname": self.name})
+            message = _("Tag creation has been queued.")
+        self._enqueue_wecom_tag("TAG_SYNC_MEMBER", {"tagid": self.tagid})
+        return self._wecom_outbox_notification(message)
 
     def upload_compare_data(self, wxapi, tagid):
         """
         上传:比较本地和远程数据
         """
-        # 企业微信上的标签成员数据列表
-        response = wxapi.httpCall(
-            self.env["wecom.service_api_list"].get_server_api_call("TAG_GET_MEMBER"),
-            {"tagid": str(tagid)},
-        )
         remote_userlist = []
         remote_partylist = []
-        if response["errcode"] == 0:
-            for user in response["userlist"]:
-                remote_userlist.append(user["userid"].lower())
+        if tagid:
+            # 企业微信上的标签成员数据列表
+            response = wxapi.httpCall(
+                self.env["wecom.service_api_list"].get_server_api_call("TAG_GET_MEMBER"),
+                {"tagid": str(tagid)},
+            )
+            if response["errcode"] == 0:
+                for user in response["userlist"]:
+                    remote_userlist.append(user["userid"].lower())
 
-            for party in response["partylist"]:
-                remote_partylist.append(party)
+                for party in response["partylist"]:
+                    remote_partylist.append(party)
 
         # 本地数据列表
         local_userlist = []
@@ -328,7 +194,7 @@ class EmployeeCategory(models.Model):
         debug = self.env["ir.config_parameter"].sudo().get_param("wecom.debug_enabled")
         params = {}
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 self.company_id.corpid, self.company_id.contacts_app_id.secret   # type: ignore
             )
 
@@ -408,7 +274,7 @@ class EmployeeCategory(models.Model):
             company = self.env.company
         if company.is_wecom_organization:
             try:
-                wxapi = self.env["wecom.service_api"].InitServiceApi(
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                     company.corpid, company.contacts_app_id.secret
                 )
                 response = wxapi.httpCall(
@@ -582,77 +448,98 @@ class EmployeeCategory(models.Model):
     def delete_wecom_tag(self):
         """
         删除企微标签
+        写入发件箱，由定时任务发送，尚未发送的标签更新和成员变更随之取消
         """
         debug = self.env["ir.config_parameter"].sudo().get_param("wecom.debug_enabled")
+        if debug:
+            _logger.info(_("Delete contacts tags: %s to WeCom") % self.name)
+
+        self._enqueue_wecom_tag("TAG_DELETE", {"tagid": str(self.tagid)})
+        return self._wecom_outbox_notification(
+            _("Deletion of tag: %s has been queued.") % self.name
+        )
+
+    # ------------------------------------------------------------
+    # 发件箱
+    # ------------------------------------------------------------
+    def _enqueue_wecom_tag(self, function_name, payload):
+        """
+        将标签的写操作写入发件箱，同一标签的操作按顺序发送并合并
+        """
         company = self.company_id
         if not company:
             company = self.env.company
+        return self.env["wecom.api.outbox"].enqueue(
+            company.contacts_app_id,  # type: ignore
+            function_name,
+            payload,
+            merge_key="%s,%s" % (self._name, self.id),
+            record=self,
+        )
 
-        if debug:
-            _logger.info(_("Delete contacts tags: %s to WeCom") % self.name)
-
-        params = {}
-        try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
-                company.corpid, company.contacts_app_id.secret   # type: ignore
-            )
-            response = wxapi.httpCall(
-                self.env["wecom.service_api_list"].get_server_api_call("TAG_DELETE"),
-                {"tagid": str(self.tagid)},
+    def _has_pending_wecom_tag_create(self):
+        return bool(
+            self.env["wecom.api.outbox"].sudo().search_count(
+                [
+                    ("merge_key", "=", "%s,%s" % (self._name, self.id)),
+                    ("function_name", "=", "TAG_CREATE"),
+                    ("state", "=", "pending"),
+                ]
             )
+        )
 
-            if response["errcode"] == 0:
-                params = {
-                    "title": _("Success"),
-                    "type": "success",
-                    "message": _("Tag: %s deleted successfully.") % self.name,
-                    "sticky": False,  # 延时关闭
-                    "className": "bg-success",
-                    "next": {
-                        "type": "ir.actions.client",
-                        "tag": "reload",
-                    },  # 刷新窗体
-                }
-                tag = self.search(
-                    [("tagid", "=", self.tagid)],
-                    limit=1,
-                )
-                tag.write(   # type: ignore
-                    {
-                        "is_wecom_tag": False,
-                        "tagid": 0,
-                    }
-                )
-                # tag.unlink()
-            else:
-                params = {
-                    "title": _("Failed"),
-                    "type": "danger",
-                    "message": _("Tag: %s deletion failed.") % self.name,
-                    "sticky": False,  # 延时关闭
-                    "className": "bg-success",
-                    "next": {
-                        "type": "ir.actions.client",
-                        "tag": "reload",
-                    },  # 刷新窗体
-                }
-            action = {
-                "type": "ir.actions.client",
-                "tag": "display_notification",
-                "params": {
-                    "title": params["title"],
-                    "type": params["type"],
-                    "message": params["message"],
-                    "sticky": params["sticky"],
-                    "next": params["next"],
-                },
-            }
+    def _wecom_outbox_notification(self, message):
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Success"),
+                "type": "success",
+                "message": message,
+                "sticky": False,  # 延时关闭
+                "className": "bg-success",
+                "next": {
+                    "type": "ir.actions.client",
+                    "tag": "reload",
+                },  # 刷新窗体
+            },
+        }
 
-            return action
-        except ApiException as ex:
-            return self.env["wecomapi.tools.action"].ApiExceptionDialog(
-                ex, raise_exception=True
-            )
+    def _wecom_outbox_payload(self, function_name, payload):
+        """
+        发送前补全参数：创建标签后才入队的成员变更，使用创建结果中的 tagid
+        """
+        if function_name != "TAG_CREATE" and not int(payload.get("tagid") or 0) and self.tagid:
+            payload = dict(payload, tagid=self.tagid)
+        return payload
+
+    def _wecom_outbox_expand(self, wxapi, function_name, payload):
+        """
+        发件箱发送同步成员的意图时调用：读取远程成员，与本地成员比较后生成增删成员的请求
+        :returns [(函数名称, 请求参数)]
+        """
+        if function_name != "TAG_SYNC_MEMBER" or not int(payload.get("tagid") or 0):
+            return []
+        wxapi = wxapi.with_context(wecom_bypass_response_cache=True)
+        add_tag_members, del_tag_members = self.upload_compare_data(wxapi, payload["tagid"])
+        calls = []
+        for member_function, members in (
+            ("TAG_ADD_MEMBER", add_tag_members),
+            ("TAG_DELETE_MEMBER", del_tag_members),
+        ):
+            if members["userlist"] or members["partylist"]:
+                members.update({"tagid": payload["tagid"]})
+                calls.append((member_function, members))
+        return calls
+
+    def _wecom_outbox_done(self, function_name, payload, response):
+        """
+        发件箱发送成功后回写本地数据
+        """
+        if function_name == "TAG_CREATE" and response.get("tagid"):
+            self.write({"tagid": response["tagid"], "is_wecom_tag": True})
+        elif function_name == "TAG_DELETE" and str(self.tagid) == str(payload.get("tagid")):
+            self.write({"is_wecom_tag": False, "tagid": 0})
 
     # ------------------------------------------------------------
     # 企微通讯录事件
@@ -661,10 +548,8 @@ class EmployeeCategory(models.Model):
         """
         通讯录事件更新标签
         """
-        xml_tree = self.env.context.get("xml_tree")
         company_id = self.env.context.get("company_id")
-        xml_tree_str = etree.fromstring(bytes.decode(xml_tree))  # type: ignore
-        dic = lxml_to_dict(xml_tree_str)["xml"]  # type: ignore
+        dic = WecomCallbackEvent.from_context(self.env.context).data
 
         callback_tag = self.sudo().search(
             [("company_id", "=", company_id.id), ("tagid", "=", dic["TagId"])],
@@ -4,10 +4,9 @@ import logging
 import time
 from odoo import fields, models, api, Command, tools, _
 from odoo.exceptions import UserError
-from lxml import etree
 
-import xmltodict
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException    # type: ignore
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
 from odoo.addons.base.models.ir_mail_server import MailDeliveryException
 
 _logger = logging.getLogger(__name__)
@@ -194,7 +193,7 @@ class User(models.Model):
             company = self.env.company
         if company.is_wecom_organization:
             try:
-                wxapi = self.env["wecom.service_api"].InitServiceApi(
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                     company.corpid, company.contacts_app_id.secret
                 )
                 app_config = self.env["wecom.app_config"].sudo()
@@ -455,10 +454,8 @@ class User(models.Model):
         """
         通讯录事件变更系统用户
         """
-        xml_tree = self.env.context.get("xml_tree")
         company_id = self.env.context.get("company_id")
-        xml_tree_str = etree.fromstring(bytes.decode(xml_tree))  # type: ignore
-        dic = lxml_to_dict(xml_tree_str)["xml"]  # type: ignore
+        dic = WecomCallbackEvent.from_context(self.env.context).data
 
         domain = [
             "|",
@@ -533,7 +530,7 @@ class User(models.Model):
                 }
             )
             try:
-                wecomapi = self.env["wecom.service_api"].InitServiceApi(
+                wecomapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                     company_id.corpid, company_id.contacts_app_id.secret
                 )
                 response = wecomapi.httpCall(
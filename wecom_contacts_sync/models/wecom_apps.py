@@ -7,11 +7,9 @@ from odoo import _, api, fields, models
 from odoo.exceptions import UserError, ValidationError
 
 from io import StringIO
-import pandas as pd
+from odoo.addons.wecom_api.api.wecom_lazy import lazy_import  # type: ignore
 
-pd.set_option("max_colwidth", 4096)  # 设置最大列宽
-pd.set_option("display.max_columns", 30)  # 设置最大列数
-pd.set_option("expand_frame_repr", False)  # 当列太多时不换行
+pd = lazy_import("pandas")  # 仅在汇总同步结果时使用
 import time
 
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException    # type: ignore
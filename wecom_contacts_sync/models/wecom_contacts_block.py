@@ -41,23 +41,26 @@ class WxworkContactsBlock(models.Model):
     @api.depends("company_id", "wecom_userid")
     def _compute_name(self):
         for block in self:
-            if block.company_id and block.wecom_userid:  # type: ignore
-                company = block.company_id   # type: ignore
-                name = ""
-                try:
-                    wxapi = self.env["wecom.service_api"].InitServiceApi(
-                        company.corpid, company.contacts_app_id.secret
+            block.name = ""  # type: ignore
+        blocks = self.filtered(lambda b: b.company_id and b.wecom_userid)
+        for company in blocks.mapped("company_id"):
+            company_blocks = blocks.filtered(lambda b: b.company_id == company)
+            try:
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
+                    company.corpid, company.contacts_app_id.secret
+                )
+            except ApiException as ex:
+                return self.env["wecomapi.tools.action"].ApiExceptionDialog(
+                    ex, raise_exception=True
+                )
+            responses = wxapi.httpCallMany(
+                self.env["wecom.service_api_list"].get_server_api_call("USER_GET"),
+                [{"userid": block.wecom_userid} for block in company_blocks],  # type: ignore
+            )
+            for block, response in zip(company_blocks, responses):
+                if isinstance(response, ApiException):
+                    self.env["wecomapi.tools.action"].ApiExceptionDialog(
+                        response, raise_exception=True
                     )
-                    response = wxapi.httpCall(
-                        self.env["wecom.service_api_list"].get_server_api_call(
-                            "USER_GET"
-                        ),
-                        {"userid": block.wecom_userid},  # type: ignore
-                    )
-                    name = response["name"]
-                except ApiException as ex:
-                    return self.env["wecomapi.tools.action"].ApiExceptionDialog(
-                        ex, raise_exception=True
-                    )
-                finally:
-                    block.name = name    # type: ignore
+                else:
+                    block.name = response["name"]    # type: ignore
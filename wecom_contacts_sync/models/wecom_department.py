@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import json
 import time
 from odoo import fields, models, api, Command, tools, _
 from odoo.exceptions import UserError
-import xmltodict
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException    # type: ignore
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
+from odoo.addons.wecom_api.api.wecom_json import dumps_nested    # type: ignore
 from odoo.addons.base.models.ir_mail_server import MailDeliveryException
 
 _logger = logging.getLogger(__name__)
@@ -144,7 +144,7 @@ class WecomDepartment(models.Model):
         tasks = []
 
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_sync_app_id.secret
             ) # 使用自建应用
 
@@ -356,7 +356,7 @@ class WecomDepartment(models.Model):
         params = {}
         message = ""
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_app_id.secret   # type: ignore
             )
             response = wxapi.httpCall(
@@ -366,16 +366,7 @@ class WecomDepartment(models.Model):
                 {"id": str(self.department_id)},
             )
             department = response["department"]
-            for key in department.keys():
-                if type(department[key]) in (list, dict) and department[key]:
-                    json_str = json.dumps(
-                        department[key],
-                        sort_keys=False,
-                        indent=2,
-                        separators=(",", ":"),
-                        ensure_ascii=False,
-                    )
-                    department[key] = json_str
+            department = dumps_nested(department)
             self.sudo().write(
                 {
                     "name": department["name"],
@@ -443,9 +434,8 @@ class WecomDepartment(models.Model):
     # 企微通讯录事件
     # ------------------------------------------------------------
     def wecom_event_change_contact_party(self, cmd):
-        xml_tree = self.env.context.get("xml_tree")
         company_id = self.env.context.get("company_id")
-        department_dict = xmltodict.parse(xml_tree)["xml"]
+        department_dict = WecomCallbackEvent.from_context(self.env.context).data
 
         departments = self.sudo().search([("company_id", "=", company_id.id)])
         callback_department = departments.search(    # type: ignore
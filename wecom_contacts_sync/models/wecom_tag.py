@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import json
 import time
 from odoo import fields, models, api, Command, tools, _
 from odoo.exceptions import UserError
-import xmltodict
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException   # type: ignore
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
+from odoo.addons.wecom_api.api.wecom_json import dumps_nested, dumps_text, loads_field   # type: ignore
 from odoo.addons.base.models.ir_mail_server import MailDeliveryException
 
 _logger = logging.getLogger(__name__)
@@ -58,10 +58,10 @@ class WecomTag(models.Model):
     @api.depends("userlist")
     def _compute_user_ids(self):
         """
-        计算用户  eval( )
+        计算用户
         """
         for tag in self:
-            users = eval(tag.userlist) # type: ignore
+            users = loads_field(tag.userlist, []) # type: ignore
             user_ids = []
             for user in users:
                 user_id = self.env["wecom.user"].search(
@@ -74,10 +74,10 @@ class WecomTag(models.Model):
     @api.depends("partylist")
     def _compute_department_ids(self):
         """
-        计算部门  eval( )
+        计算部门
         """
         for tag in self:
-            departments = eval(tag.partylist) # type: ignore
+            departments = loads_field(tag.partylist, []) # type: ignore
             department_ids = []
             for department in departments:
                 department_id = self.env["wecom.department"].search(
@@ -103,7 +103,7 @@ class WecomTag(models.Model):
         tasks = []
 
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_sync_app_id.secret
             )
             response = wxapi.httpCall(
@@ -138,9 +138,25 @@ class WecomTag(models.Model):
             if response["errcode"] == 0:
                 wecom_tags = response["taglist"]  # 列表类型数据
 
+                # 并发获取所有标签的成员
+                try:
+                    member_wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
+                        company.corpid, company.contacts_app_id.secret
+                    )
+                    member_responses = member_wxapi.httpCallMany(
+                        self.env["wecom.service_api_list"].get_server_api_call(
+                            "TAG_GET_MEMBER"
+                        ),
+                        [{"tagid": str(wecom_tag["tagid"])} for wecom_tag in wecom_tags],
+                    )
+                except ApiException as ex:
+                    member_responses = [ex] * len(wecom_tags)
+
                 # 下载标签
-                for wecom_tag in wecom_tags:
-                    download_tag_result = self.download_tag(company, wecom_tag)
+                for wecom_tag, member_response in zip(wecom_tags, member_responses):
+                    download_tag_result = self.download_tag(
+                        company, wecom_tag, member_response
+                    )
                     if download_tag_result:
                         for r in download_tag_result:
                             tasks.append(r)  # 加入 下载标签失败结果
@@ -155,9 +171,10 @@ class WecomTag(models.Model):
         finally:
             return tasks  # 返回结果
 
-    def download_tag(self, company, wecom_tag):
+    def download_tag(self, company, wecom_tag, member_response=None):
         """
         下载标签
+        :param member_response: 已获取的标签成员结果（字典或 ApiException），为空时调用API获取
         """
         tag = self.sudo().search(
             [
@@ -168,16 +185,19 @@ class WecomTag(models.Model):
         )
         result = {}
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
-                company.corpid, company.contacts_app_id.secret
-            )
-
-            response = wxapi.httpCall(
-                self.env["wecom.service_api_list"].get_server_api_call(
-                    "TAG_GET_MEMBER"
-                ),
-                {"tagid": str(wecom_tag["tagid"])},
-            )
+            if member_response is None:
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
+                    company.corpid, company.contacts_app_id.secret
+                )
+                member_response = wxapi.httpCall(
+                    self.env["wecom.service_api_list"].get_server_api_call(
+                        "TAG_GET_MEMBER"
+                    ),
+                    {"tagid": str(wecom_tag["tagid"])},
+                )
+            if isinstance(member_response, ApiException):
+                raise member_response
+            response = member_response
             response["userlist"] = [user["userid"] for user in response["userlist"]]
             wecom_tag.update(
                 {
@@ -201,16 +221,7 @@ class WecomTag(models.Model):
             ) % (company.name, wecom_tag["tagid"], str(e))
             _logger.warning(result)
         else:
-            for key in wecom_tag.keys():
-                if type(wecom_tag[key]) in (list, dict) and wecom_tag[key]:
-                    json_str = json.dumps(
-                        wecom_tag[key],
-                        sort_keys=False,
-                        indent=2,
-                        separators=(",", ":"),
-                        ensure_ascii=False,
-                    )
-                    wecom_tag[key] = json_str
+            wecom_tag = dumps_nested(wecom_tag)
             if not tag:
                 result = self.create_tag(company, tag, wecom_tag,response)
             else:
@@ -285,7 +296,7 @@ class WecomTag(models.Model):
         params = {}
         message = ""
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_app_id.secret  # type: ignore
             )
             response = wxapi.httpCall(
@@ -296,16 +307,7 @@ class WecomTag(models.Model):
             )
 
             response["userlist"] = [user["userid"] for user in response["userlist"]]
-            for key in response.keys():
-                if type(response[key]) in (list, dict) and response[key]:
-                    json_str = json.dumps(
-                        response[key],
-                        sort_keys=False,
-                        indent=2,
-                        separators=(",", ":"),
-                        ensure_ascii=False,
-                    )
-                    response[key] = json_str
+            response = dumps_nested(response)
             self.write(
                 {
                     "tagname": response["tagname"],
@@ -372,9 +374,8 @@ class WecomTag(models.Model):
         """
         通讯录事件更新标签
         """
-        xml_tree = self.env.context.get("xml_tree")
         company_id = self.env.context.get("company_id")
-        tag_dict = xmltodict.parse(xml_tree)["xml"]
+        tag_dict = WecomCallbackEvent.from_context(self.env.context).data
 
         tags = self.sudo().search([("company_id", "=", company_id.id)])
         callback_tag = tags.search( # type: ignore
@@ -402,8 +403,8 @@ class WecomTag(models.Model):
                     update_dict.update({"del_departments": value})
 
         if callback_tag:
-            userlist = json.loads(callback_tag.userlist)    # type: ignore
-            partylist = json.loads(callback_tag.partylist)  # type: ignore
+            userlist = loads_field(callback_tag.userlist, [])    # type: ignore
+            partylist = loads_field(callback_tag.partylist, [])  # type: ignore
 
             if "add_users" in update_dict:
                 # 需要增加的成员
@@ -460,20 +461,8 @@ class WecomTag(models.Model):
 
             update_dict.update(
                 {
-                    "userlist": json.dumps(
-                        userlist,
-                        sort_keys=False,
-                        indent=2,
-                        separators=(",", ":"),
-                        ensure_ascii=False,
-                    ),
-                    "partylist": json.dumps(
-                        partylist,
-                        sort_keys=False,
-                        indent=2,
-                        separators=(",", ":"),
-                        ensure_ascii=False,
-                    ),
+                    "userlist": dumps_text(userlist),
+                    "partylist": dumps_text(partylist),
                 }
             )
 
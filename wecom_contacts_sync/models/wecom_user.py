@@ -2,13 +2,13 @@
 
 import re
 import logging
-import json
 from collections import defaultdict
 import time
 from odoo import fields, models, api, Command, tools, _
 from odoo.exceptions import UserError
-import xmltodict
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException   # type: ignore
+from odoo.addons.wecom_api.api.wecom_callback_event import WecomCallbackEvent  # type: ignore
+from odoo.addons.wecom_api.api.wecom_json import dumps_nested, loads_field   # type: ignore
 from odoo.addons.base.models.ir_mail_server import MailDeliveryException
 
 import re
@@ -101,10 +101,10 @@ class WecomUser(models.Model):
     @api.depends("department")
     def _compute_department_ids(self):
         """
-        计算多部门  eval( )
+        计算多部门
         """
         for user in self:
-            department_list = eval(user.department) # type: ignore
+            department_list = loads_field(user.department, []) # type: ignore
             department_ids = self.get_parent_department(
                 user.company_id, department_list    # type: ignore
             )
@@ -116,16 +116,8 @@ class WecomUser(models.Model):
         计算多部门的领导
         """
         for user in self:
-            department_list = user.department.strip('[')     # type: ignore
-            department_list = department_list.strip(']')    # type: ignore
-            if("," in department_list):
-                department_list = department_list.split(",")
-
-
-            leader_list = user.is_leader_in_dept.replace(" ","").strip('[')     # type: ignore
-            leader_list = leader_list.strip(']')
-            if("," in leader_list):
-                leader_list = leader_list.split(",")
+            department_list = loads_field(user.department, [])     # type: ignore
+            leader_list = [str(leader) for leader in loads_field(user.is_leader_in_dept, [])]     # type: ignore
 
             if user.isleader:   # type: ignore
                 department_leader = ""
@@ -133,7 +125,7 @@ class WecomUser(models.Model):
                     department_id = self.env["wecom.department"].search([("department_id", "=", int(department)),("company_id", "=", user.company_id.id),],limit=1,)   # type: ignore
 
                     is_leader = _("No")
-                    if leader_list[index] =="1":
+                    if index < len(leader_list) and leader_list[index] == "1":
                         is_leader = _("Yes")
                     department_leader_str = _("Department head [%s]: %s ;") % (department_id.name, is_leader)
                     # if len(department_list) > 1 and (index < len(department_list) -1) :
@@ -242,10 +234,24 @@ class WecomUser(models.Model):
             contacts_sync_hr_department_id = sync_hr_department_id
         tasks = []
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_sync_app_id.secret
             )
 
+            if contacts_sync_hr_department_id == "1":
+                # 同步整个企业时，按游标分页获取成员ID，逐页下载详情并提交
+                tasks = self.download_wecom_users_by_page(company, wxapi)
+                end_time = time.time()
+                tasks.append(
+                    {
+                        "name": "download_user_data",
+                        "state": True,
+                        "time": end_time - start_time,
+                        "msg": _("User list sync completed."),
+                    }
+                )
+                return tasks
+
             # ----------------------------------------------
             # 2023-8-24 使用自建应用获取成员列表
             # 参数：
@@ -288,33 +294,19 @@ class WecomUser(models.Model):
                 userlist = response["userlist"]
 
                 # 1.获取block, 生成 block_list
-                blocks = (
-                    self.env["wecom.contacts.block"]
-                    .sudo()
-                    .search([("company_id", "=", company.id),])
-                )
-
-                block_list = []
-                if len(blocks) > 0:
-                    for obj in blocks:
-                        if obj.wecom_userid != None:
-                            # block_list.append({"userid": obj.wecom_userid})
-                            block_list.append(obj.wecom_userid)
+                block_list = self._get_blocked_userids(company)
 
-                # 从user_list移除block
-                for b in block_list:
-                    for item in userlist:
-                        # userid不区分大小写
-                        if item["userid"].lower() == b.lower():
-                            userlist.remove(item)
+                # 从user_list移除block，userid不区分大小写
+                userlist = [
+                    item for item in userlist if item["userid"].lower() not in block_list
+                ]
 
                 # 2.下载用户
                 if userlist:
                     for wecom_user in userlist:
                         download_user_result = self.download_user(company, wecom_user)
                         if download_user_result:
-                            for r in download_user_result:
-                                tasks.append(r)  # 加入 下载员工失败结果
+                            tasks.append(download_user_result)  # 加入 下载员工失败结果
 
                 # 3.设置直属上级
 
@@ -332,6 +324,93 @@ class WecomUser(models.Model):
         finally:
             return tasks  # 返回结果
 
+    def _get_blocked_userids(self, company):
+        """
+        获取不需要同步的成员userid集合（小写）
+        """
+        blocks = (
+            self.env["wecom.contacts.block"]
+            .sudo()
+            .search([("company_id", "=", company.id),])
+        )
+        return {
+            block.wecom_userid.lower() for block in blocks if block.wecom_userid
+        }
+
+    def _iter_wecom_userid_pages(self, wxapi, limit):
+        """
+        按游标分页获取企业成员的userid，每次产出一页，不会一次性载入整个企业的成员
+        :param limit: 每页的成员数，企业微信限制为 1~10000
+        """
+        cursor = ""
+        while True:
+            args = {"limit": limit}
+            if cursor:
+                args["cursor"] = cursor
+            response = wxapi.httpCall(
+                self.env["wecom.service_api_list"].get_server_api_call("USER_LIST_ID"),
+                args,
+            )
+            userids = []
+            seen = set()
+            # 成员属于多个部门时会出现多次
+            for item in response.get("dept_user", []):
+                if item["userid"] not in seen:
+                    seen.add(item["userid"])
+                    userids.append(item["userid"])
+            if userids:
+                yield userids
+            cursor = response.get("next_cursor")
+            if not cursor:
+                break
+
+    def download_wecom_users_by_page(self, company, wxapi):
+        """
+        分页下载用户
+        每页的成员详情通过 USER_GET 分批并发获取，写入后立即提交并清空缓存，
+        内存占用与企业规模无关；失败时已提交的页不受影响。
+        :returns 下载失败的结果列表
+        """
+        ir_config = self.env["ir.config_parameter"].sudo()
+        page_size = int(ir_config.get_param("wecom.contacts_sync_page_size", 1000))
+        batch_size = int(ir_config.get_param("wecom.contacts_sync_batch_size", 100))
+        block_list = self._get_blocked_userids(company)
+        url_type = self.env["wecom.service_api_list"].get_server_api_call("USER_GET")
+
+        tasks = []
+        for userids in self._iter_wecom_userid_pages(wxapi, page_size):
+            userids = [userid for userid in userids if userid.lower() not in block_list]
+            for index in range(0, len(userids), batch_size):
+                batch = userids[index : index + batch_size]
+                responses = wxapi.httpCallMany(
+                    url_type, [{"userid": userid} for userid in batch]
+                )
+                for userid, wecom_user in zip(batch, responses):
+                    if isinstance(wecom_user, ApiException):
+                        result = _("Error getting user [%s], error reason: %s") % (
+                            userid,
+                            str(wecom_user),
+                        )
+                        _logger.warning(result)
+                        tasks.append(
+                            {"name": "get_user", "state": False, "time": 0, "msg": result}
+                        )
+                        continue
+                    download_user_result = self.download_user(company, wecom_user)
+                    if download_user_result:
+                        tasks.append(download_user_result)
+            self._commit_sync_page()
+        return tasks
+
+    def _commit_sync_page(self):
+        """
+        提交当前页并清空成员的 ORM 缓存，测试模式下不提交
+        wxapi 是内存中的新记录，其值保存在缓存中，不能清空整个环境的缓存
+        """
+        if not self.env.registry.in_test_mode():
+            self.env.cr.commit()
+        self.invalidate_model()
+
     def download_user(self, company, wecom_user):
         """
         下载用户
@@ -441,23 +520,14 @@ class WecomUser(models.Model):
         params = {}
         message = ""
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_app_id.secret  # type: ignore
             )
             response = wxapi.httpCall(
                 self.env["wecom.service_api_list"].get_server_api_call("USER_GET"),
                 {"userid": self.userid},
             )
-            for key in response.keys():
-                if type(response[key]) in (list, dict) and response[key]:
-                    json_str = json.dumps(
-                        response[key],
-                        sort_keys=False,
-                        indent=2,
-                        separators=(",", ":"),
-                        ensure_ascii=False,
-                    )
-                    response[key] = json_str
+            response = dumps_nested(response)
             self.write(
                 {
                     "name": response["name"],
@@ -527,26 +597,31 @@ class WecomUser(models.Model):
         """
         获取企微 open_userid
         """
-        for user in self:
+        for company in self.mapped("company_id"):
+            users = self.filtered(lambda u: u.company_id == company)
             try:
-                wxapi = self.env["wecom.service_api"].InitServiceApi(
-                    user.company_id.corpid, # type: ignore
-                    user.company_id.contacts_app_id.secret, # type: ignore
-                )
-                response = wxapi.httpCall(
-                    self.env["wecom.service_api_list"].get_server_api_call(
-                        "USERID_TO_OPENID"
-                    ),
-                    {
-                        "userid": user.userid,  # type: ignore
-                    },
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
+                    company.corpid, # type: ignore
+                    company.contacts_app_id.secret, # type: ignore
                 )
             except ApiException as ex:
                 self.env["wecomapi.tools.action"].ApiExceptionDialog(
                     ex, raise_exception=True
                 )
-            else:
-                user.open_userid = response["openid"]   # type: ignore
+                continue
+            responses = wxapi.httpCallMany(
+                self.env["wecom.service_api_list"].get_server_api_call(
+                    "USERID_TO_OPENID"
+                ),
+                [{"userid": user.userid} for user in users],  # type: ignore
+            )
+            for user, response in zip(users, responses):
+                if isinstance(response, ApiException):
+                    self.env["wecomapi.tools.action"].ApiExceptionDialog(
+                        response, raise_exception=True
+                    )
+                else:
+                    user.open_userid = response["openid"]   # type: ignore
 
     # ------------------------------------------------------------
     # 企微通讯录事件
@@ -555,9 +630,8 @@ class WecomUser(models.Model):
         """
         通讯录事件变更成员
         """
-        xml_tree = self.env.context.get("xml_tree")
         company_id = self.env.context.get("company_id")
-        user_dict = xmltodict.parse(xml_tree)["xml"]
+        user_dict = WecomCallbackEvent.from_context(self.env.context).data
         # print("wecom_event_change_contact_user", user_dict)
         domain = [
             "|",
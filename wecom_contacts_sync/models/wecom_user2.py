@@ -274,7 +274,7 @@ class WecomUser(models.Model):
             contacts_sync_hr_department_id = int(sync_hr_department_id)
 
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_sync_app_id.secret
             )
 
@@ -436,7 +436,7 @@ class WecomUser(models.Model):
         params = {}
         message = ""
         try:
-            wxapi = self.env["wecom.service_api"].InitServiceApi(
+            wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                 company.corpid, company.contacts_app_id.secret  # type: ignore
             )
             response = wxapi.httpCall(
@@ -534,7 +534,7 @@ class WecomUser(models.Model):
         """
         for user in self:
             try:
-                wxapi = self.env["wecom.service_api"].InitServiceApi(
+                wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                     user.company_id.corpid, # type: ignore
                     user.company_id.contacts_app_id.secret, # type: ignore
                 )
@@ -40,7 +40,7 @@ class EmployeeBindWecom(models.TransientModel):
             if employee.employee_id.company_id and employee.wecom_userid:   # type: ignore
                 company = employee.employee_id.company_id   # type: ignore
                 try:
-                    wxapi = self.env["wecom.service_api"].InitServiceApi(
+                    wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                         company.corpid, company.contacts_app_id.secret
                     )
                     response = wxapi.httpCall(
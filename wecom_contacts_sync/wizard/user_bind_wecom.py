@@ -38,7 +38,7 @@ class UserBindWecom(models.TransientModel):
             if user.company_id and user.wecom_userid:   # type: ignore
                 company = user.company_id   # type: ignore
                 try:
-                    wxapi = self.env["wecom.service_api"].InitServiceApi(
+                    wxapi = self.env["wecom.service_api"].with_context(wecom_bypass_response_cache=True).InitServiceApi(
                         company.corpid, company.contacts_app_id.secret
                     )
                     response = wxapi.httpCall(
@@ -4,11 +4,9 @@ import logging
 from odoo import api, models, fields, _
 from odoo.exceptions import UserError, Warning
 
-import pandas as pd
+from odoo.addons.wecom_api.api.wecom_lazy import lazy_import  # type: ignore
 
-pd.set_option("max_colwidth", 4096)  # 设置最大列宽
-pd.set_option("display.max_columns", 30)  # 设置最大列数
-pd.set_option("expand_frame_repr", False)  # 当列太多时不换行
+pd = lazy_import("pandas")  # 仅在汇总同步结果时使用
 import time
 
 _logger = logging.getLogger(__name__)
@@ -6,15 +6,18 @@ import platform
 import subprocess
 import logging
 import time
-from pydub import AudioSegment  # type: ignore
 from datetime import datetime, timedelta
 import pytz
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError, Warning
+from odoo.addons.wecom_api.api.wecom_lazy import lazy_import  # type: ignore
+
+pydub = lazy_import("pydub")  # 仅在转换语音格式时使用
 
 from odoo.addons.wecom_api.api.wecom_abstract_api import ApiException   # type: ignore
 
+from odoo.addons.wecom_api.api.wecom_upload import WecomUploadStream, WecomUploadError  # type: ignore
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
 
@@ -136,41 +139,14 @@ class WeComMaterial(models.Model):
 
         if self.media_file:
             # 存在媒体文件
-            sys_params = self.env["ir.config_parameter"].sudo()
             if self.company_id:
-                file_path = self._check_file_path(
-                    self.media_file, "material", self.media_filename
-                )
-
                 if self.temporary:
                     """
                     素材上传得到media_id，该media_id仅三天内有效
                     media_id在同一企业内应用之间可以共享
                     """
                     try:
-                        multipart_encoder = MultipartEncoder(
-                            fields={
-                                self.media_filename: (
-                                    "file",
-                                    open(file_path, "rb"),
-                                    "text/plain",
-                                )
-                            },
-                        )
-                        headers = {"Content-Type": multipart_encoder.content_type}
-                        wxapi = self.env["wecom.service_api"].InitServiceApi(
-                            self.company_id.corpid, # type: ignore
-                            self.company_id.material_app_id.secret, # type: ignore
-                        )
-                        response = wxapi.httpPostFile(
-                            self.env["wecom.service_api_list"].get_server_api_call(
-                                "MEDIA_UPLOAD"
-                            ),
-                            {"type": self.media_type},
-                            multipart_encoder,
-                            headers,
-                        )
-
+                        response = self._upload_media_stream("MEDIA_UPLOAD")
                         if response["errcode"] == 0:
                             self.media_id = response["media_id"]
                             timeStamp = int(response["created_at"])
@@ -179,8 +155,8 @@ class WeComMaterial(models.Model):
                                 "%Y-%m-%d %H:%M:%S", timeArray
                             )
                     except ApiException as ex:
-                        self.env["wecomapi.tools.action"].ApiExceptionDialog(
-                            ex, ex, raise_exception=True
+                        return self.env["wecomapi.tools.action"].ApiExceptionDialog(
+                            ex, raise_exception=True
                         )
                 else:
                     """
@@ -189,31 +165,7 @@ class WeComMaterial(models.Model):
                     每个企业每天最多可上传100张图片
                     """
                     try:
-                        wxapi = self.env["wecom.service_api"].InitServiceApi(
-                            self.company_id.corpid, # type: ignore
-                            self.company_id.material_app_id.secret, # type: ignore
-                        )
-                        # files = {"media": open(file_path, "rb")}
-                        multipart_encoder = MultipartEncoder(
-                            fields={
-                                self.media_filename: (
-                                    "file",
-                                    open(file_path, "rb"),
-                                    "text/plain",
-                                )
-                            },
-                        )
-                        headers = {"Content-Type": multipart_encoder.content_type}
-
-                        response = wxapi.httpPostFile(
-                            self.env["wecom.service_api_list"].get_server_api_call(
-                                "MEDIA_UPLOADIMG"
-                            ),
-                            {"type": self.media_type},
-                            multipart_encoder,
-                            headers,
-                        )
-
+                        response = self._upload_media_stream("MEDIA_UPLOADIMG")
                         if response["errcode"] == 0:
                             self.img_url = response["url"]
                             self.created_at = fields.Datetime.now()
@@ -226,6 +178,85 @@ class WeComMaterial(models.Model):
 
             return self
 
+    def _open_media_stream(self):
+        """
+        打开媒体文件的只读流
+        优先直接读取 ir.attachment 文件存储中的文件，不做 base64 解码，也不复制到临时目录；
+        附件存储在数据库中时，退回到读取附件内容
+        """
+        self.ensure_one()
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_id", "=", self.id),
+                    ("res_field", "=", "media_file"),
+                ],
+                limit=1,
+            )
+        )
+        if not attachment:
+            raise UserError(_("Please upload files!"))
+
+        options = {
+            "max_size": extensions_and_size[self.media_type]["size"][1],
+            "extension": os.path.splitext(self.media_filename or "")[1],
+        }
+        try:
+            if attachment.store_fname:
+                stream = WecomUploadStream.from_path(
+                    attachment._full_path(attachment.store_fname), **options
+                )
+            else:
+                stream = WecomUploadStream.from_bytes(attachment.raw, **options)
+        except WecomUploadError as e:
+            raise ValidationError(_("Invalid media file: %s") % e)
+        return stream, attachment.mimetype or "application/octet-stream"
+
+    def _upload_media_stream(self, function_name):
+        """
+        以流的方式上传媒体文件
+        MultipartEncoder 按块从文件存储读取，内存占用与文件大小无关；
+        MultipartEncoder 只能读取一次，每次发送（包括令牌过期和连接失败后的重试）都回到文件开头重新生成
+        """
+        stream, mimetype = self._open_media_stream()
+
+        def make_body():
+            stream.rewind()
+            multipart_encoder = MultipartEncoder(
+                fields={"media": (self.media_filename, stream, mimetype)},
+            )
+            return multipart_encoder, {"Content-Type": multipart_encoder.content_type}
+
+        with stream:
+            wxapi = self.env["wecom.service_api"].InitServiceApi(
+                self.company_id.corpid,  # type: ignore
+                self.company_id.material_app_id.secret,  # type: ignore
+            )
+            try:
+                response = wxapi.httpPostFile(
+                    self.env["wecom.service_api_list"].get_server_api_call(
+                        function_name
+                    ),
+                    {"type": self.media_type},
+                    make_body,
+                )
+            except ApiException as ex:
+                if isinstance(ex.errMsg, WecomUploadError):
+                    raise ValidationError(_("Invalid media file: %s") % ex.errMsg)
+                raise
+            except WecomUploadError as e:
+                raise ValidationError(_("Invalid media file: %s") % e)
+        _logger.info(
+            "Uploaded WeCom material [%s], %s bytes, md5 %s",
+            self.media_filename,
+            stream.bytes_read,
+            stream.hexdigest(),
+        )
+        return response
+
     @api.model
     def create(self, vals):
         if vals.get("media_type") and vals.get("media_file"):
@@ -389,7 +420,7 @@ class WeComMaterial(models.Model):
             os.path.abspath(filepath), mp3_audio_filepath
         )
         if os.path.exists(mp3_transformat_path):
-            mp3_audio = AudioSegment.from_file(
+            mp3_audio = pydub.AudioSegment.from_file(
                 os.path.abspath(mp3_transformat_path), format="mp3" # type: ignore
             )
             return mp3_audio.duration_seconds, mp3_transformat_path
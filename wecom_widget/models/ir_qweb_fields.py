@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import markdown
-
 from odoo import api, models, _
 
 
@@ -11,4 +9,6 @@ class MarkdownConverter(models.AbstractModel):
 
     @api.model
     def value_to_html(self, value, options):
+        import markdown  # 延迟导入，只有渲染 Markdown 字段时才需要
+
         return markdown.markdown(value)